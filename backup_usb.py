@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from ollama_downloader import planner
+from ollama_downloader.fastcopy import FileCopier
+
+# ─── CONFIGURATION ─────────────────────────────────────────────
+SOURCE_DIR = "/home/chunj/code/multisentimentarcs"
+DEST_DIR = "/mnt/usbssd/backup/multisentimentarcs"
+COPY_WORKERS = 8 # Requests kept in flight; USB SSDs (UAS) queue up to 32, and small files are mostly metadata latency
+MODIFY_WINDOW_SEC = 2 # exFAT/FAT keep coarse mtimes; a file within this of the copy's mtime and the same size is unchanged
+RESUME_MIN_MB = 64 # Larger files are checkpointed in the journal and resume mid-file
+CHECKPOINT_MB = 256 # Bytes between fsync + journal checkpoints of a large file
+JOURNAL_NAME = ".backup-journal.jsonl"
+PARTIAL_SUFFIX = ".backup-partial"
+
+SourceFile = namedtuple("SourceFile", "rel size mtime_ns mode")
+
+# ─── JOURNAL ───────────────────────────────────────────────────
+class Journal:
+    """
+    Append-only log in the destination of the large files being copied:
+    {"file", "size", "mtime_ns", "offset"} when a copy starts and at each
+    checkpoint (offset = bytes fsynced to the partial file), {"done"} when
+    it is renamed into place. After an interruption, a file whose source is
+    unchanged resumes from its last checkpoint instead of byte zero.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = {}    # rel -> (size, mtime_ns, offset)
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from the interruption
+                    if "done" in entry:
+                        self.pending.pop(entry["done"], None)
+                    elif "file" in entry:
+                        self.pending[entry["file"]] = (entry["size"], entry["mtime_ns"], entry["offset"])
+        except OSError:
+            pass
+        # Rewrite with just the unfinished entries, so the log doesn't grow across runs
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for rel, (size, mtime_ns, offset) in self.pending.items():
+                f.write(json.dumps({"file": rel, "size": size, "mtime_ns": mtime_ns, "offset": offset}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._f = open(path, 'a', encoding='utf-8')
+
+    def resume_offset(self, item):
+        """The checkpointed offset of an interrupted copy of this exact source file, else 0."""
+        size, mtime_ns, offset = self.pending.get(item.rel, (None, None, 0))
+        return offset if (size, mtime_ns) == (item.size, item.mtime_ns) else 0
+
+    def _append(self, entry, sync=False):
+        with self._lock:
+            self._f.write(json.dumps(entry) + "\n")
+            self._f.flush()
+            if sync:
+                os.fsync(self._f.fileno())
+
+    def checkpoint(self, item, offset):
+        self._append({"file": item.rel, "size": item.size, "mtime_ns": item.mtime_ns, "offset": offset}, sync=True)
+
+    def done(self, item):
+        self._append({"done": item.rel})
+
+    def close(self, remove=False):
+        self._f.close()
+        if remove:
+            os.remove(self.path)
+
+# ─── COPYING ───────────────────────────────────────────────────
+def scan(source, skip=None):
+    """Regular files under source (symlinks are not followed, `skip` is left out), in one pass."""
+    files, stack = [], [source]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path != skip:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append(SourceFile(os.path.relpath(entry.path, source), st.st_size, st.st_mtime_ns, st.st_mode))
+        except OSError as e:
+            print(f"⚠️ Cannot read {directory}: {e}")
+    return files
+
+def unchanged(item, dst):
+    try:
+        st = os.stat(dst)
+    except OSError:
+        return False
+    return st.st_size == item.size and abs(st.st_mtime_ns - item.mtime_ns) <= MODIFY_WINDOW_SEC * 1_000_000_000
+
+def copy_file(item, source, dest, copier, journal, on_progress):
+    """Copies one file through a hidden partial file in its destination directory and renames it into place."""
+    src = os.path.join(source, item.rel)
+    dst = os.path.join(dest, item.rel)
+    directory, name = os.path.split(dst)
+    partial = os.path.join(directory, f".{name}{PARTIAL_SUFFIX}")
+    os.makedirs(directory, exist_ok=True)
+    journaled = item.size >= RESUME_MIN_MB * 1024 * 1024
+    offset = journal.resume_offset(item) if journaled else 0
+    if offset:
+        try:
+            offset = min(offset, os.path.getsize(partial))
+            os.truncate(partial, offset)  # Anything past the checkpoint may not have reached the disk
+        except OSError:
+            offset = 0
+    if journaled:
+        journal.checkpoint(item, offset)
+
+    state = {"checkpoint": offset, "fd": None}
+
+    def checkpoint(position):
+        # position is what the copier has written to the partial file, so after the fsync it is on disk
+        if position - state["checkpoint"] < CHECKPOINT_MB * 1024 * 1024:
+            return
+        if state["fd"] is None:
+            state["fd"] = os.open(partial, os.O_RDONLY)
+        os.fsync(state["fd"])
+        journal.checkpoint(item, position)
+        state["checkpoint"] = position
+
+    try:
+        method = copier.copy(src, partial, resume=offset > 0, on_progress=on_progress,
+                             on_position=checkpoint if journaled else None)
+    finally:
+        if state["fd"] is not None:
+            os.close(state["fd"])
+    try:
+        os.chmod(partial, item.mode & 0o7777)
+    except OSError:
+        pass  # exFAT/FAT have no permission bits
+    os.utime(partial, ns=(item.mtime_ns, item.mtime_ns))
+    os.replace(partial, dst)
+    if journaled:
+        journal.done(item)
+    return method
+
+def main(source, dest, verbose=False):
+    started = time.monotonic()
+    source = os.path.abspath(source)
+    dest = os.path.abspath(dest)
+    if not os.path.isdir(source):
+        print(f"❌ Source {source} is not a directory.")
+        return 1
+    os.makedirs(dest, exist_ok=True)
+    print(f"🔍 Scanning {source}...")
+    files = scan(source, skip=dest)
+    total = sum(f.size for f in files)
+    print(f"✅ {len(files)} file(s), {planner.format_bytes(total)}.")
+
+    journal = Journal(os.path.join(dest, JOURNAL_NAME))
+    if journal.pending:
+        print(f"♻️ Resuming {len(journal.pending)} interrupted large file(s) from the journal.")
+    copier = FileCopier()
+    pbar = tqdm(total=total, desc="Backing up", unit='B', unit_scale=True)
+    lock = threading.Lock()
+    counts = {"copied": 0, "unchanged": 0, "copied_bytes": 0}
+    errors = {}
+
+    def run(item):
+        dst = os.path.join(dest, item.rel)
+        if unchanged(item, dst):
+            pbar.update(item.size)
+            with lock:
+                counts["unchanged"] += 1
+            return
+        try:
+            method = copy_file(item, source, dest, copier, journal, pbar.update)
+        except OSError as e:
+            with lock:
+                errors[item.rel] = str(e)
+            pbar.write(f"❌ {item.rel}: {e}")
+            return
+        with lock:
+            counts["copied"] += 1
+            counts["copied_bytes"] += item.size
+        if verbose:
+            pbar.write(f"[COPY] {item.rel} ({method})")
+
+    # Largest first, so big files overlap with the long tail of small ones instead of finishing alone
+    with ThreadPoolExecutor(max_workers=max(1, COPY_WORKERS)) as pool:
+        list(pool.map(run, sorted(files, key=lambda f: f.size, reverse=True)))
+    pbar.close()
+    print("💾 Flushing to the drive...")
+    os.sync()
+    journal.close(remove=not errors)
+
+    elapsed = time.monotonic() - started
+    methods = ", ".join(f"{method} {stats['files']}" for method, stats in copier.summary().items())
+    rate = counts["copied_bytes"] / max(elapsed, 1e-6) / 1e6
+    speed = f" ({rate:.0f} MB/s): {methods}" if counts["copied"] else ""
+    print(f"🏁 Copied {counts['copied']} file(s), {planner.format_bytes(counts['copied_bytes'])} "
+          f"in {elapsed:.1f}s{speed}; {counts['unchanged']} unchanged.")
+    if errors:
+        print(f"⚠️ {len(errors)} file(s) failed; run again to retry them.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up a directory tree to a USB drive: parallel kernel-side copies of new or changed files, resumable after an unplug.")
+    parser.add_argument("source", nargs="?", default=SOURCE_DIR, help="Directory to back up.")
+    parser.add_argument("dest", nargs="?", default=DEST_DIR, help="Backup directory (created if missing).")
+    parser.add_argument("--workers", type=int, default=COPY_WORKERS, help="Parallel copies.")
+    parser.add_argument("--modify-window", type=float, default=MODIFY_WINDOW_SEC, help="Seconds of mtime difference still treated as unchanged.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="List every copied file.")
+    args = parser.parse_args()
+
+    COPY_WORKERS = args.workers
+    MODIFY_WINDOW_SEC = args.modify_window
+    sys.exit(main(args.source, args.dest, verbose=args.verbose))
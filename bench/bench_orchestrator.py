@@ -0,0 +1,277 @@
+"""
+Replay benchmark for the pull orchestrator.
+
+Extracts the raw 'ollama pull' output recorded in ollama_log_*.txt, then
+drives PullOrchestrator against bench/fake_ollama.py, which replays those
+streams frame by frame at a configurable rate, write size and stall pattern.
+Each concurrency level runs in a fresh process so its peak RSS is its own,
+and reports:
+
+    cpu_ms_per_mb       orchestrator CPU (user + sys, children excluded) per reported MB
+    cpu_us_per_event    ... per parsed progress event
+    peak_rss_mb         ru_maxrss of the orchestrator process
+    latency_ms          frame written by the fake -> event handled by the orchestrator (p50/p95/p99/max)
+
+    python bench/bench_orchestrator.py --levels 1,2,4,8 --fps 500
+    python bench/bench_orchestrator.py --frame-bytes 7 --stall 0.5:2 --output bench/results.jsonl
+
+--output appends one JSON line per invocation (with the git revision), so
+results can be compared across versions.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ollama_downloader.progress import ProgressParser, LayerProgress
+from ollama_downloader.orchestrator import PullJob, PullOrchestrator
+from ollama_downloader.pulllog import PullLogWriter
+
+FAKE_OLLAMA = os.path.join(ROOT, "bench", "fake_ollama.py")
+DEFAULT_LOGS = os.path.join(ROOT, "ollama_log_*.txt")
+DEFAULT_LEVELS = "1,2,4,8"
+DEFAULT_FPS = 500
+DEFAULT_MAX_FRAMES = 2000
+DEFAULT_JOBS_PER_WORKER = 2
+
+LOG_LINE_RE = re.compile(rb"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\] ")
+START_RE = re.compile(rb"Starting download: (\S+)")
+FRAME_END = b"\x1b[?2026l"
+
+
+# ─── TRACES ────────────────────────────────────────────────────
+def extract_streams(log_paths):
+    """
+    [(model, raw pull output)] for every pull recorded in the given script logs.
+    Output before the first log line (captured with no script around it) is
+    named after the file.
+    """
+    streams = []
+    for path in log_paths:
+        with open(path, "rb") as f:
+            lines = f.read().splitlines(keepends=True)
+        model, chunks = os.path.basename(path), []
+        for line in lines + [b"[0000-00-00 00:00:00] end"]:
+            start = START_RE.search(line)
+            if start or LOG_LINE_RE.match(line):
+                if model is not None and chunks:
+                    streams.append((model, b"".join(chunks)))
+                model, chunks = (start.group(1).decode(errors="replace"), []) if start else (None, [])
+            elif model is not None:
+                chunks.append(line)
+    return streams
+
+
+def split_frames(stream, max_frames=None):
+    frames = [frame for frame in re.split(rb"(?<=" + re.escape(FRAME_END) + rb")", stream) if frame]
+    return frames[:max_frames] if max_frames else frames
+
+
+def frame_keys(frames):
+    """{'<digest>:<completed>': index of the frame that first produced that LayerProgress}."""
+    parser, keys = ProgressParser(), {}
+    for index, frame in enumerate(frames):
+        for event in parser.feed(frame):
+            if isinstance(event, LayerProgress):
+                keys.setdefault(f"{event.digest}:{event.completed}", index)
+    return keys
+
+
+def write_traces(log_paths, trace_dir, max_frames=DEFAULT_MAX_FRAMES):
+    """Writes every stream with layer progress as <n>.trace (NUL-separated frames) plus <n>.keys.json."""
+    written = []
+    for model, stream in extract_streams(log_paths):
+        frames = split_frames(stream, max_frames)
+        keys = frame_keys(frames)
+        if not keys:
+            continue  # Nothing but status lines (already installed, errors)
+        name = f"{len(written):03d}"
+        with open(os.path.join(trace_dir, name + ".trace"), "wb") as f:
+            f.write(b"\0".join(frames))
+        with open(os.path.join(trace_dir, name + ".keys.json"), "w") as f:
+            json.dump({"model": model, "frames": len(frames), "bytes": sum(map(len, frames)), "keys": keys}, f)
+        written.append((name, model, len(frames)))
+    return written
+
+
+# ─── ONE LEVEL ─────────────────────────────────────────────────
+class EventRecorder:
+    """pull_log stand-in: timestamps every LayerProgress and forwards events to a PullLogWriter."""
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.events = 0
+        self.received = []  # (model, key, monotonic time)
+
+    def record(self, model, event):
+        now = time.monotonic()
+        self.events += 1
+        if isinstance(event, LayerProgress):
+            self.received.append((model, f"{event.digest}:{event.completed}", now))
+        if self.writer is not None:
+            self.writer.record(model, event)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def event_latencies(recorder, trace_dir, marks_dir):
+    keys_by_trace, marks, latencies = {}, {}, []
+    for model, key, received in recorder.received:
+        if model not in marks:
+            with open(os.path.join(marks_dir, f"{model}.json")) as f:
+                marks[model] = json.load(f)
+        trace = marks[model]["trace"]
+        if trace not in keys_by_trace:
+            with open(os.path.join(trace_dir, trace.replace(".trace", ".keys.json"))) as f:
+                keys_by_trace[trace] = json.load(f)["keys"]
+        frame = keys_by_trace[trace].get(key)
+        if frame is not None:
+            latencies.append(received - marks[model]["frame_times"][frame])
+    return latencies
+
+
+def run_level(workers, args):
+    """Runs workers * jobs_per_worker replayed pulls with `workers` slots and returns the metrics."""
+    marks_dir = tempfile.mkdtemp(prefix="bench-marks-")
+    os.environ.update({
+        "BENCH_TRACE_DIR": args.trace_dir, "BENCH_FPS": str(args.fps), "BENCH_FRAME_BYTES": str(args.frame_bytes),
+        "BENCH_STALLS": ",".join(args.stall or []), "BENCH_MARKS_DIR": marks_dir,
+    })
+    writer = None
+    if args.pull_log:
+        writer = PullLogWriter(os.path.join(marks_dir, "pull.log"))
+    recorder = EventRecorder(writer)
+    orchestrator = PullOrchestrator(
+        {}, max_concurrent=workers, ollama_bin=FAKE_OLLAMA, stall_timeout=args.stall_timeout,
+        min_bytes_per_sec=0, log=lambda msg: None, pull_log=recorder)
+    count = workers * args.jobs_per_worker
+    jobs = [PullJob(f"bench-{i}", i + 1, count) for i in range(count)]
+
+    before, started = resource.getrusage(resource.RUSAGE_SELF), time.monotonic()
+    succeeded = asyncio.run(orchestrator.run(jobs))
+    wall = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    if writer is not None:
+        writer.close()
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    reported_mb = sum(job.bytes_done for job in jobs) / 1e6
+    latencies = event_latencies(recorder, args.trace_dir, marks_dir)
+    return {
+        "workers": workers, "jobs": count, "succeeded": len(succeeded),
+        "wall_sec": round(wall, 3), "cpu_sec": round(cpu, 3),
+        "reported_mb": round(reported_mb, 1), "events": recorder.events,
+        "cpu_ms_per_mb": round(cpu * 1000 / reported_mb, 4) if reported_mb else None,
+        "cpu_us_per_event": round(cpu * 1e6 / recorder.events, 1) if recorder.events else None,
+        "peak_rss_mb": round(after.ru_maxrss / 1024, 1),
+        "latency_ms": {
+            "samples": len(latencies),
+            "p50": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "max": round(max(latencies) * 1000, 3) if latencies else None,
+        },
+    }
+
+
+# ─── DRIVER ────────────────────────────────────────────────────
+def git_revision():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def level_argv(workers, args):
+    argv = [sys.executable, os.path.abspath(__file__), "--level", str(workers), "--trace-dir", args.trace_dir,
+            "--fps", str(args.fps), "--frame-bytes", str(args.frame_bytes), "--jobs-per-worker",
+            str(args.jobs_per_worker), "--stall-timeout", str(args.stall_timeout)]
+    for stall in args.stall or []:
+        argv += ["--stall", stall]
+    if not args.pull_log:
+        argv.append("--no-pull-log")
+    return argv
+
+
+def print_table(results):
+    print(f"{'workers':>7} {'jobs':>5} {'wall s':>8} {'cpu s':>7} {'cpu ms/MB':>10} {'us/event':>9} "
+          f"{'RSS MB':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['workers']:>7} {r['jobs']:>5} {r['wall_sec']:>8} {r['cpu_sec']:>7} {r['cpu_ms_per_mb'] or '-':>10} "
+              f"{r['cpu_us_per_event'] or '-':>9} {r['peak_rss_mb']:>7} {lat['p50'] if lat['p50'] is not None else '-':>8} "
+              f"{lat['p99'] if lat['p99'] is not None else '-':>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pull orchestrator by replaying recorded 'ollama pull' output.")
+    parser.add_argument("--logs", default=DEFAULT_LOGS, help="Glob of script logs holding recorded pull output.")
+    parser.add_argument("--levels", default=DEFAULT_LEVELS, help="Comma-separated concurrency levels to measure.")
+    parser.add_argument("--jobs-per-worker", type=int, default=DEFAULT_JOBS_PER_WORKER, help="Pulls queued per worker slot at each level.")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="Frames per second each fake pull replays (0 = unthrottled).")
+    parser.add_argument("--frame-bytes", type=int, default=0, help="Write frames in slices of this many bytes (0 = whole frames).")
+    parser.add_argument("--stall", action="append", metavar="FRACTION:SECONDS", help="Pause every replay this long at this point of its stream (repeatable).")
+    parser.add_argument("--max-frames", type=int, default=DEFAULT_MAX_FRAMES, help="Truncate each recorded stream to this many frames.")
+    parser.add_argument("--stall-timeout", type=float, default=600, help="Orchestrator stall timeout during the benchmark.")
+    parser.add_argument("--no-pull-log", dest="pull_log", action="store_false", help="Don't write parsed events to a PullLogWriter.")
+    parser.add_argument("--output", help="Append the results as one JSON line to this file.")
+    parser.add_argument("--json", action="store_true", help="Print the JSON record instead of a table.")
+    parser.add_argument("--level", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--trace-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.level:
+        sys.stderr = open(os.devnull, "w")  # Progress bars are part of the cost, not of the output
+        print(json.dumps(run_level(args.level, args)))
+        return 0
+
+    args.trace_dir = tempfile.mkdtemp(prefix="bench-traces-")
+    traces = write_traces(sorted(glob.glob(args.logs)), args.trace_dir, args.max_frames)
+    if not traces:
+        print(f"No pull output with layer progress found in {args.logs}", file=sys.stderr)
+        return 1
+    results = []
+    for workers in (int(level) for level in args.levels.split(",")):
+        proc = subprocess.run(level_argv(workers, args), capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"Level {workers} failed:\n{proc.stdout}{proc.stderr}", file=sys.stderr)
+            return 1
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(),
+        "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+        "config": {"fps": args.fps, "frame_bytes": args.frame_bytes, "stalls": args.stall or [],
+                   "jobs_per_worker": args.jobs_per_worker, "max_frames": args.max_frames, "pull_log": args.pull_log,
+                   "traces": len(traces), "frames": sum(frames for _, _, frames in traces)},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+    if args.json:
+        print(json.dumps(record, indent=2, sort_keys=True))
+    else:
+        print(f"{len(traces)} recorded pulls, {record['config']['frames']} frames, {args.fps} fps per pull")
+        print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Stand-in 'ollama' executable for the orchestrator benchmark.
+
+'fake_ollama.py pull bench-<i>' replays trace i (mod the number of traces)
+from $BENCH_TRACE_DIR, one recorded frame at a time:
+
+    BENCH_FPS           frames per second (0 = as fast as the pipe takes them)
+    BENCH_FRAME_BYTES   split each frame into writes of this many bytes (0 = whole frames)
+    BENCH_STALLS        'fraction:seconds,...' pauses, e.g. '0.5:3' stalls 3 s halfway through
+    BENCH_MARKS_DIR     where to dump the monotonic time each frame finished writing
+
+'fake_ollama.py list' prints an empty model list.
+"""
+import os
+import sys
+import json
+import time
+
+
+def trace_paths(trace_dir):
+    return sorted(os.path.join(trace_dir, name) for name in os.listdir(trace_dir) if name.endswith(".trace"))
+
+
+def parse_stalls(spec, frame_count):
+    """{frame index: seconds} from 'fraction:seconds,...'."""
+    stalls = {}
+    for item in filter(None, (spec or "").split(",")):
+        fraction, seconds = item.split(":")
+        stalls[min(frame_count - 1, int(float(fraction) * frame_count))] = float(seconds)
+    return stalls
+
+
+def replay(model, trace_dir, fps, frame_bytes, stalls_spec, marks_dir):
+    paths = trace_paths(trace_dir)
+    index = int(model.rsplit("-", 1)[-1].split(":")[0]) % len(paths)
+    with open(paths[index], "rb") as f:
+        frames = f.read().split(b"\0")
+    stalls = parse_stalls(stalls_spec, len(frames))
+    out = sys.stdout.buffer
+    interval = 1.0 / fps if fps else 0
+    next_at = time.monotonic()
+    frame_times = []
+    for number, frame in enumerate(frames):
+        if number in stalls:
+            time.sleep(stalls[number])
+            next_at = time.monotonic()
+        if interval:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_at += interval
+        if frame_bytes:
+            for offset in range(0, len(frame), frame_bytes):
+                out.write(frame[offset:offset + frame_bytes])
+                out.flush()
+        else:
+            out.write(frame)
+            out.flush()
+        frame_times.append(time.monotonic())
+    if marks_dir:
+        with open(os.path.join(marks_dir, f"{model}.json"), "w") as f:
+            json.dump({"trace": os.path.basename(paths[index]), "frame_times": frame_times}, f)
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == "list":
+        print("NAME    ID    SIZE    MODIFIED")
+        return 0
+    if len(argv) < 3 or argv[1] != "pull":
+        print("usage: fake_ollama.py pull bench-<i> | list", file=sys.stderr)
+        return 2
+    replay(argv[2], os.environ["BENCH_TRACE_DIR"], float(os.environ.get("BENCH_FPS", "0")),
+           int(os.environ.get("BENCH_FRAME_BYTES", "0")), os.environ.get("BENCH_STALLS"),
+           os.environ.get("BENCH_MARKS_DIR"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,66 @@
+import sys
+import signal
+import argparse
+from datetime import datetime
+
+from ollama_downloader import cacheproxy, planner, registry
+
+# ─── CONFIGURATION ─────────────────────────────────────────────
+CACHE_PATH = '/data/wdblue8tb/ollama-cache' # Blobs (by digest) and manifests, in the OLLAMA_MODELS layout
+CACHE_QUOTA_GB = cacheproxy.DEFAULT_QUOTA_GB # Least recently used blobs are evicted above this
+LISTEN_HOST = "0.0.0.0"
+LISTEN_PORT = cacheproxy.DEFAULT_PORT
+UPSTREAM_URL = registry.DEFAULT_REGISTRY
+FILL_CONNECTIONS = cacheproxy.DEFAULT_FILL_CONNECTIONS # Parallel range requests per blob fetched upstream
+FILL_CHUNK_MB = cacheproxy.DEFAULT_FILL_CHUNK_SIZE // (1024 * 1024)
+
+def log(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+def report(stats):
+    log(f"📊 {stats['hits']} blob hit(s), {stats['misses']} miss(es); "
+        f"{planner.format_bytes(stats['bytes_from_cache'])} served from cache, "
+        f"{planner.format_bytes(stats['bytes_streamed_while_filling'])} streamed while filling, "
+        f"{planner.format_bytes(stats['bytes_from_upstream'])} fetched upstream.")
+    log(f"📦 Cache: {stats['cached_blobs']} blob(s), {planner.format_bytes(stats['cached_bytes'])} of "
+        f"{planner.format_bytes(stats['quota_bytes'])}; {stats['evicted']} evicted ({planner.format_bytes(stats['evicted_bytes'])}).")
+    if stats['manifests_stale']:
+        log(f"⚠️ {stats['manifests_stale']} manifest request(s) answered from cache while upstream was unreachable.")
+
+def main():
+    proxy = cacheproxy.RegistryCacheProxy(
+        CACHE_PATH, quota_bytes=int(CACHE_QUOTA_GB * 1024 ** 3), upstream=UPSTREAM_URL, host=LISTEN_HOST,
+        port=LISTEN_PORT, connections=FILL_CONNECTIONS, chunk_size=FILL_CHUNK_MB * 1024 * 1024, log=log)
+    stats = proxy.summary()
+    log(f"🗄️ Caching {UPSTREAM_URL} in {CACHE_PATH}: {stats['cached_blobs']} blob(s), "
+        f"{planner.format_bytes(stats['cached_bytes'])} of {planner.format_bytes(stats['quota_bytes'])}.")
+    proxy.cache.make_room(0) # The quota may have been lowered since the last run
+    log(f"🚀 Listening on {LISTEN_HOST}:{proxy.server_address[1]}.")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.server_close()
+        report(proxy.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pull-through cache for the Ollama registry: point 'ollama pull --insecure' or --registry at it.")
+    parser.add_argument("--cache-path", default=CACHE_PATH, help="Directory for cached blobs and manifests (a big disk).")
+    parser.add_argument("--quota-gb", type=float, default=CACHE_QUOTA_GB, help="Evict least recently used blobs above this size.")
+    parser.add_argument("--listen", default=LISTEN_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=LISTEN_PORT, help="Port to listen on.")
+    parser.add_argument("--upstream", default=UPSTREAM_URL, help="Registry to fill the cache from.")
+    parser.add_argument("--connections", type=int, default=FILL_CONNECTIONS, help="Parallel range connections per blob fetched upstream.")
+    args = parser.parse_args()
+
+    CACHE_PATH = args.cache_path
+    CACHE_QUOTA_GB = args.quota_gb
+    LISTEN_HOST = args.listen
+    LISTEN_PORT = args.port
+    UPSTREAM_URL = args.upstream
+    FILL_CONNECTIONS = args.connections
+    sys.exit(main())
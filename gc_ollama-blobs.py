@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import argparse
+
+from tqdm import tqdm
+
+from ollama_downloader import blobgc, planner
+from ollama_downloader.digestcache import DigestCache, default_cache_path
+
+# ─── CONFIGURATION ─────────────────────────────────────────────
+OLLAMA_MODELS_PATH = '/data/wdblue8tb/ollama'
+MIN_AGE_HOURS = blobgc.DEFAULT_MIN_AGE_SEC // 3600 # Leave anything newer alone: a running pull writes blobs before its manifest
+DELETE_WORKERS = blobgc.DEFAULT_DELETE_WORKERS
+FLAG_PARTIALS = True # Also collect '-partial' download leftovers
+
+def report(garbage, recent, now):
+    """Prints unreferenced bytes by kind and age."""
+    for kind, label in (("orphan", "Unreferenced blobs"), ("partial", "Partial downloads"),
+                        ("corrupt", "Corrupt blobs set aside by --verify")):
+        files = [g for g in garbage if g.kind == kind]
+        print(f"🗑️ {label}: {len(files)} file(s), {planner.format_bytes(sum(g.size for g in files))}")
+        for bucket, count, size in blobgc.age_report(files, now):
+            if count:
+                print(f"     {bucket:<10} {count:>5} file(s)  {planner.format_bytes(size):>10}")
+    if recent:
+        print(f"⏳ Kept {len(recent)} file(s) ({planner.format_bytes(sum(g.size for g in recent))}) "
+              f"modified in the last {MIN_AGE_HOURS} h.")
+
+def main(models_path, assume_yes=False, dry_run=False, include_partials=FLAG_PARTIALS):
+    print(f"🔍 Marking blobs referenced by manifests in {models_path}...")
+    live, manifest_count, unreadable = blobgc.mark(models_path)
+    if unreadable:
+        for path in unreadable:
+            print(f"❌ Unreadable manifest: {path}")
+        print("🛑 Refusing to sweep while a manifest can't be read; its blobs would look unreferenced.")
+        return 1
+    print(f"✅ {manifest_count} manifests reference {len(live)} blobs.")
+
+    now = time.time()
+    garbage, recent = blobgc.find_garbage(models_path, live, min_age=MIN_AGE_HOURS * 3600, now=now)
+    if not include_partials:
+        garbage = [g for g in garbage if g.kind != "partial"]
+    report(garbage, recent, now)
+    total = sum(g.size for g in garbage)
+    if not garbage:
+        print("🏁 Nothing to collect.")
+        return 0
+    if dry_run:
+        print(f"🏁 Dry run: {planner.format_bytes(total)} could be reclaimed.")
+        return 0
+    if not assume_yes:
+        answer = input(f"Delete {len(garbage)} file(s), {planner.format_bytes(total)}? [y/N] ")
+        if answer.strip().lower() not in ("y", "yes"):
+            print("🏁 Nothing deleted.")
+            return 0
+
+    try:
+        garbage = blobgc.still_garbage(models_path, garbage)
+    except blobgc.GCError as e:
+        print(f"🛑 Manifests changed while waiting: {e}. Nothing deleted.")
+        return 1
+    pbar = tqdm(total=sum(g.size for g in garbage), desc="Deleting", unit='B', unit_scale=True)
+    deleted, freed, errors = blobgc.delete(garbage, workers=DELETE_WORKERS, on_deleted=lambda g: pbar.update(g.size))
+    pbar.close()
+    for path, error in errors.items():
+        print(f"⚠️ Could not delete {path}: {error}")
+    print(f"🏁 Deleted {deleted} file(s), reclaimed {planner.format_bytes(freed)}.")
+
+    cache_path = default_cache_path(models_path)
+    if os.path.exists(cache_path):
+        cache = DigestCache.load(cache_path)
+        if cache.prune(models_path):
+            cache.save()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete blobs no Ollama manifest references, and stale partial downloads, without the server.")
+    parser.add_argument("--models-path", default=OLLAMA_MODELS_PATH, help="Ollama model store (OLLAMA_MODELS).")
+    parser.add_argument("--min-age-hours", type=float, default=MIN_AGE_HOURS, help="Only collect files not modified for this many hours.")
+    parser.add_argument("--workers", type=int, default=DELETE_WORKERS, help="Parallel deletions.")
+    parser.add_argument("--keep-partials", action="store_true", help="Leave '-partial' download files alone.")
+    parser.add_argument("--dry-run", action="store_true", help="Report unreferenced bytes by age and exit.")
+    parser.add_argument("-y", "--yes", action="store_true", help="Delete without asking for confirmation.")
+    args = parser.parse_args()
+
+    MIN_AGE_HOURS = args.min_age_hours
+    DELETE_WORKERS = args.workers
+    sys.exit(main(args.models_path, assume_yes=args.yes, dry_run=args.dry_run,
+                  include_partials=FLAG_PARTIALS and not args.keep_partials))
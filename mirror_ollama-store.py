@@ -0,0 +1,88 @@
+import sys
+import time
+import argparse
+
+from tqdm import tqdm
+
+from ollama_downloader import mirror, planner
+from ollama_downloader.fastcopy import FileCopier
+
+# ─── CONFIGURATION ─────────────────────────────────────────────
+OLLAMA_MODELS_PATH = '/data/wdblue8tb/ollama'
+MIRROR_PATH = None # e.g. a second disk; required on the command line
+COPY_WORKERS = mirror.DEFAULT_COPY_WORKERS # Parallel blob copies; 1-2 for spinning disks, more for SSD/NVMe/NAS
+VERIFY_COPIES = False # Re-hash every copied blob before renaming it into place
+
+def main(source, target, dry_run=False, prune=False):
+    started = time.monotonic()
+    print(f"🔍 Comparing {source} with {target}...")
+    mirror_plan = mirror.plan(source, target)
+    if mirror_plan.unreadable:
+        for path in mirror_plan.unreadable:
+            print(f"❌ Unreadable manifest: {path}")
+        print("🛑 Refusing to mirror while a source manifest can't be read.")
+        return 1
+    for relpath in mirror_plan.missing_in_source:
+        print(f"⚠️ Skipping {relpath}: its blobs are incomplete in the source.")
+    to_copy = sum(mirror_plan.to_copy.values())
+    print(f"✅ {len(mirror_plan.manifests)} manifests, {len(mirror_plan.present)} blob(s) already mirrored, "
+          f"{len(mirror_plan.to_copy)} to copy ({planner.format_bytes(to_copy)}).")
+    if mirror_plan.extra_manifests:
+        action = "will be removed" if prune else "kept (use --prune to remove)"
+        print(f"🗂️ {len(mirror_plan.extra_manifests)} manifest(s) only in the mirror, {action}.")
+    if dry_run:
+        print("🏁 Dry run: nothing copied.")
+        return 0
+
+    copier = FileCopier()
+    pbar = tqdm(total=to_copy, desc="Copying", unit='B', unit_scale=True)
+
+    def on_copied(digest, method, error):
+        if error is not None:
+            pbar.write(f"❌ {digest}: {error}")
+
+    copied, errors = mirror.copy_blobs(mirror_plan, source, target, copier=copier, workers=COPY_WORKERS,
+                                       verify=VERIFY_COPIES, on_progress=pbar.update, on_copied=on_copied)
+    pbar.close()
+    written, unchanged, held_back = mirror.swap_manifests(mirror_plan, target, failed=errors)
+    for relpath in held_back:
+        print(f"⚠️ Kept the mirror's previous {relpath}: not all of its blobs were copied.")
+
+    elapsed = time.monotonic() - started
+    methods = ", ".join(f"{method} {stats['files']} ({planner.format_bytes(stats['bytes'])})"
+                        for method, stats in copier.summary().items())
+    copied_bytes = sum(mirror_plan.to_copy[d] for d in copied)
+    print(f"🏁 Copied {len(copied)} blob(s), {planner.format_bytes(copied_bytes)} in {elapsed:.1f}s"
+          + (f" ({copied_bytes / max(elapsed, 1e-6) / 1e6:.0f} MB/s): {methods}." if copied else "."))
+    print(f"🗂️ {len(written)} manifest(s) updated, {len(unchanged)} unchanged.")
+
+    if prune and not errors:
+        try:
+            removed, deleted, freed, prune_errors = mirror.prune(mirror_plan, target)
+        except mirror.MirrorError as e:
+            print(f"🛑 Not pruning: {e}.")
+            return 1
+        for path, error in prune_errors.items():
+            print(f"⚠️ Could not delete {path}: {error}")
+        print(f"🧹 Pruned {removed} manifest(s) and {deleted} blob(s), reclaimed {planner.format_bytes(freed)}.")
+        errors.update(prune_errors)
+    elif prune:
+        print("🛑 Not pruning after failed copies.")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mirror an Ollama model store to another disk, copying only blobs the mirror lacks.")
+    parser.add_argument("target", nargs="?", default=MIRROR_PATH, help="Mirror store (created if missing).")
+    parser.add_argument("--models-path", default=OLLAMA_MODELS_PATH, help="Source Ollama model store (OLLAMA_MODELS).")
+    parser.add_argument("--workers", type=int, default=COPY_WORKERS, help="Parallel blob copies.")
+    parser.add_argument("--verify", action="store_true", help="Re-hash each copied blob before it is renamed into place.")
+    parser.add_argument("--prune", action="store_true", help="Remove models the source no longer has, and their blobs.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be copied and exit.")
+    args = parser.parse_args()
+    if not args.target:
+        parser.error("a target store is required")
+
+    COPY_WORKERS = args.workers
+    VERIFY_COPIES = VERIFY_COPIES or args.verify
+    sys.exit(main(args.models_path, args.target, dry_run=args.dry_run, prune=args.prune))
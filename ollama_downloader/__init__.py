@@ -0,0 +1,6 @@
+"""
+Reusable pieces of the Ollama model downloader.
+
+The top-level pull_ollama-models.py script drives these modules; they do not
+read its configuration and take paths, clients and log callbacks as arguments.
+"""
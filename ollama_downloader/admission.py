@@ -0,0 +1,84 @@
+"""
+Disk-space admission control for the pull queue.
+
+Before a job starts, its remaining bytes (manifest layers whose blobs are not
+yet complete in <models>/blobs) are compared with the free space on the
+store's filesystem, less a fixed reserve and less what running jobs have
+reserved but not yet written. A job that only fails to fit because of those
+reservations is deferred (a running pull may fail and release its share, or
+land blobs the job needs too); one that is larger than the free space above
+the reserve is skipped instead of filling the disk halfway through a layer.
+"""
+import shutil
+
+from .planner import format_bytes
+
+DEFAULT_RESERVE_GB = 20
+
+ADMIT = "admit"
+DEFER = "defer"
+SKIP = "skip"
+
+
+def free_bytes(path):
+    """Bytes available to unprivileged writers on the filesystem holding `path`."""
+    return shutil.disk_usage(path).free
+
+
+class DiskAdmission:
+    """
+    Admits PullJobs against free space on `models_path`. With the run's
+    PullPlan and BlobIndex, a job's need is recomputed at admission time, so
+    blobs fetched by earlier pulls are no longer counted; otherwise the job's
+    size_bytes is used, and a job of unknown size only has to clear the reserve.
+    """
+
+    def __init__(self, models_path, reserve_bytes=DEFAULT_RESERVE_GB * 1024 ** 3, plan=None, blob_index=None,
+                 log=print):
+        self.models_path = models_path
+        self.reserve_bytes = reserve_bytes
+        self.plan = plan
+        self.blob_index = blob_index
+        self.log = log
+        self.deferrals = 0
+        self.skipped = {}      # model -> reason
+        self._deferred = set()  # models whose deferral has been logged
+
+    def needed_bytes(self, job):
+        if self.plan is not None and self.blob_index is not None and job.model_name in self.plan.manifests:
+            return sum(layer["size"] for layer in self.plan.model_layers(job.model_name)
+                       if not self.blob_index.has(layer["digest"], layer["size"]))
+        return job.size_bytes
+
+    @staticmethod
+    def outstanding(active_jobs):
+        """Space reserved by running jobs that they haven't written yet."""
+        return sum(max(0, job.reserved_bytes - (job.bytes_done - job.reserved_at)) for job in active_jobs)
+
+    def check(self, job, active_jobs):
+        """ADMIT (reserving the job's bytes), DEFER or SKIP."""
+        needed = self.needed_bytes(job) or 0
+        free = free_bytes(self.models_path)
+        reserved = self.outstanding(active_jobs)
+        available = free - self.reserve_bytes - reserved
+        if needed <= available:
+            job.reserved_bytes, job.reserved_at = needed, job.bytes_done
+            self._deferred.discard(job.model_name)
+            return ADMIT
+
+        if active_jobs and needed <= free - self.reserve_bytes:
+            if job.model_name not in self._deferred:
+                self._deferred.add(job.model_name)
+                self.deferrals += 1
+                self.log(f"💾 Deferring {job.model_name}: needs {format_bytes(needed)}, "
+                         f"{format_bytes(reserved)} of the free space is reserved by {len(active_jobs)} running pull(s).")
+            return DEFER
+        shortfall = (f"needs {format_bytes(needed)}, {format_bytes(max(0, free - self.reserve_bytes))} free above the "
+                     f"{format_bytes(self.reserve_bytes)} reserve")
+        self.skipped[job.model_name] = shortfall
+        self.log(f"💾 Skipping {job.model_name}: {shortfall}.")
+        return SKIP
+
+    def summary(self):
+        return {"reserve_bytes": self.reserve_bytes, "free_bytes": free_bytes(self.models_path),
+                "deferrals": self.deferrals, "skipped": dict(self.skipped)}
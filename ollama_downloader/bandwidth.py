@@ -0,0 +1,194 @@
+"""
+Run-wide bandwidth budget: a token bucket shared by every transfer, with a
+rate that follows a weekly schedule.
+
+Rules are written one per string:
+
+    "20"                        20 MB/s whenever no window matches (default: unlimited)
+    "08:00-19:00=20"            20 MB/s every day from 08:00 to 19:00
+    "mon-fri@08:00-19:00=20"    ... on weekdays only
+    "sat,sun@10:00-16:00=50"    days may be listed; windows may wrap midnight
+    "22:00-06:00=unlimited"     the first matching window wins
+
+The native engine's transfer threads call consume() for every block they
+read, so the aggregate rate of all concurrent pulls stays within the budget
+and changes in place when a window opens or closes: waiting threads sleep in
+short slices and pick up the new rate. The other engines download inside
+the Ollama server, where no budget can reach the transfer, so a schedule
+needs the native engine.
+"""
+import re
+import time
+import threading
+from datetime import datetime
+from collections import namedtuple
+
+MB = 1000 ** 2  # Same decimal MB as 'ollama pull' and --min-mbps
+BURST_SEC = 1.0
+MIN_BURST_BYTES = 1024 * 1024
+MAX_WAIT_SLICE_SEC = 0.25
+SCHEDULE_CHECK_SEC = 1.0
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+UNLIMITED = ("unlimited", "off", "none")
+
+RULE_RE = re.compile(r'^(?:(?P<days>[a-z,\-]+)@)?(?:(?P<start>\d{1,2}:\d{2})-(?P<end>\d{1,2}:\d{2})=)?(?P<rate>[\w.]+)$')
+
+BandwidthWindow = namedtuple("BandwidthWindow", "days start end rate rule")
+
+
+def parse_rate(text):
+    """MB/s as bytes/sec, or None for unlimited."""
+    if text.lower() in UNLIMITED:
+        return None
+    try:
+        rate = float(text)
+    except ValueError:
+        raise ValueError(f"Bad bandwidth '{text}' (MB/s or 'unlimited')") from None
+    if rate <= 0:
+        raise ValueError(f"Bandwidth must be positive, got '{text}'")
+    return rate * MB
+
+
+def parse_minutes(text):
+    hours, minutes = map(int, text.split(":"))
+    if hours > 24 or minutes > 59:
+        raise ValueError(f"Bad time of day '{text}'")
+    return hours * 60 + minutes
+
+
+def parse_days(text):
+    """'mon-fri' / 'sat,sun' / 'fri-mon' -> frozenset of weekday numbers (Monday = 0)."""
+    days = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        if first not in DAYS or (last and last not in DAYS):
+            raise ValueError(f"Bad day range '{part}' (use {', '.join(DAYS)})")
+        start = DAYS.index(first)
+        end = DAYS.index(last) if last else start
+        days.update((start + offset) % 7 for offset in range((end - start) % 7 + 1))
+    return frozenset(days)
+
+
+class BandwidthSchedule:
+    def __init__(self, windows=(), default_rate=None):
+        self.windows = list(windows)
+        self.default_rate = default_rate
+
+    @classmethod
+    def parse(cls, rules):
+        windows, default_rate = [], None
+        for rule in rules or ():
+            match = RULE_RE.match(rule.strip().lower())
+            if not match:
+                raise ValueError(f"Bad bandwidth rule '{rule}'")
+            rate = parse_rate(match["rate"])
+            if match["start"] is None:
+                if match["days"]:
+                    raise ValueError(f"Bandwidth rule '{rule}' names days but no time window")
+                default_rate = rate
+                continue
+            days = parse_days(match["days"]) if match["days"] else frozenset(range(7))
+            windows.append(BandwidthWindow(days, parse_minutes(match["start"]), parse_minutes(match["end"]), rate, rule))
+        return cls(windows, default_rate)
+
+    def window_at(self, when):
+        """The first window covering `when` (a datetime), or None."""
+        minute = when.hour * 60 + when.minute
+        weekday = when.weekday()
+        for window in self.windows:
+            if window.start <= window.end:
+                if weekday in window.days and window.start <= minute < window.end:
+                    return window
+            elif (weekday in window.days and minute >= window.start) or \
+                    ((weekday - 1) % 7 in window.days and minute < window.end):
+                return window  # Wraps midnight; the part after midnight belongs to the previous day
+        return None
+
+    def rate_at(self, when):
+        window = self.window_at(when)
+        return window.rate if window is not None else self.default_rate
+
+    def describe(self, when):
+        window = self.window_at(when)
+        rate = self.rate_at(when)
+        label = f"{rate / MB:g} MB/s" if rate else "unlimited"
+        return f"{label} ({window.rule})" if window is not None else label
+
+
+class BandwidthLimiter:
+    """Thread-safe token bucket whose rate follows a BandwidthSchedule."""
+
+    def __init__(self, schedule, log=print, clock=time.monotonic, now=datetime.now):
+        self.schedule = schedule
+        self.log = log
+        self._clock = clock
+        self._now = now
+        self._lock = threading.Lock()
+        self.rate = None
+        self.tokens = 0.0
+        self.bytes = 0
+        self.throttled_sec = 0.0      # Wall-clock time with at least one transfer held back
+        self.rate_changes = []
+        self._waiting = 0
+        self._throttled_since = None
+        self._refilled_at = clock()
+        self._checked_at = None
+        self._refresh(force=True)
+
+    @property
+    def limited(self):
+        return bool(self.schedule.windows) or self.schedule.default_rate is not None
+
+    def _burst(self):
+        return max(MIN_BURST_BYTES, self.rate * BURST_SEC)
+
+    def _refresh(self, force=False):
+        """Re-reads the schedule at most every SCHEDULE_CHECK_SEC and refills the bucket. Call with the lock held."""
+        now = self._clock()
+        if force or self._checked_at is None or now - self._checked_at >= SCHEDULE_CHECK_SEC:
+            self._checked_at = now
+            rate = self.schedule.rate_at(self._now())
+            if rate != self.rate or force:
+                if not force:
+                    self.log(f"🚦 Bandwidth now {self.schedule.describe(self._now())}.")
+                    self.rate_changes.append({"at": self._now().isoformat(timespec="seconds"), "rate_mb_per_sec":
+                                              round(rate / MB, 1) if rate else None})
+                self.rate = rate
+                if rate is None:
+                    self.tokens = 0.0
+                else:
+                    self.tokens = min(self.tokens, self._burst())
+        if self.rate is not None:
+            self.tokens = min(self._burst(), self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def consume(self, nbytes):
+        """Takes nbytes from the bucket, sleeping (in short slices, so rate changes apply) while it is in deficit."""
+        with self._lock:
+            self._refresh()
+            self.bytes += nbytes
+            if self.rate is None:
+                return
+            self.tokens -= nbytes
+            if self.tokens >= 0:
+                return
+            self._waiting += 1
+            if self._waiting == 1:
+                self._throttled_since = self._clock()
+        try:
+            while True:
+                with self._lock:
+                    self._refresh()
+                    if self.rate is None or self.tokens >= 0:
+                        return
+                    wait = min(MAX_WAIT_SLICE_SEC, -self.tokens / self.rate)
+                time.sleep(wait)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                if not self._waiting:
+                    self.throttled_sec += self._clock() - self._throttled_since
+
+    def stats(self):
+        return {"bytes": self.bytes, "throttled_sec": round(self.throttled_sec, 1),
+                "current": self.schedule.describe(self._now()), "rate_changes": list(self.rate_changes)}
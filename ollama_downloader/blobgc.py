@@ -0,0 +1,137 @@
+"""
+Mark-and-sweep garbage collection for <models>/blobs.
+
+mark() walks every manifest under <models>/manifests and collects the
+digests they reference (config included). find_garbage() lists what is left
+in blobs/: complete 'sha256-*' blobs no manifest references, the
+'-partial' files and range journals that failed, timed-out or superseded
+pulls leave behind, and the '.corrupt' blobs --verify set aside. Files modified within `min_age` seconds are kept, since a
+running pull writes its blobs before its manifest. delete() removes the
+garbage on a thread pool. Nothing here talks to the server.
+"""
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from . import store
+
+DEFAULT_MIN_AGE_SEC = 24 * 3600
+DEFAULT_DELETE_WORKERS = 8
+AGE_BUCKETS = ((1, "< 1 day"), (7, "1-7 days"), (30, "7-30 days"), (None, "> 30 days"))
+
+GarbageFile = namedtuple("GarbageFile", "path name kind size mtime")
+
+
+class GCError(Exception):
+    pass
+
+
+def mark(models_path):
+    """
+    Returns (live_digests, manifest_count, unreadable_paths). A manifest that
+    can't be parsed may still own blobs, so callers must not sweep while
+    `unreadable_paths` is non-empty.
+    """
+    live, count, unreadable = set(), 0, []
+    for dirpath, dirnames, filenames in os.walk(store.manifests_dir(models_path)):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.startswith('.'):
+                continue  # write_file_atomic temp files
+            path = os.path.join(dirpath, name)
+            manifest = store.read_manifest(path)
+            if not isinstance(manifest, dict):
+                unreadable.append(path)
+                continue
+            count += 1
+            live.update(layer["digest"] for layer in store.manifest_layers(manifest) if layer.get("digest"))
+    return live, count, unreadable
+
+
+def classify(filename, live):
+    """'orphan', 'partial', 'corrupt' or None (referenced blob, or not a file this collects)."""
+    if not filename.startswith("sha256-"):
+        return None
+    if store.PARTIAL_SUFFIX in filename:
+        return "partial"
+    if filename.endswith(store.CORRUPT_SUFFIX):
+        return "corrupt"
+    digest = store.digest_from_filename(filename)
+    if digest is not None and digest not in live:
+        return "orphan"
+    return None
+
+
+def find_garbage(models_path, live, min_age=DEFAULT_MIN_AGE_SEC, now=None):
+    """Unreferenced blobs and download leftovers older than min_age, as (garbage, recent) lists."""
+    now = now or time.time()
+    garbage, recent = [], []
+    try:
+        with os.scandir(store.blobs_dir(models_path)) as entries:
+            for entry in entries:
+                kind = classify(entry.name, live)
+                if kind is None or not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                item = GarbageFile(entry.path, entry.name, kind, st.st_size, st.st_mtime)
+                (garbage if now - st.st_mtime >= min_age else recent).append(item)
+    except FileNotFoundError:
+        pass
+    return garbage, recent
+
+
+def age_report(files, now=None):
+    """[(label, count, bytes)] per AGE_BUCKETS bucket, by modification time."""
+    now = now or time.time()
+    rows = [[label, 0, 0] for _, label in AGE_BUCKETS]
+    for item in files:
+        age_days = (now - item.mtime) / 86400
+        for row, (limit, _) in zip(rows, AGE_BUCKETS):
+            if limit is None or age_days < limit:
+                row[1] += 1
+                row[2] += item.size
+                break
+    return [tuple(row) for row in rows]
+
+
+def still_garbage(models_path, files):
+    """
+    Re-marks just before deleting: drops files that a manifest written since
+    the first mark now references, or that changed since they were listed.
+    """
+    live, _, unreadable = mark(models_path)
+    if unreadable:
+        raise GCError(f"{len(unreadable)} unreadable manifest(s), e.g. {unreadable[0]}")
+    keep = []
+    for item in files:
+        try:
+            st = os.stat(item.path)
+        except FileNotFoundError:
+            continue
+        if st.st_mtime == item.mtime and classify(item.name, live) is not None:
+            keep.append(item)
+    return keep
+
+
+def delete(files, workers=DEFAULT_DELETE_WORKERS, on_deleted=None):
+    """Unlinks files in parallel. Returns (deleted_count, freed_bytes, {path: error})."""
+    deleted, freed, errors = 0, 0, {}
+
+    def remove(item):
+        try:
+            os.remove(item.path)
+            return item, None
+        except OSError as e:
+            return item, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for item, error in pool.map(remove, files):
+            if error is None:
+                deleted += 1
+                freed += item.size
+            else:
+                errors[item.path] = error
+            if on_deleted is not None:
+                on_deleted(item)
+    return deleted, freed, errors
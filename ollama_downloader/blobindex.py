@@ -0,0 +1,84 @@
+"""
+In-memory index of blob sizes in <models>/blobs.
+
+Built with a single directory scan per run and then kept current from the
+layer lists of manifests as models finish, so per-model size accounting
+costs a handful of stat() calls instead of a rescan of the whole store.
+"""
+import os
+import threading
+
+from . import store
+
+
+class BlobIndex:
+    def __init__(self, models_path):
+        self.models_path = models_path
+        self.sizes = {}   # digest -> size of the complete blob on disk
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, models_path):
+        index = cls(models_path)
+        try:
+            with os.scandir(store.blobs_dir(models_path)) as entries:
+                for entry in entries:
+                    digest = store.digest_from_filename(entry.name)
+                    if digest and entry.is_file():
+                        index.sizes[digest] = entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        return index
+
+    def has(self, digest, size=None):
+        with self._lock:
+            actual = self.sizes.get(digest)
+        return actual is not None and (size is None or actual == size)
+
+    def snapshot(self):
+        """The set of digests present right now, to diff against after a pull."""
+        with self._lock:
+            return frozenset(self.sizes)
+
+    def add(self, digest, size):
+        with self._lock:
+            self.sizes[digest] = size
+
+    def refresh_layers(self, layers):
+        """Stats just the given layers' blobs and updates the index with what is on disk."""
+        for layer in layers:
+            path = store.blob_path(self.models_path, layer["digest"])
+            try:
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                with self._lock:
+                    self.sizes.pop(layer["digest"], None)
+                continue
+            self.add(layer["digest"], size)
+
+    def account_model(self, layers, present_before):
+        """
+        Refreshes a finished model's layers and splits its size into bytes that
+        were already on disk when the pull started and bytes newly downloaded.
+        """
+        self.refresh_layers(layers)
+        size = sum(layer["size"] for layer in layers)
+        reused = sum(layer["size"] for layer in layers if layer["digest"] in present_before)
+        return {
+            "model_size_bytes": size,
+            "model_size_gb": round(size / (1024 ** 3), 2),
+            "bytes_downloaded": size - reused,
+            "bytes_reused": reused,
+        }
+
+    def account_installed_model(self, model_name, present_before):
+        """account_model() for a model whose manifest is already written to the store, or None."""
+        manifest = store.read_manifest(store.manifest_path(self.models_path, model_name))
+        if manifest is None:
+            return None
+        return self.account_model(store.manifest_layers(manifest), present_before)
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(self.sizes.values())
@@ -0,0 +1,119 @@
+"""
+Read-only HTTP server for the blobs of a local model store.
+
+Peers on the LAN fetch layers from it with the same client and URL layout
+they use for the registry (GET/HEAD /v2/<namespace>/<model>/blobs/<digest>,
+with single byte ranges), so ranged parallel transfers, resume and digest
+verification work unchanged. Only complete blobs are served: '-partial'
+files are never addressable, and the digest in the path must be a full
+sha256 so nothing outside <models>/blobs can be named. File bodies go out
+with sendfile(), without passing through Python buffers.
+"""
+import os
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from . import store
+
+DEFAULT_SHARE_PORT = 11435
+BLOB_PATH_RE = re.compile(r'^/v2/.+/blobs/(sha256:[0-9a-f]{64})$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None for the whole file, or ValueError if unsatisfiable."""
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or not (match[1] or match[2]):
+        return None  # Multiple or malformed ranges: send the whole blob, as RFC 9110 allows
+    if match[1]:
+        start = int(match[1])
+        end = min(int(match[2]), size - 1) if match[2] else size - 1
+    else:
+        start, end = max(0, size - int(match[2])), size - 1  # Suffix range: the last N bytes
+    if start > end or start >= size:
+        raise ValueError(f"range {header} outside {size} bytes")
+    return start, end
+
+
+class BlobRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so peers' pooled connections are reused
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body):
+        match = BLOB_PATH_RE.match(self.path.split('?', 1)[0])
+        path = store.blob_path(self.server.models_path, match[1]) if match else None
+        try:
+            f = open(path, 'rb') if path else None
+        except OSError:
+            f = None
+        if f is None:
+            self._send_empty(404)
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            try:
+                byte_range = parse_range(self.headers.get('Range'), size)
+            except ValueError:
+                self._send_empty(416, {'Content-Range': f"bytes */{size}"})
+                return
+            start, end = byte_range or (0, size - 1)
+            length = max(0, end - start + 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            if byte_range:
+                self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if body and length:
+                self.wfile.flush()
+                sent = self.connection.sendfile(f, start, length)
+                with self.server.stats_lock:
+                    self.server.bytes_served += sent
+                if sent < length:
+                    self.close_connection = True
+
+    def _send_empty(self, code, headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # Peers pull thousands of ranges; the client side logs what matters
+
+
+class BlobServer(ThreadingHTTPServer):
+    """Serves <models_path>/blobs on (host, port) from a daemon thread; port 0 picks a free one."""
+    daemon_threads = True
+
+    def __init__(self, models_path, host="0.0.0.0", port=DEFAULT_SHARE_PORT):
+        super().__init__((host, port), BlobRequestHandler)
+        self.models_path = models_path
+        self.bytes_served = 0
+        self.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="blob-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
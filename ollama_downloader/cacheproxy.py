@@ -0,0 +1,443 @@
+"""
+Pull-through cache for the Ollama registry.
+
+Speaks the read side of the registry API (GET/HEAD /v2/, manifests and
+blobs) so 'ollama pull --insecure <proxy>/library/<model>' and the native
+engine (--registry http://<proxy>) can use it in place of the registry.
+Manifests are always re-resolved upstream by tag, so tags stay current; the
+cached copy is only served when the upstream can't be reached. A manifest
+requested by digest is immutable: it is cached under that digest and served
+from there once verified. Blobs are content
+addressed and immutable, so a cached blob is served straight from disk,
+with byte ranges, via sendfile().
+
+A missing blob is fetched once, however many clients ask for it at the
+same time: a BlobFill downloads it with the registry client's parallel
+ranged transfer into the cache's '-partial' file, and every reader streams
+each chunk as far as it has been written, so the first pull runs at
+upstream speed rather than waiting for the whole layer. The digest is verified
+before the blob joins the cache. Cached blobs are evicted least recently
+used first to stay under the size quota. The file mtime records recency,
+so the order survives restarts.
+"""
+import os
+import re
+import time
+import json
+import hashlib
+import threading
+import http.client
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from . import store
+from .registry import RegistryClient, RegistryError, DEFAULT_REGISTRY
+from .blobserver import parse_range
+from .planner import format_bytes
+
+DEFAULT_PORT = 5000
+DEFAULT_QUOTA_GB = 500
+DEFAULT_FILL_CONNECTIONS = 8
+DEFAULT_FILL_CHUNK_SIZE = 16 * 1024 * 1024
+FILL_WAIT_TIMEOUT_SEC = 300
+MANIFEST_TYPE = "application/vnd.docker.distribution.manifest.v2+json"
+PATH_RE = re.compile(r'^/v2/([^/]+)/([^/]+)/(manifests|blobs)/([^/]+)$')
+DIGEST_RE = re.compile(r'^sha256:[0-9a-f]{64}$')
+MANIFEST_DIGESTS_DIR = "manifest-digests"
+
+
+class BlobCache:
+    """Complete blobs under <root>/blobs, in least-recently-used order, kept under quota_bytes."""
+
+    def __init__(self, root, quota_bytes, log=print):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.log = log
+        self.lru = OrderedDict()   # digest -> size, least recently used first
+        self.total_bytes = 0
+        self.reserved_bytes = 0    # Fills in progress
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self._lock = threading.Lock()
+
+    def scan(self):
+        os.makedirs(store.blobs_dir(self.root), exist_ok=True)
+        found = []
+        for entry in os.scandir(store.blobs_dir(self.root)):
+            digest = store.digest_from_filename(entry.name)
+            if digest and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, digest, stat.st_size))
+        with self._lock:
+            for _, digest, size in sorted(found):
+                self.lru[digest] = size
+            self.total_bytes = sum(self.lru.values())
+        return self
+
+    def get(self, digest):
+        """Size of a cached blob, marking it most recently used, or None."""
+        with self._lock:
+            size = self.lru.get(digest)
+            if size is None:
+                return None
+            self.lru.move_to_end(digest)
+        try:
+            os.utime(store.blob_path(self.root, digest))
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(digest)
+            return None
+        return size
+
+    def _forget(self, digest):
+        size = self.lru.pop(digest, None)
+        if size is not None:
+            self.total_bytes -= size
+        return size
+
+    def make_room(self, nbytes):
+        """
+        Evicts least recently used blobs until nbytes more fit under the quota
+        next to the fills in progress, and reserves them for a fill. Returns
+        False if they don't fit even with nothing cached.
+        """
+        while True:
+            with self._lock:
+                fits = self.total_bytes + self.reserved_bytes + nbytes <= self.quota_bytes
+                if fits or not self.lru:
+                    self.reserved_bytes += nbytes
+                    return fits
+                digest, size = self.lru.popitem(last=False)
+                self.total_bytes -= size
+                self.evicted += 1
+                self.evicted_bytes += size
+            try:
+                os.remove(store.blob_path(self.root, digest))  # Readers holding it open keep their copy
+            except FileNotFoundError:
+                pass
+            self.log(f"🧹 Evicted {digest[:19]}… ({format_bytes(size)}).")
+
+    def release(self, nbytes):
+        with self._lock:
+            self.reserved_bytes -= nbytes
+
+    def add(self, digest, size):
+        """Adds a blob whose fill reserved `size` with make_room()."""
+        with self._lock:
+            self.reserved_bytes -= size
+            self._forget(digest)
+            self.lru[digest] = size
+            self.total_bytes += size
+
+
+class BlobFill:
+    """One upstream download in progress; readers block until the bytes they need are on disk."""
+
+    def __init__(self, digest, size, chunk_size):
+        self.digest = digest
+        self.size = size
+        self.chunk_size = chunk_size
+        self.written = {}     # chunk start -> last byte written; each chunk is fetched in order
+        self.error = None
+        self.finished = False
+        self._cond = threading.Condition()
+
+    def on_written(self, start, end):
+        chunk = start - start % self.chunk_size
+        with self._cond:
+            if end > self.written.get(chunk, -1):
+                self.written[chunk] = end
+                self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.finished, self.error = True, error
+            self._cond.notify_all()
+
+    def ready_until(self, offset, timeout=FILL_WAIT_TIMEOUT_SEC):
+        """Waits until byte `offset` is written; returns the last byte readable from there without waiting again."""
+        chunk = offset - offset % self.chunk_size
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.written.get(chunk, -1) >= offset or self.finished, timeout):
+                raise TimeoutError(f"byte {offset} of {self.digest} not written after {timeout}s")
+            if self.error is not None:
+                raise self.error
+            if self.finished:
+                return self.size - 1
+            last = self.written[chunk]
+            while last == chunk + self.chunk_size - 1 and chunk + self.chunk_size in self.written:
+                chunk += self.chunk_size
+                last = self.written[chunk]
+            return last
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._route(body=False)
+
+    def do_GET(self):
+        self._route(body=True)
+
+    def _route(self, body):
+        self._headers_sent = False
+        path = self.path.split('?', 1)[0]
+        if path in ("/v2", "/v2/"):
+            self._send_bytes(200, b"{}", "application/json", body)
+            return
+        match = PATH_RE.match(path)
+        if not match:
+            self._send_bytes(404, b"not found", "text/plain", body)
+            return
+        namespace, model, kind, reference = match.groups()
+        try:
+            if kind == "manifests":
+                raw = self.server.manifest(f"{namespace}/{model}", reference)
+                self._send_bytes(200, raw, MANIFEST_TYPE, body)
+            elif not DIGEST_RE.match(reference):
+                self._send_bytes(404, b"unknown digest", "text/plain", body)
+            else:
+                self._send_blob(f"{namespace}/{model}", reference, body)
+        except LookupError as e:
+            self._send_bytes(404, str(e).encode('utf-8'), "text/plain", body)
+        except (RegistryError, http.client.HTTPException, OSError, TimeoutError) as e:
+            if not self._headers_sent:
+                self._send_bytes(502, str(e).encode('utf-8'), "text/plain", body)
+            else:
+                self.close_connection = True  # Mid-body: the client sees a short read and retries the range
+
+    def _send_bytes(self, code, data, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def _send_blob(self, model_name, digest, body):
+        size, fill = self.server.open_blob(model_name, digest, start_fill=body)
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(max(0, end - start + 1)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Docker-Content-Digest', digest)
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        self._headers_sent = True
+        if body and end >= start:
+            self.wfile.flush()
+            self._stream(digest, start, end, fill)
+
+    def _stream(self, digest, start, end, fill):
+        f = None
+        try:
+            offset = start
+            while offset <= end:
+                ready = end if fill is None else min(end, fill.ready_until(offset))
+                if f is None:
+                    f = self.server.open_blob_file(digest, filling=fill is not None)
+                sent = self.connection.sendfile(f, offset, ready - offset + 1)
+                if not sent:
+                    raise ConnectionError(f"client stopped reading {digest}")
+                offset += sent
+                self.server.count_served(sent, from_cache=fill is None)
+        finally:
+            if f is not None:
+                f.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RegistryCacheProxy(ThreadingHTTPServer):
+    """The cache behind one listening socket; serve_forever() until shutdown()."""
+    daemon_threads = True
+
+    def __init__(self, cache_root, quota_bytes, upstream=DEFAULT_REGISTRY, host="0.0.0.0", port=DEFAULT_PORT,
+                 connections=DEFAULT_FILL_CONNECTIONS, chunk_size=DEFAULT_FILL_CHUNK_SIZE, log=print):
+        super().__init__((host, port), CacheRequestHandler)
+        self.root = cache_root
+        self.log = log
+        self.cache = BlobCache(cache_root, quota_bytes, log=log).scan()
+        self.client = RegistryClient(upstream, connections=connections, chunk_size=chunk_size)
+        self.sizes = {}         # digest -> size, from manifests that passed through
+        self.fills = {}         # digest -> BlobFill in progress
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_from_cache": 0, "bytes_streamed_while_filling": 0,
+                      "bytes_from_upstream": 0, "manifests_upstream": 0, "manifests_stale": 0,
+                      "manifests_by_digest_cached": 0}
+
+    def count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def count_served(self, nbytes, from_cache):
+        self.count("bytes_from_cache" if from_cache else "bytes_streamed_while_filling", nbytes)
+
+    # ─── MANIFESTS ─────────────────────────────────────────────
+    def manifest(self, repository, reference):
+        """Raw manifest of a repository ('library/qwen3') at a tag or a 'sha256:' digest."""
+        if DIGEST_RE.match(reference):
+            raw = self._manifest_by_digest(repository, reference)
+        else:
+            raw = self._manifest_by_tag(f"{repository}:{reference}")
+        with self._lock:
+            for layer in store.manifest_layers(json.loads(raw)):
+                self.sizes[layer["digest"]] = layer["size"]
+        return raw
+
+    def _manifest_by_tag(self, model_name):
+        """Raw manifest from upstream (cached for offline use), or the cached copy if upstream fails."""
+        try:
+            _, raw = self.client.fetch_manifest(model_name)
+        except RegistryError as e:
+            if e.status == 404:
+                raise LookupError(f"manifest unknown: {model_name}") from e
+            raw = self._cached_manifest(model_name, e)
+        except (http.client.HTTPException, OSError) as e:
+            raw = self._cached_manifest(model_name, e)
+        else:
+            self.count("manifests_upstream")
+            path = store.manifest_path(self.root, model_name)
+            try:
+                with open(path, 'rb') as f:
+                    unchanged = f.read() == raw
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                store.write_manifest(self.root, model_name, raw)
+        return raw
+
+    def _manifest_by_digest(self, repository, digest):
+        """The manifest whose bytes hash to `digest`, from the cache or else upstream."""
+        path = os.path.join(self.root, MANIFEST_DIGESTS_DIR, digest.replace(':', '-'))
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            if "sha256:" + hashlib.sha256(raw).hexdigest() == digest:
+                self.count("manifests_by_digest_cached")
+                return raw
+        except OSError:
+            pass
+        try:
+            _, raw = self.client.fetch_manifest(repository, reference=digest)
+        except RegistryError as e:
+            if e.status == 404:
+                raise LookupError(f"manifest unknown: {repository}@{digest}") from e
+            raise
+        if "sha256:" + hashlib.sha256(raw).hexdigest() != digest:
+            raise RegistryError(f"upstream manifest for {repository}@{digest} does not match its digest")
+        self.count("manifests_upstream")
+        store.write_file_atomic(path, raw)
+        return raw
+
+    def _cached_manifest(self, model_name, error):
+        try:
+            with open(store.manifest_path(self.root, model_name), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            raise error
+        self.count("manifests_stale")
+        self.log(f"⚠️ Upstream failed for {model_name} ({error}); serving the cached manifest.")
+        return raw
+
+    # ─── BLOBS ─────────────────────────────────────────────────
+    def _upstream_size(self, model_name, digest):
+        with self.client.pool.request('HEAD', self.client.blob_url(model_name, digest)) as resp:
+            resp.read()
+            length = resp.getheader('Content-Length')
+        if length is None:
+            raise RegistryError(f"upstream sent no size for {digest}")
+        with self._lock:
+            self.sizes[digest] = int(length)
+        return int(length)
+
+    def open_blob(self, model_name, digest, start_fill=True):
+        """
+        (size, fill) for a blob: fill is None when it is cached, else the
+        BlobFill to follow (started here if it isn't running). A HEAD for an
+        uncached blob only asks upstream for the size.
+        """
+        size = self.cache.get(digest)
+        if size is not None:
+            self.count("hits")
+            return size, None
+        with self._lock:
+            fill = self.fills.get(digest)
+            if fill is not None:
+                return fill.size, fill
+            size = self.sizes.get(digest)
+        if size is None:
+            try:
+                size = self._upstream_size(model_name, digest)
+            except RegistryError as e:
+                if e.status != 404:
+                    raise
+                raise LookupError(f"blob unknown: {digest}") from e
+        if not start_fill:
+            return size, None
+        with self._lock:
+            fill = self.fills.get(digest)
+            if fill is None:
+                fill = self.fills[digest] = BlobFill(digest, size, self.client.chunk_size)
+                threading.Thread(target=self._fill, args=(model_name, fill), name=f"fill-{digest[7:19]}",
+                                 daemon=True).start()
+                self.count("misses")
+        return fill.size, fill
+
+    def _fill(self, model_name, fill):
+        started = time.monotonic()
+        if not self.cache.make_room(fill.size):
+            self.log(f"⚠️ {fill.digest[:19]}… ({format_bytes(fill.size)}) doesn't fit in the quota next to the fills in "
+                     f"progress; the cache runs over until they finish.")
+        error = None
+        try:
+            fetched, _ = self.client.download_blob(model_name, {"digest": fill.digest, "size": fill.size}, self.root,
+                                                   on_written=fill.on_written)
+            self.count("bytes_from_upstream", fetched)
+            self.cache.add(fill.digest, fill.size)
+            self.cache.make_room(0)  # Back under the quota if fills ran over it
+            elapsed = time.monotonic() - started
+            self.log(f"📦 Cached {fill.digest[:19]}… ({format_bytes(fill.size)}) for {model_name} in {elapsed:.1f}s "
+                     f"({fetched / 1e6 / max(elapsed, 0.001):.1f} MB/s).")
+        except (RegistryError, http.client.HTTPException, OSError) as e:
+            error = e
+            self.cache.release(fill.size)
+            self.log(f"❌ Fill of {fill.digest[:19]}… failed: {e}")
+        finally:
+            with self._lock:
+                self.fills.pop(fill.digest, None)
+            fill.finish(error)
+
+    def open_blob_file(self, digest, filling=False):
+        """The cached blob, or its '-partial' while a fill runs (renamed to the blob once complete)."""
+        if filling:
+            try:
+                return open(store.partial_blob_path(self.root, digest), 'rb')
+            except FileNotFoundError:
+                pass
+        return open(store.blob_path(self.root, digest), 'rb')
+
+    def summary(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({"cached_blobs": len(self.cache.lru), "cached_bytes": self.cache.total_bytes,
+                      "quota_bytes": self.cache.quota_bytes, "evicted": self.cache.evicted,
+                      "evicted_bytes": self.cache.evicted_bytes})
+        return stats
+
+    def server_close(self):
+        super().server_close()
+        self.client.close()
@@ -0,0 +1,95 @@
+"""
+The model catalog: which models to keep pulled, read from a TOML file.
+
+    [[vendor]]
+    name = "qwen"
+    priority = 10                  # higher is queued earlier (default 0)
+    tags = ["reasoning"]           # inherited by every model of the vendor
+    models = [
+        "qwen3:0.6b",
+        { name = "qwen3:32b-q4_K_M", priority = 5, tags = ["large"] },
+    ]
+
+Selectors (vendor names, fnmatch patterns on model names, tags) are applied
+to the parsed catalog alone, so a partial run can narrow its model list
+before any inventory, verification or manifest work starts.
+"""
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11 (Ubuntu 22.04 ships 3.10): 'pip install tomli'
+    import tomli as tomllib
+from fnmatch import fnmatchcase
+from collections import namedtuple
+
+from . import store
+
+CatalogEntry = namedtuple("CatalogEntry", "name vendor priority tags")
+
+
+class CatalogError(Exception):
+    pass
+
+
+def parse_catalog(data):
+    """CatalogEntry list from a parsed TOML document, highest priority first (stable within a priority)."""
+    entries, seen = [], set()
+    vendors = data.get("vendor", [])
+    if not isinstance(vendors, list):
+        raise CatalogError("expected [[vendor]] tables")
+    for vendor in vendors:
+        if "name" not in vendor:
+            raise CatalogError("a [[vendor]] table has no name")
+        vendor_priority = vendor.get("priority", 0)
+        vendor_tags = tuple(vendor.get("tags", ()))
+        for model in vendor.get("models", []):
+            if isinstance(model, str):
+                model = {"name": model}
+            if not isinstance(model, dict) or not model.get("name"):
+                raise CatalogError(f"vendor '{vendor['name']}': model entries need a name")
+            key = store.normalize_model_name(model["name"])
+            if key in seen:
+                raise CatalogError(f"model '{model['name']}' is listed more than once")
+            seen.add(key)
+            entries.append(CatalogEntry(model["name"], vendor["name"], model.get("priority", vendor_priority),
+                                        vendor_tags + tuple(t for t in model.get("tags", ()) if t not in vendor_tags)))
+    return sorted(entries, key=lambda e: -e.priority)
+
+
+def load_catalog(path):
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except OSError as e:
+        raise CatalogError(f"cannot read {path}: {e}") from e
+    except tomllib.TOMLDecodeError as e:
+        raise CatalogError(f"{path}: {e}") from e
+    return parse_catalog(data)
+
+
+def matches(entry, patterns):
+    """True if any fnmatch pattern matches the name as written or fully tagged ('llama2' / 'llama2:latest')."""
+    full = store.normalize_model_name(entry.name)
+    return any(fnmatchcase(entry.name, p) or fnmatchcase(full, p) for p in patterns)
+
+
+def select(entries, vendors=None, match=None, exclude=None, tags=None):
+    """
+    Entries from the given vendors, with any of the given tags, matching any
+    `match` pattern and no `exclude` pattern. Empty selectors don't filter.
+    """
+    selected = []
+    for entry in entries:
+        if vendors and entry.vendor not in vendors:
+            continue
+        if tags and not set(tags) & set(entry.tags):
+            continue
+        if match and not matches(entry, match):
+            continue
+        if exclude and matches(entry, exclude):
+            continue
+        selected.append(entry)
+    return selected
+
+
+def vendors(entries):
+    return sorted({entry.vendor for entry in entries})
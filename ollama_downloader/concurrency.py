@@ -0,0 +1,177 @@
+"""
+Adaptive, throughput-driven concurrency for the pull orchestrator.
+
+AdaptiveConcurrency samples aggregate bytes/sec (fed from the parsed progress
+stream or native transfers) together with the write latency of the disk
+holding the model store, and adjusts the number of active pulls AIMD-style:
+add one pull while throughput keeps improving, halve the limit when the disk
+is saturated or throughput collapses. Lowering the limit never kills a pull;
+the orchestrator simply stops starting new ones until active pulls drain.
+"""
+import os
+import time
+import threading
+
+DEFAULT_SAMPLE_INTERVAL_SEC = 15
+DEFAULT_MAX_DISK_LATENCY_MS = 200   # A busy 5400 rpm HDD sits well above this
+DEFAULT_MIN_GAIN = 0.05             # An extra pull must add >= 5% throughput to be kept
+DEFAULT_DROP_RATIO = 0.7            # Throughput below 70% of the level's best is congestion
+DEFAULT_DECREASE_FACTOR = 0.5
+PROBE_AFTER_HOLDS = 8               # Retry an increase after this many steady samples
+
+
+# ─── DISK LATENCY ──────────────────────────────────────────────
+class DiskLatencyProbe:
+    """
+    Average write latency (ms) of the block device holding `path`, from the
+    deltas in /proc/diskstats. Falls back to timing a small fsync'd write when
+    the device can't be resolved (non-Linux, network filesystems, ...).
+    """
+
+    PROBE_BYTES = 256 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.device = self._resolve_device(path)
+        self._last = self._read_diskstats() if self.device else None
+
+    @staticmethod
+    def _resolve_device(path):
+        try:
+            st_dev = os.stat(path).st_dev
+            sys_path = os.path.realpath(f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}")
+            return os.path.basename(sys_path)
+        except OSError:
+            return None
+
+    def _read_diskstats(self):
+        try:
+            with open("/proc/diskstats", "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 7 and fields[2] == self.device:
+                        # writes completed, ms spent writing
+                        return int(fields[7]), int(fields[10])
+        except OSError:
+            pass
+        return None
+
+    def _probe_write(self):
+        probe_path = os.path.join(self.path, ".latency-probe")
+        start = time.perf_counter()
+        try:
+            fd = os.open(probe_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, b"\0" * self.PROBE_BYTES)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+                os.remove(probe_path)
+        except OSError:
+            return None
+        return (time.perf_counter() - start) * 1000
+
+    def sample(self):
+        """Returns the average write latency since the previous sample, or None if unknown."""
+        if self._last is None:
+            return self._probe_write()
+        current = self._read_diskstats()
+        if current is None:
+            return self._probe_write()
+        writes, write_ms = current[0] - self._last[0], current[1] - self._last[1]
+        self._last = current
+        return round(write_ms / writes, 1) if writes > 0 else 0.0
+
+
+# ─── CONTROLLER ────────────────────────────────────────────────
+class AdaptiveConcurrency:
+    """
+    AIMD controller for the number of concurrent pulls. record_bytes() is
+    thread-safe; sample() is meant to be called periodically from the
+    orchestrator (off the event loop, as it may touch the disk) and returns
+    the new limit. Every change is appended to `decisions`.
+    """
+
+    def __init__(self, models_path, min_limit=1, max_limit=8, initial=2,
+                 sample_interval=DEFAULT_SAMPLE_INTERVAL_SEC, max_disk_latency_ms=DEFAULT_MAX_DISK_LATENCY_MS,
+                 min_gain=DEFAULT_MIN_GAIN, drop_ratio=DEFAULT_DROP_RATIO, log=print):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.sample_interval = sample_interval
+        self.max_disk_latency_ms = max_disk_latency_ms
+        self.min_gain = min_gain
+        self.drop_ratio = drop_ratio
+        self.log = log
+        self.decisions = []
+        self.latency_probe = DiskLatencyProbe(models_path)
+
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._window_start = time.monotonic()
+        self._best_at_limit = {}       # limit -> best bytes/sec observed there
+        self._last_change = None       # "increase" / "decrease" / "hold"
+        self._throughput_before_change = None
+        self._holds = 0
+
+    def record_bytes(self, nbytes):
+        with self._lock:
+            self._bytes += nbytes
+
+    def due(self):
+        return time.monotonic() - self._window_start >= self.sample_interval
+
+    def sample(self, active, queued):
+        """Closes the current window, decides, and returns the (possibly new) limit."""
+        now = time.monotonic()
+        with self._lock:
+            elapsed = max(now - self._window_start, 1e-6)
+            throughput = self._bytes / elapsed
+            self._bytes = 0
+            self._window_start = now
+        latency_ms = self.latency_probe.sample()
+
+        # Only a saturated pool says anything about whether more pulls would help
+        saturated = active >= self.limit and queued > 0
+        best = self._best_at_limit.get(self.limit, 0)
+        self._best_at_limit[self.limit] = max(best, throughput)
+
+        if latency_ms is not None and latency_ms > self.max_disk_latency_ms and self.limit > self.min_limit:
+            return self._decrease(throughput, latency_ms, f"disk write latency {latency_ms} ms > {self.max_disk_latency_ms} ms")
+        if best and throughput < best * self.drop_ratio and self.limit > self.min_limit and active >= self.limit:
+            return self._decrease(throughput, latency_ms, f"throughput fell to {throughput / 1e6:.1f} MB/s from {best / 1e6:.1f} MB/s")
+        if not saturated or self.limit >= self.max_limit:
+            return self.limit
+
+        if self._last_change == "increase" and self._throughput_before_change is not None:
+            gain = (throughput - self._throughput_before_change) / max(self._throughput_before_change, 1)
+            if gain < self.min_gain:
+                # Plateau: the last pull added nothing; step back and hold
+                return self._change(self.limit - 1, throughput, latency_ms,
+                                    f"extra pull gained only {gain * 100:.0f}%", kind="hold")
+        elif self._last_change == "hold":
+            self._holds += 1
+            if self._holds < PROBE_AFTER_HOLDS:
+                return self.limit
+            return self._change(self.limit + 1, throughput, latency_ms, "probing for more throughput", kind="increase")
+        return self._change(self.limit + 1, throughput, latency_ms, "throughput still improving", kind="increase")
+
+    def _decrease(self, throughput, latency_ms, reason):
+        new_limit = max(self.min_limit, int(self.limit * DEFAULT_DECREASE_FACTOR))
+        return self._change(new_limit, throughput, latency_ms, reason, kind="decrease")
+
+    def _change(self, new_limit, throughput, latency_ms, reason, kind):
+        new_limit = min(self.max_limit, max(self.min_limit, new_limit))
+        if new_limit != self.limit:
+            self.decisions.append({
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "from": self.limit, "to": new_limit, "action": kind,
+                "throughput_mb_s": round(throughput / 1e6, 2),
+                "disk_write_latency_ms": latency_ms, "reason": reason,
+            })
+            self.log(f"🎛️ Concurrency {self.limit} → {new_limit} ({reason}; {throughput / 1e6:.1f} MB/s)")
+            self._throughput_before_change = throughput
+            self.limit = new_limit
+        self._last_change = kind
+        self._holds = 0
+        return self.limit
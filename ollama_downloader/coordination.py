@@ -0,0 +1,274 @@
+"""
+Coordination between hosts that pull the same catalog.
+
+Hosts share a directory (an NFS/SMB mount, or a local path when several
+stores are tested on one machine):
+
+    <dir>/hosts/<host>.json       {"host", "url", "pid", "started", "state"}: where the host serves its blobs
+    <dir>/claims/<model>.claim    {"host", "claimed_at"}: the host pulling the model from the internet
+    <dir>/done/<model>.json       {"host", "finished_at"}: a host that has the complete model
+
+Claims are created with O_EXCL, so exactly one host wins each model. The
+owner's heartbeat keeps the mtime of its host file and claims fresh; a claim
+that hasn't been touched for `ttl` seconds belongs to a host that died and
+is taken over. Ages are measured against the mtime of this host's own file,
+touched just before, so every timestamp compared comes from the shared
+directory's clock (an NFS server's), not from hosts whose clocks may drift. The orchestrator asks check() before starting a job, like
+the disk admission: a model another live host is pulling is deferred until
+that host marks it done, then pulled with the blobs copied from peers
+(RegistryClient(peers=coordinator.peer_urls)) instead of the internet.
+A host that has finished its queue keeps serving (state "serving") until
+every other live host is only serving too, so the last host to finish
+still finds the blobs the others fetched.
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from urllib.parse import quote
+
+from . import store
+from .admission import ADMIT, DEFER
+
+DEFAULT_TTL_SEC = 120
+DEFAULT_LINGER_SEC = 3600
+LINGER_POLL_SEC = 2
+PULLING = "pulling"
+SERVING = "serving"
+
+
+def model_key(model_name):
+    """A file name for the fully qualified model reference."""
+    return quote(store.normalize_model_name(model_name), safe='')
+
+
+def read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class SharedDirCoordinator:
+    def __init__(self, root, host_id, share_url, ttl=DEFAULT_TTL_SEC, log=print):
+        self.root = root
+        self.host_id = host_id
+        self.share_url = share_url
+        self.ttl = ttl
+        self.log = log
+        self.claimed = set()     # keys of the claims this host holds
+        self.won = 0
+        self.taken_over = 0
+        self.waited = {}         # model -> host it waited for
+        self.started = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, name)
+
+    def _claim_path(self, model_name):
+        return self._path("claims", model_key(model_name) + ".claim")
+
+    def _done_path(self, model_name):
+        return self._path("done", model_key(model_name) + ".json")
+
+    def _host_path(self, host_id):
+        return self._path("hosts", quote(host_id, safe='') + ".json")
+
+    def _shared_now(self):
+        """The shared directory's current time: the mtime of this host's file, touched now."""
+        path = self._host_path(self.host_id)
+        try:
+            os.utime(path)
+            return os.stat(path).st_mtime
+        except OSError:
+            return time.time()
+
+    def _fresh(self, mtime, now):
+        return mtime is not None and now - mtime < self.ttl
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    # ─── LIFECYCLE ─────────────────────────────────────────────
+    def _announce(self, state):
+        store.write_file_atomic(self._host_path(self.host_id), json.dumps({
+            "host": self.host_id, "url": self.share_url, "pid": os.getpid(),
+            "started": self.started, "state": state}).encode('utf-8'))
+
+    def start(self):
+        for kind in ("hosts", "claims", "done"):
+            os.makedirs(self._path(kind, ""), exist_ok=True)
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._announce(PULLING)
+        self._heartbeat = threading.Thread(target=self._beat, name="coordination-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def _beat(self):
+        while not self._stop.wait(self.ttl / 4):
+            with self._lock:
+                paths = [self._host_path(self.host_id)] + [self._path("claims", key) for key in self.claimed]
+            for path in paths:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass  # A claim taken over after a long stall; the next check() won't see it as ours
+
+    def linger(self, max_wait=DEFAULT_LINGER_SEC):
+        """Keeps serving blobs while another live host is still pulling, for at most max_wait seconds."""
+        self._announce(SERVING)
+        deadline = time.monotonic() + max_wait
+        logged = None
+        while time.monotonic() < deadline:
+            pulling = sorted(host for host, info in self._live_hosts().items() if info.get("state") != SERVING)
+            if not pulling:
+                return
+            if pulling != logged:
+                self.log(f"🤝 Still serving blobs to {', '.join(pulling)}...")
+                logged = pulling
+            time.sleep(LINGER_POLL_SEC)
+        self.log(f"⏳ Stopped serving after {max_wait / 60:.0f} min; peers still pulling will use the internet.")
+
+    def close(self):
+        """Stops the heartbeat, releases unfinished claims and withdraws this host's blob server."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        with self._lock:
+            claimed, self.claimed = self.claimed, set()
+        for key in claimed:
+            self._remove_if_ours(self._path("claims", key))
+        try:
+            os.remove(self._host_path(self.host_id))
+        except OSError:
+            pass
+
+    # ─── PEERS ─────────────────────────────────────────────────
+    def _live_hosts(self):
+        """{host: host file} of the other hosts whose heartbeat is fresh."""
+        hosts = {}
+        try:
+            names = os.listdir(self._path("hosts", ""))
+        except OSError:
+            return hosts
+        now = self._shared_now()
+        for name in names:
+            path = self._path("hosts", name)
+            info = read_json(path) if name.endswith(".json") else None
+            if info and info.get("host") != self.host_id and self._fresh(self._mtime(path), now):
+                hosts[info["host"]] = info
+        return hosts
+
+    def peers(self):
+        """{host: blob server url} of the other live hosts."""
+        return {host: info["url"] for host, info in self._live_hosts().items() if info.get("url")}
+
+    def peer_urls(self):
+        return list(self.peers().values())
+
+    # ─── CLAIMS ────────────────────────────────────────────────
+    def _try_claim(self, path):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"host": self.host_id, "claimed_at": datetime.now().isoformat(timespec="seconds")}, f)
+        return True
+
+    def _take_over(self, path, claim, mtime):
+        """
+        Moves the stale claim (`claim` with `mtime`, as inspected) aside and
+        claims the model again. Two hosts can see the same stale claim; when
+        the first has already replaced it, the second one's rename moves the
+        fresh claim instead, so what was moved is checked and put back unless
+        it is still the inspected claim.
+        """
+        tombstone = f"{path}.stale-{quote(self.host_id, safe='')}-{os.getpid()}"
+        try:
+            os.rename(path, tombstone)
+        except OSError:
+            return False
+        if read_json(tombstone) != claim or self._mtime(tombstone) != mtime:
+            self._restore(tombstone, path)
+            return False
+        os.remove(tombstone)
+        return self._try_claim(path)
+
+    @staticmethod
+    def _restore(tombstone, path):
+        """Puts a claim moved by mistake back, unless yet another host has claimed the model since."""
+        try:
+            os.link(tombstone, path)   # Unlike rename, never replaces a claim made in the meantime
+        except FileExistsError:
+            pass
+        except OSError:
+            try:
+                os.rename(tombstone, path)  # No hard links on this filesystem
+            except OSError:
+                pass
+            return
+        try:
+            os.remove(tombstone)
+        except OSError:
+            pass
+
+    def _remove_if_ours(self, path):
+        claim = read_json(path)
+        if claim and claim.get("host") == self.host_id:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def check(self, job, active_jobs=()):
+        """
+        ADMIT if a host already has the model (its blobs come from the LAN) or
+        this host won the claim; DEFER while another live host is pulling it.
+        """
+        if os.path.exists(self._done_path(job.model_name)):
+            return ADMIT
+        path = self._claim_path(job.model_name)
+        key = os.path.basename(path)
+        if self._try_claim(path):
+            self.won += 1
+        else:
+            claim = read_json(path)
+            mtime = self._mtime(path)
+            owner = (claim or {}).get("host")
+            if owner == self.host_id:
+                pass  # Left behind by an earlier run of this host, or re-checked for a retry
+            elif not self._fresh(mtime, self._shared_now()) and self._take_over(path, claim, mtime):
+                self.taken_over += 1
+                self.log(f"🤝 Took over {job.model_name} from {owner or 'an unknown host'} (no heartbeat for {self.ttl}s).")
+            else:
+                if job.model_name not in self.waited:
+                    self.waited[job.model_name] = owner
+                    self.log(f"🤝 {job.model_name} is being pulled by {owner or 'another host'}; it will be copied over the LAN when done.")
+                return DEFER
+        with self._lock:
+            self.claimed.add(key)
+        return ADMIT
+
+    def finished(self, model_name, success):
+        """Marks the model done on success and releases the claim either way, so another host may retry it."""
+        if success:
+            store.write_file_atomic(self._done_path(model_name), json.dumps({
+                "host": self.host_id, "finished_at": datetime.now().isoformat(timespec="seconds")}).encode('utf-8'))
+        path = self._claim_path(model_name)
+        with self._lock:
+            self.claimed.discard(os.path.basename(path))
+        self._remove_if_ours(path)
+
+    def summary(self):
+        return {"host": self.host_id, "url": self.share_url, "peers": self.peers(), "claims_won": self.won,
+                "claims_taken_over": self.taken_over, "waited_for": dict(self.waited)}
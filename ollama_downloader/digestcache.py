@@ -0,0 +1,96 @@
+"""
+Persistent sha256 cache for blob files, keyed by (st_dev, st_ino, st_size, st_mtime_ns).
+
+A blob whose stat key is unchanged since it was last hashed is trusted
+without reading it, so re-verifying a multi-terabyte store only hashes new
+or modified files. Because os.replace keeps the inode and mtime, a hash
+recorded for a '-partial' download stays valid once the file is moved into
+place. The cache lives in <models>/.digest-cache.json by default.
+"""
+import os
+import json
+import threading
+
+from . import store
+
+CACHE_FILENAME = ".digest-cache.json"
+CACHE_VERSION = 1
+
+
+def stat_key(st):
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def default_cache_path(models_path):
+    return os.path.join(models_path, CACHE_FILENAME)
+
+
+class DigestCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}      # stat key -> hex sha256
+        self.hits = 0
+        self.misses = 0
+        self.bytes_hashed = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        cache = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                cache.entries = dict(data.get("entries", {}))
+        except (OSError, ValueError):
+            pass  # Missing or unreadable cache: start empty
+        return cache
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"version": CACHE_VERSION, "entries": self.entries}, sort_keys=True)
+            self._dirty = False
+        store.write_file_atomic(self.path, data.encode("utf-8"))
+
+    def lookup(self, path):
+        """Cached hex digest for the file as it is now, or None (counted as a miss)."""
+        key = stat_key(os.stat(path))
+        with self._lock:
+            digest = self.entries.get(key)
+            if digest is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return digest
+
+    def record(self, path, hexdigest, hashed_bytes=0):
+        """Remembers the digest of the file as it is now (call right after hashing it)."""
+        key = stat_key(os.stat(path))
+        with self._lock:
+            self.entries[key] = hexdigest
+            self.bytes_hashed += hashed_bytes
+            self._dirty = True
+
+    def prune(self, models_path):
+        """Drops entries for blob files that no longer exist or have changed."""
+        live = set()
+        try:
+            with os.scandir(store.blobs_dir(models_path)) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        live.add(stat_key(entry.stat()))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            stale = [key for key in self.entries if key not in live]
+            for key in stale:
+                del self.entries[key]
+            self._dirty = self._dirty or bool(stale)
+        return len(stale)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes_hashed": self.bytes_hashed,
+                "entries": len(self.entries)}
@@ -0,0 +1,155 @@
+"""
+Kernel-side file copies.
+
+FileCopier.copy() moves bytes without passing them through Python, trying
+in order:
+
+    reflink          FICLONE ioctl: the copy shares the source's extents (btrfs, XFS,
+                     bcachefs...) and is instant; same filesystem and whole files only
+    copy_file_range  the kernel copies (server-side on NFS/SMB); across filesystems
+                     where the kernel allows it
+    sendfile         file-to-file splice inside the kernel
+    readwrite        plain read()/write() in large blocks
+
+A method that reports it isn't supported for a pair of filesystems is not
+tried again for that pair; one that gives up partway hands over to the next
+at the exact byte it reached. Copies can resume: bytes already in the
+destination are kept when the caller knows they are a valid prefix of the
+source (immutable blobs, or a journal that says so).
+"""
+import os
+import errno
+import fcntl
+import threading
+from collections import Counter
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+COPY_STEP = 64 * 1024 * 1024  # Bytes per kernel call, so progress and interruption stay responsive
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+METHODS = ("reflink", "copy_file_range", "sendfile", "readwrite")
+# Errors meaning "not with these files/filesystems", as opposed to a failing disk
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS, errno.EINVAL, errno.ENOTTY,
+                      errno.EBADF, errno.ETXTBSY, errno.EPERM}
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _kernel_call(func, *args):
+    try:
+        return func(*args)
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            raise Unsupported(e) from e
+        raise
+
+
+class FileCopier:
+    """Copies files with the fastest method each pair of filesystems supports; thread-safe."""
+
+    def __init__(self, methods=METHODS):
+        self.methods = tuple(methods)
+        self.bytes_by_method = Counter()
+        self.files_by_method = Counter()
+        self._unsupported = {}    # (src dev, dst dev) -> methods that failed as unsupported
+        self._lock = threading.Lock()
+
+    def copy(self, src_path, dst_path, resume=False, on_progress=None, on_position=None):
+        """
+        Copies src_path to dst_path (created or overwritten in place) and
+        returns the method that moved the bytes. With resume, a shorter
+        destination is taken as a valid prefix and only the rest is copied.
+        on_progress(nbytes) is called as bytes land, and on_position(offset)
+        with the length of the destination written so far.
+        """
+        with open(src_path, 'rb') as src:
+            size = os.fstat(src.fileno()).st_size
+            fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                done = os.fstat(fd).st_size if resume else 0
+                if done > size:
+                    done = 0
+                if not done:
+                    os.ftruncate(fd, 0)
+                elif on_progress is not None:
+                    on_progress(done)
+                method = self._copy_fds(src.fileno(), fd, done, size, on_progress, on_position)
+                os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+        return method
+
+    def _copy_fds(self, src, dst, offset, size, on_progress, on_position):
+        key = (os.fstat(src).st_dev, os.fstat(dst).st_dev)
+        position = [offset]   # Bytes of the destination written so far, across methods
+
+        def advance(nbytes):
+            position[0] += nbytes
+            if on_progress is not None:
+                on_progress(nbytes)
+            if on_position is not None:
+                on_position(position[0])
+
+        for method in self.methods:
+            if method in self._unsupported.get(key, ()):
+                continue
+            if method == "reflink" and position[0]:
+                continue  # Only whole files are cloned
+            start = position[0]
+            try:
+                getattr(self, "_" + method)(src, dst, start, size, advance)
+            except Unsupported:
+                with self._lock:
+                    if position[0] == start:
+                        self._unsupported.setdefault(key, set()).add(method)
+                    self.bytes_by_method[method] += position[0] - start
+                continue  # The next method starts at position[0], where this one stopped
+            with self._lock:
+                self.bytes_by_method[method] += size - start
+                self.files_by_method[method] += 1
+            return method
+        raise OSError(f"no copy method worked (tried {', '.join(self.methods)})")
+
+    # Each method copies [offset, size) and calls advance(nbytes) only after those bytes are written
+    @staticmethod
+    def _reflink(src, dst, offset, size, advance):
+        _kernel_call(fcntl.ioctl, dst, FICLONE, src)
+        advance(size)
+
+    @staticmethod
+    def _copy_file_range(src, dst, offset, size, advance):
+        while offset < size:
+            n = _kernel_call(os.copy_file_range, src, dst, min(COPY_STEP, size - offset), offset, offset)
+            if n == 0:
+                raise OSError(errno.EIO, f"source ended at byte {offset} of {size}")
+            offset += n
+            advance(n)
+
+    @staticmethod
+    def _sendfile(src, dst, offset, size, advance):
+        os.lseek(dst, offset, os.SEEK_SET)
+        while offset < size:
+            n = _kernel_call(os.sendfile, dst, src, offset, min(COPY_STEP, size - offset))
+            if n == 0:
+                raise OSError(errno.EIO, f"source ended at byte {offset} of {size}")
+            offset += n
+            advance(n)
+
+    @staticmethod
+    def _readwrite(src, dst, offset, size, advance):
+        while offset < size:
+            block = os.pread(src, min(READ_BLOCK_SIZE, size - offset), offset)
+            if not block:
+                raise OSError(errno.EIO, f"source ended at byte {offset} of {size}")
+            view = memoryview(block)
+            while view:
+                written = os.pwrite(dst, view, offset)
+                offset += written
+                view = view[written:]
+            advance(len(block))
+
+    def summary(self):
+        with self._lock:
+            return {method: {"files": self.files_by_method[method], "bytes": self.bytes_by_method[method]}
+                    for method in self.methods if self.files_by_method[method]}
@@ -0,0 +1,198 @@
+"""
+SQLite run history.
+
+Every run, every pull attempt and a sampled trace of per-layer transfer
+progress are written to one embedded database as they happen, so nothing is
+lost when the next run starts. model_metadata.json and model_report.txt are
+generated from it (report()), and trends can be queried directly:
+
+    sqlite3 model_history.sqlite "SELECT model, status, bytes_downloaded / download_time_sec / 1e6
+                                  FROM attempts WHERE model GLOB 'qwen3:*' AND finished_at > date('now', '-30 day')"
+
+All writes come from the orchestrator's event loop thread; layer samples are
+batched and committed with the attempt that produced them.
+"""
+import json
+import time
+import sqlite3
+import statistics
+from datetime import datetime
+
+from .progress import LayerProgress
+
+DEFAULT_SAMPLE_INTERVAL_SEC = 5
+SAMPLE_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    engine TEXT,
+    argv TEXT,
+    summary_json TEXT
+);
+CREATE TABLE IF NOT EXISTS models (
+    name TEXT PRIMARY KEY,
+    vendor TEXT,
+    first_seen TEXT NOT NULL,
+    last_status TEXT,
+    last_success_at TEXT,
+    size_bytes INTEGER
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    model TEXT NOT NULL REFERENCES models(name),
+    attempt INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    final INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    download_time_sec REAL,
+    bytes_downloaded INTEGER,
+    bytes_reused INTEGER,
+    model_size_bytes INTEGER,
+    entry_json TEXT
+);
+CREATE TABLE IF NOT EXISTS layer_samples (
+    attempt_id INTEGER NOT NULL REFERENCES attempts(id),
+    digest TEXT NOT NULL,
+    time REAL NOT NULL,
+    completed INTEGER,
+    total INTEGER,
+    bytes_per_sec INTEGER
+);
+CREATE INDEX IF NOT EXISTS attempts_model ON attempts(model, finished_at);
+CREATE INDEX IF NOT EXISTS attempts_run ON attempts(run_id);
+CREATE INDEX IF NOT EXISTS layer_samples_attempt ON layer_samples(attempt_id);
+"""
+
+
+def now_text():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class RunHistory:
+    def __init__(self, path, sample_interval=DEFAULT_SAMPLE_INTERVAL_SEC):
+        self.path = path
+        self.sample_interval = sample_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self._samples = []
+        self._last_sample = {}   # (attempt_id, digest) -> monotonic time of the last sample kept
+
+    def close(self):
+        self._flush_samples()
+        self.db.commit()
+        self.db.close()
+
+    # ─── RUNS ──────────────────────────────────────────────────
+    def start_run(self, engine=None, argv=None):
+        cursor = self.db.execute("INSERT INTO runs (started_at, engine, argv) VALUES (?, ?, ?)",
+                                 (now_text(), engine, json.dumps(argv or [])))
+        self.db.commit()
+        return cursor.lastrowid
+
+    def finish_run(self, run_id, summary):
+        self._flush_samples()
+        self.db.execute("UPDATE runs SET finished_at = ?, summary_json = ? WHERE id = ?",
+                        (now_text(), json.dumps(summary, sort_keys=True), run_id))
+        self.db.commit()
+
+    # ─── ATTEMPTS ──────────────────────────────────────────────
+    def attempt_started(self, run_id, job):
+        self.db.execute("INSERT OR IGNORE INTO models (name, vendor, first_seen) VALUES (?, ?, ?)",
+                        (job.model_name, job.vendor, now_text()))
+        cursor = self.db.execute(
+            "INSERT INTO attempts (run_id, model, attempt, status, started_at) VALUES (?, ?, ?, 'running', ?)",
+            (run_id, job.model_name, job.attempt, now_text()))
+        self.db.commit()
+        return cursor.lastrowid
+
+    def layer_progress(self, attempt_id, event):
+        """Keeps one LayerProgress sample per layer every `sample_interval` seconds, plus the final one."""
+        if not isinstance(event, LayerProgress):
+            return
+        key = (attempt_id, event.digest)
+        now = time.monotonic()
+        last = self._last_sample.get(key)
+        if last is not None and event.completed < event.total and now - last < self.sample_interval:
+            return
+        self._last_sample[key] = now
+        self._samples.append((attempt_id, event.digest, time.time(), event.completed, event.total, event.speed))
+        if len(self._samples) >= SAMPLE_BATCH:
+            self._flush_samples()
+
+    def attempt_finished(self, attempt_id, status, entry, final):
+        self._flush_samples()
+        self.db.execute(
+            "UPDATE attempts SET status = ?, final = ?, finished_at = ?, download_time_sec = ?, bytes_downloaded = ?,"
+            " bytes_reused = ?, model_size_bytes = ?, entry_json = ? WHERE id = ?",
+            (status, int(final), now_text(), entry.get("download_time_sec"), entry.get("bytes_downloaded"),
+             entry.get("bytes_reused"), entry.get("model_size_bytes"), json.dumps(entry, sort_keys=True), attempt_id))
+        if final:
+            model = self.db.execute("SELECT model FROM attempts WHERE id = ?", (attempt_id,)).fetchone()[0]
+            self.db.execute(
+                "UPDATE models SET last_status = ?, size_bytes = COALESCE(?, size_bytes),"
+                " last_success_at = CASE WHEN ? = 'success' THEN ? ELSE last_success_at END WHERE name = ?",
+                (status, entry.get("model_size_bytes"), status, now_text(), model))
+        self._last_sample = {k: v for k, v in self._last_sample.items() if k[0] != attempt_id}
+        self.db.commit()
+
+    def _flush_samples(self):
+        if self._samples:
+            self.db.executemany("INSERT INTO layer_samples VALUES (?, ?, ?, ?, ?, ?)", self._samples)
+            self._samples = []
+
+    # ─── VIEWS ─────────────────────────────────────────────────
+    def report(self, run_id, run_key):
+        """
+        Metadata dict for the reports: the latest final attempt of every model
+        ever recorded (each tagged with its run and time), plus this run's
+        summary under `run_key`.
+        """
+        report = {}
+        rows = self.db.execute(
+            "SELECT a.model, a.run_id, a.finished_at, a.entry_json FROM attempts a"
+            " WHERE a.final = 1 AND a.id = (SELECT MAX(id) FROM attempts b WHERE b.model = a.model AND b.final = 1)")
+        for model, attempt_run, finished_at, entry_json in rows:
+            entry = json.loads(entry_json or "{}")
+            entry.update({"run_id": attempt_run, "finished_at": finished_at, "this_run": attempt_run == run_id})
+            report[model] = entry
+        summary = self.db.execute("SELECT summary_json FROM runs WHERE id = ?", (run_id,)).fetchone()
+        run_summary = json.loads(summary[0]) if summary and summary[0] else {}
+        run_summary["run_id"] = run_id
+        report[run_key] = run_summary
+        return report
+
+    def rates(self, pattern="*", days=30):
+        """
+        {model: [bytes/sec, ...]} of successful attempts in the last `days` that
+        downloaded something, for model names matching the GLOB `pattern`.
+        """
+        rows = self.db.execute(
+            "SELECT model, bytes_downloaded / download_time_sec FROM attempts"
+            " WHERE status = 'success' AND model GLOB ? AND bytes_downloaded > 0 AND download_time_sec > 0"
+            " AND finished_at >= datetime('now', 'localtime', ?)",
+            (pattern, f"-{days} day"))
+        rates = {}
+        for model, rate in rows:
+            rates.setdefault(model, []).append(rate)
+        return rates
+
+    def throughput(self, pattern="*", days=30):
+        """{model: {"attempts", "median_mb_per_sec"}} over rates()."""
+        return {model: {"attempts": len(values), "median_mb_per_sec": round(statistics.median(values) / 1e6, 1)}
+                for model, values in sorted(self.rates(pattern, days).items())}
+
+    def median_rates(self, days=30):
+        """
+        ({model: median bytes/sec}, median over every attempt or None) for
+        estimating how long pulls will take.
+        """
+        rates = self.rates("*", days)
+        every = [rate for values in rates.values() for rate in values]
+        return ({model: statistics.median(values) for model, values in rates.items()},
+                statistics.median(every) if every else None)
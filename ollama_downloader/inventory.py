@@ -0,0 +1,120 @@
+"""
+Installed-model inventory read straight from the model store.
+
+Walks <models>/manifests/<host>/<namespace>/<model>/<tag> and parses each
+manifest, which takes milliseconds and works while the server is busy or
+down; a store without manifests/ holds no models yet. Only when the store
+isn't readable locally does it ask the server
+(GET /api/tags). Names are reported the way 'ollama list' prints them
+('llama2:latest', 'user/model:tag', 'hf.co/org/repo:tag').
+"""
+import os
+import json
+import hashlib
+from collections import namedtuple
+from datetime import datetime
+
+from . import store
+from .ollama_api import OllamaClient, OllamaAPIError
+
+API_TIMEOUT_SEC = 10
+
+InstalledModel = namedtuple("InstalledModel", "name host namespace model tag digest layers size modified")
+
+
+class InventoryError(Exception):
+    pass
+
+
+def default_models_path():
+    """OLLAMA_MODELS if set, else Ollama's per-user default."""
+    return os.environ.get("OLLAMA_MODELS") or os.path.expanduser("~/.ollama/models")
+
+
+def store_readable(models_path):
+    """True when manifests/ can be listed, or the store exists but has no models yet (no manifests/)."""
+    manifests = store.manifests_dir(models_path)
+    if os.path.isdir(manifests):
+        return os.access(manifests, os.R_OK | os.X_OK)
+    return os.path.isdir(models_path) and os.access(models_path, os.R_OK | os.X_OK)
+
+
+def scan_manifests(models_path):
+    """Every parseable manifest under <models>/manifests, as InstalledModel tuples sorted by name."""
+    root = store.manifests_dir(models_path)
+    models = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        parts = os.path.relpath(dirpath, root).split(os.sep)
+        if len(parts) < 3:
+            continue  # Need at least <host>/<namespace>/<model>
+        host, namespace, model = parts[0], '/'.join(parts[1:-1]), parts[-1]
+        for tag in filenames:
+            if tag.startswith('.'):
+                continue  # write_file_atomic temp files
+            path = os.path.join(dirpath, tag)
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                manifest = json.loads(raw)
+                modified = os.stat(path).st_mtime
+            except (OSError, ValueError):
+                continue
+            if not isinstance(manifest, dict):
+                continue
+            layers = store.manifest_layers(manifest)
+            models.append(InstalledModel(
+                store.display_name(host, namespace, model, tag), host, namespace, model, tag,
+                "sha256:" + hashlib.sha256(raw).hexdigest(), layers,
+                sum(layer.get("size", 0) for layer in layers),
+                datetime.fromtimestamp(modified).isoformat(timespec="seconds")))
+    return sorted(models, key=lambda m: m.name)
+
+
+def api_models(base_url=None):
+    """Installed models as reported by the server's /api/tags (no layer lists)."""
+    client = OllamaClient(base_url, timeout=API_TIMEOUT_SEC)
+    try:
+        entries = client.tags()
+    except OllamaAPIError as e:
+        raise InventoryError(str(e)) from e
+    finally:
+        client.close()
+    models = []
+    for entry in entries:
+        name = entry.get("name") or entry.get("model")
+        host, namespace, model, tag = store.parse_model_name(name)
+        models.append(InstalledModel(
+            store.display_name(host, namespace, model, tag), host, namespace, model, tag,
+            "sha256:" + entry.get("digest", "") if entry.get("digest") else None, [],
+            entry.get("size", 0), entry.get("modified_at")))
+    return sorted(models, key=lambda m: m.name)
+
+
+def list_models(models_path=None, base_url=None):
+    """
+    Returns (models, source) where source is "store" or "api". Reads the store
+    when it is locally readable, otherwise falls back to the server.
+    """
+    models_path = models_path or default_models_path()
+    if store_readable(models_path):
+        return scan_manifests(models_path), "store"
+    return api_models(base_url), "api"
+
+
+def installed_names(names, models_path=None, base_url=None):
+    """
+    Returns (installed, source): the subset of `names`, fully tagged, that is
+    installed. With a readable store only those models' manifests are read,
+    so checking a handful of models doesn't walk the whole store.
+    """
+    models_path = models_path or default_models_path()
+    wanted = {store.normalize_model_name(name) for name in names}
+    if store_readable(models_path):
+        return {name for name in wanted
+                if isinstance(store.read_manifest(store.manifest_path(models_path, name)), dict)}, "store"
+    return model_names(api_models(base_url)) & wanted, "api"
+
+
+def model_names(models):
+    return {m.name for m in models}
@@ -0,0 +1,199 @@
+"""
+Mirroring a model store to a second location (another disk, a NAS mount).
+
+Blobs are named by their digest and never change, so a store is synced by
+set difference: plan() reads every source manifest, lists the blobs the
+target lacks (missing, or the wrong size) and copy_blobs() copies only
+those, in parallel, with fastcopy's kernel-side copies. Each blob is written
+to '<blob>-partial.mirror' and renamed into place once complete, so an
+interrupted sync resumes where it stopped and never leaves a short blob
+under a real name. swap_manifests() runs last and atomically replaces the
+target manifests whose blobs are all in place; a model whose blobs failed
+keeps its previous manifest. prune() optionally drops target models the
+source no longer has.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from . import blobgc, store
+from .fastcopy import FileCopier
+
+DEFAULT_COPY_WORKERS = 4
+MIRROR_PARTIAL_SUFFIX = store.PARTIAL_SUFFIX + ".mirror"  # Still a '-partial' file to blobgc
+
+SourceManifest = namedtuple("SourceManifest", "relpath raw digests")
+MirrorPlan = namedtuple("MirrorPlan", "manifests to_copy present missing_in_source unreadable extra_manifests")
+
+
+class MirrorError(Exception):
+    pass
+
+
+def mirror_partial_path(models_path, digest):
+    return store.blob_path(models_path, digest) + MIRROR_PARTIAL_SUFFIX
+
+
+def read_manifests(models_path):
+    """Returns ({path relative to manifests/: raw bytes}, unreadable_paths)."""
+    root = store.manifests_dir(models_path)
+    manifests, unreadable = {}, []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.startswith('.'):
+                continue  # write_file_atomic temp files
+            path = os.path.join(dirpath, name)
+            try:
+                with open(path, 'rb') as f:
+                    manifests[os.path.relpath(path, root)] = f.read()
+            except OSError:
+                unreadable.append(path)
+    return manifests, unreadable
+
+
+def blob_sizes(models_path):
+    """{digest: size} of the complete blobs in the store."""
+    sizes = {}
+    try:
+        with os.scandir(store.blobs_dir(models_path)) as entries:
+            for entry in entries:
+                digest = store.digest_from_filename(entry.name)
+                if digest is not None and entry.is_file():
+                    sizes[digest] = entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return sizes
+
+
+def plan(source, target):
+    """
+    Compares the two stores. to_copy maps each digest the target lacks to its
+    size; missing_in_source lists manifests whose own blobs are incomplete in
+    the source, which are not mirrored.
+    """
+    raw_manifests, unreadable = read_manifests(source)
+    source_sizes = blob_sizes(source)
+    target_sizes = blob_sizes(target)
+    manifests, to_copy, present, missing_in_source = [], {}, set(), []
+    for relpath, raw in sorted(raw_manifests.items()):
+        manifest = store.read_manifest(os.path.join(store.manifests_dir(source), relpath))
+        if not isinstance(manifest, dict):
+            unreadable.append(os.path.join(store.manifests_dir(source), relpath))
+            continue
+        layers = {layer["digest"]: layer.get("size") for layer in store.manifest_layers(manifest) if layer.get("digest")}
+        if any(source_sizes.get(digest) is None or (size is not None and source_sizes[digest] != size)
+               for digest, size in layers.items()):
+            missing_in_source.append(relpath)
+            continue
+        manifests.append(SourceManifest(relpath, raw, frozenset(layers)))
+        for digest in layers:
+            if target_sizes.get(digest) == source_sizes[digest]:
+                present.add(digest)
+            else:
+                to_copy[digest] = source_sizes[digest]
+    target_manifests, _ = read_manifests(target)
+    mirrored = {m.relpath for m in manifests}
+    extra = sorted(relpath for relpath in target_manifests if relpath not in mirrored)
+    return MirrorPlan(manifests, to_copy, present, missing_in_source, unreadable, extra)
+
+
+def copy_blob(copier, source, target, digest, verify=False, on_progress=None):
+    """Copies one blob through its '-partial.mirror' file and renames it into place; returns the copy method."""
+    src = store.blob_path(source, digest)
+    partial = mirror_partial_path(target, digest)
+    method = copier.copy(src, partial, resume=True, on_progress=on_progress)
+    with open(partial, 'rb+') as f:
+        os.fsync(f.fileno())
+    if verify:
+        actual = store.sha256_file(partial)
+        if actual != digest:
+            os.remove(partial)
+            raise MirrorError(f"copy hashes to {actual}")
+    st = os.stat(src)
+    os.utime(partial, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(partial, store.blob_path(target, digest))
+    return method
+
+
+def copy_blobs(mirror_plan, source, target, copier=None, workers=DEFAULT_COPY_WORKERS, verify=False,
+               on_progress=None, on_copied=None):
+    """
+    Copies the planned blobs on a thread pool. Returns ({digest: method},
+    {digest: error}). on_copied(digest, method, error) is called per blob.
+    """
+    copier = copier or FileCopier()
+    os.makedirs(store.blobs_dir(target), exist_ok=True)
+    copied, errors = {}, {}
+
+    def run(digest):
+        try:
+            return digest, copy_blob(copier, source, target, digest, verify, on_progress), None
+        except (OSError, MirrorError) as e:
+            return digest, None, str(e)
+
+    # Largest first, so one big blob doesn't start last and run alone
+    digests = sorted(mirror_plan.to_copy, key=mirror_plan.to_copy.get, reverse=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for digest, method, error in pool.map(run, digests):
+            if error is None:
+                copied[digest] = method
+            else:
+                errors[digest] = error
+            if on_copied is not None:
+                on_copied(digest, method, error)
+    # The renames must be durable before any manifest points at them
+    fd = os.open(store.blobs_dir(target), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return copied, errors
+
+
+def swap_manifests(mirror_plan, target, failed=()):
+    """
+    Writes each source manifest whose blobs are all in the target, skipping
+    the ones already identical. Returns (written, unchanged, held_back) lists
+    of relative paths.
+    """
+    failed = set(failed)
+    written, unchanged, held_back = [], [], []
+    root = store.manifests_dir(target)
+    for manifest in mirror_plan.manifests:
+        if manifest.digests & failed:
+            held_back.append(manifest.relpath)
+            continue
+        path = os.path.join(root, manifest.relpath)
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == manifest.raw:
+                    unchanged.append(manifest.relpath)
+                    continue
+        except OSError:
+            pass
+        store.write_file_atomic(path, manifest.raw)
+        written.append(manifest.relpath)
+    return written, unchanged, held_back
+
+
+def prune(mirror_plan, target, workers=blobgc.DEFAULT_DELETE_WORKERS):
+    """
+    Removes the target manifests the source doesn't have, then the target
+    blobs no remaining manifest references. Returns (manifests_removed,
+    blobs_deleted, freed_bytes, {path: error}).
+    """
+    root = store.manifests_dir(target)
+    removed = 0
+    for relpath in mirror_plan.extra_manifests:
+        try:
+            os.remove(os.path.join(root, relpath))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    live, _, unreadable = blobgc.mark(target)
+    if unreadable:
+        raise MirrorError(f"{len(unreadable)} unreadable manifest(s) in the target, e.g. {unreadable[0]}")
+    garbage, _ = blobgc.find_garbage(target, live, min_age=0)
+    deleted, freed, errors = blobgc.delete([g for g in garbage if g.kind == "orphan"], workers=workers)
+    return removed, deleted, freed, errors
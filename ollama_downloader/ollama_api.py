@@ -0,0 +1,105 @@
+"""
+Client for the local Ollama server's HTTP API.
+
+Replaces forking the CLI ('ollama list', 'ollama pull', 'ollama create')
+with direct calls over the same keep-alive ConnectionPool the registry
+client uses:
+
+    tags()              GET  /api/tags     installed models
+    show(name)          POST /api/show     modelfile, parameters, details
+    copy(src, dst)      POST /api/copy     create an alias without a Modelfile
+    pull(name)          POST /api/pull     yields newline-delimited JSON progress
+
+The server address comes from OLLAMA_HOST like the CLI's does; pass
+base_url to talk to another server or a local stub.
+"""
+import os
+import json
+
+from .registry import ConnectionPool, RegistryError
+
+DEFAULT_OLLAMA_HOST = "127.0.0.1:11434"
+DEFAULT_API_TIMEOUT = 600  # Pull streams can sit quiet while the server verifies a large blob
+
+
+class OllamaAPIError(Exception):
+    pass
+
+
+def server_url(host=None):
+    """Base URL of the Ollama server from OLLAMA_HOST ('0.0.0.0:11434', 'http://box:11434', ...)."""
+    host = host or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST
+    if "://" not in host:
+        host = "http://" + host
+    return host.replace("://0.0.0.0", "://127.0.0.1").rstrip("/")
+
+
+class OllamaClient:
+    def __init__(self, base_url=None, pool=None, timeout=DEFAULT_API_TIMEOUT):
+        self.base_url = server_url(base_url)
+        self.pool = pool or ConnectionPool(timeout=timeout)
+
+    def close(self):
+        self.pool.close()
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        return self.pool.request(method, self.base_url + path, headers=headers, body=body)
+
+    def _call(self, method, path, payload=None):
+        """Sends a request and returns the decoded JSON response ({} for an empty body)."""
+        try:
+            with self._request(method, path, payload) as resp:
+                data = resp.read()
+        except RegistryError as e:
+            raise OllamaAPIError(str(e)) from e
+        except OSError as e:
+            raise OllamaAPIError(f"{method} {self.base_url}{path} failed: {e}") from e
+        if not data.strip():
+            return {}
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise OllamaAPIError(f"{method} {path}: invalid JSON response") from e
+
+    # ─── ENDPOINTS ─────────────────────────────────────────────
+    def version(self):
+        return self._call("GET", "/api/version").get("version")
+
+    def tags(self):
+        return self._call("GET", "/api/tags").get("models", [])
+
+    def show(self, name, verbose=False):
+        return self._call("POST", "/api/show", {"model": name, "verbose": verbose})
+
+    def copy(self, source, destination):
+        self._call("POST", "/api/copy", {"source": source, "destination": destination})
+
+    def pull(self, name, insecure=False, stop=None):
+        """
+        Starts a pull and yields each progress object as the server streams it,
+        e.g. {"status": "pulling 8934d96d3f08", "digest": "sha256:...", "total": N,
+        "completed": M}. Raises OllamaAPIError on an {"error": ...} line.
+        Once `stop` (a threading.Event) is set, the stream ends at the next
+        line; dropping the connection makes the server abandon the pull.
+        """
+        try:
+            with self._request("POST", "/api/pull", {"model": name, "insecure": insecure, "stream": True}) as resp:
+                while stop is None or not stop.is_set():
+                    line = resp.readline()
+                    if not line:
+                        break
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "error" in event:
+                        raise OllamaAPIError(f"pull {name}: {event['error']}")
+                    yield event
+        except RegistryError as e:
+            raise OllamaAPIError(str(e)) from e
+        except OSError as e:
+            raise OllamaAPIError(f"POST {self.base_url}/api/pull failed: {e}") from e
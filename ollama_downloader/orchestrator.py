@@ -0,0 +1,463 @@
+"""
+asyncio orchestrator for model pulls.
+
+A single event loop drives up to `max_concurrent` 'ollama pull' children via
+asyncio.create_subprocess_exec (or native registry pulls on an executor).
+The orchestrator is the only writer of the run's metadata dict, success set
+and progress bars, so no locking is needed around them. Jobs can carry a
+wall-clock deadline, and cancelling run() terminates every child it started
+(blocking pulls are asked to stop and awaited).
+A ThroughputWatchdog task beside each pull's reader stops and restarts pulls
+whose byte rate stalls, and failed jobs re-enter the dispatch loop through
+a RetryPolicy backoff, ahead of the pending queue. An optional
+AdaptiveConcurrency controller is sampled on the dispatch tick and moves the
+concurrency limit while the run is in progress, and a SchedulingPolicy
+decides which queued job takes each free slot. A DiskAdmission check then
+reserves the job's bytes on the store's filesystem, deferring jobs that
+don't fit yet and skipping those that never will. A coordinator (see
+coordination.py) is asked last, so a model another host is pulling waits
+until it can be copied from that host, and every finished attempt is
+reported back to it.
+"""
+import os
+import time
+import heapq
+import codecs
+import signal
+import asyncio
+import threading
+from collections import deque
+
+from tqdm import tqdm
+
+from .progress import ProgressParser, LayerProgress
+from .scheduling import SchedulingPolicy
+from .admission import ADMIT, DEFER
+from .retry import RetryPolicy
+from .watchdog import (ThroughputWatchdog, DEFAULT_WINDOW_SEC, DEFAULT_GRACE_SEC, DEFAULT_MIN_BYTES_PER_SEC,
+                       DEFAULT_CHECK_INTERVAL_SEC, DEFAULT_MAX_RESTARTS)
+
+DEFAULT_STALL_TIMEOUT_SEC = 600
+TERMINATE_GRACE_SEC = 5
+EXIT_WAIT_SEC = 60
+READ_SIZE = 64 * 1024
+LOG_TAIL_LINES = 5
+
+
+class PullJob:
+    """One model to pull, plus the per-attempt state the orchestrator tracks for it."""
+
+    def __init__(self, model_name, index, total, vendor=None, size_bytes=None):
+        self.model_name = model_name
+        self.index = index
+        self.total = total
+        self.vendor = vendor
+        self.size_bytes = size_bytes  # Bytes still to fetch, when the manifest is known
+        self.reserved_bytes = 0       # Disk space reserved at admission...
+        self.reserved_at = 0          # ...and bytes_done at that moment
+        self.blobs_before = frozenset()
+        self.started_at = None
+        self.last_progress = 0
+        self.bytes_done = 0
+        self.layer_bytes = {}   # digest prefix -> bytes already passed to record_bytes
+        self.parser = None
+        self.log_tail = deque(maxlen=LOG_TAIL_LINES)
+        self.pbar = None
+        self.watchdog = None
+        self.stall_reasons = []
+        self.attempt = 0
+        self.attempts = []      # Entries of earlier, failed attempts in this run
+        self.history_id = None  # Row of the current attempt in the RunHistory
+        self.stop = None        # threading.Event a blocking pull checks between blocks
+
+
+class PullOrchestrator:
+    """
+    Schedules PullJobs on one event loop.
+
+    blocking_pull, when given, is a blocking callable (job) -> (status, entry)
+    run on the default executor instead of spawning 'ollama pull' (the native
+    registry engine, or pulls through the server API). It must return soon
+    after job.stop is set, which happens at the job deadline and when the run
+    is cancelled; the throughput watchdog only applies to 'ollama pull'. pull_log,
+    when given, receives every parsed progress event (see PullLogWriter), and
+    a RunHistory records each attempt and sampled layer progress. With a
+    BlobIndex, each successful subprocess pull records its exact model size
+    and the bytes it downloaded versus reused.
+    """
+
+    def __init__(self, metadata, max_concurrent=1, ollama_bin="ollama", job_deadline=None,
+                 stall_timeout=DEFAULT_STALL_TIMEOUT_SEC, delay_between=0, log=print,
+                 pull_log=None, blocking_pull=None, blob_index=None, controller=None, policy=None,
+                 tick_interval=1.0, min_bytes_per_sec=DEFAULT_MIN_BYTES_PER_SEC,
+                 throughput_window=DEFAULT_WINDOW_SEC, stall_grace=DEFAULT_GRACE_SEC,
+                 max_restarts=DEFAULT_MAX_RESTARTS, retry_policy=None, history=None, run_id=None,
+                 admission=None, coordinator=None):
+        self.metadata = metadata
+        self.max_concurrent = max(1, max_concurrent)
+        self.ollama_bin = ollama_bin
+        self.job_deadline = job_deadline
+        self.stall_timeout = stall_timeout
+        self.delay_between = delay_between
+        self.log = log
+        self.pull_log = pull_log
+        self.blocking_pull = blocking_pull
+        self.blob_index = blob_index
+        self.controller = controller
+        self.policy = policy or SchedulingPolicy()
+        if controller is not None:
+            self.max_concurrent = controller.limit
+        self.tick_interval = tick_interval
+        self.min_bytes_per_sec = min_bytes_per_sec
+        self.throughput_window = throughput_window
+        self.stall_grace = stall_grace
+        self.max_restarts = max_restarts
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.history = history
+        self.run_id = run_id
+        self.admission = admission
+        self.coordinator = coordinator
+        self.succeeded = set()
+        self.active = {}
+        self.retries = []   # heap of (ready_at, seq, job) waiting out their backoff
+        self._retry_seq = 0
+        self._coordination_backoff = {}   # model -> monotonic time before which the coordinator isn't asked again
+        self._loop = None
+
+    # ─── DISPATCH ──────────────────────────────────────────────
+    async def run(self, jobs):
+        self._loop = asyncio.get_running_loop()
+        queue = self.policy.order(jobs)
+        overall = tqdm(total=len(queue), desc="Overall Progress")
+        try:
+            while queue or self.active or self.retries:
+                deferred = []   # Jobs the disk check turned away on this tick
+                while len(self.active) < self.max_concurrent:
+                    job = self._next_job(queue, deferred, overall)
+                    if job is None:
+                        break
+                    self.active[asyncio.create_task(self._run_job(job))] = job
+
+                if not self.active:
+                    if self.retries or queue:
+                        # Nothing could start: sleep until the next retry's backoff ends, or a whole
+                        # tick when a due retry or queued job was held back, so it isn't re-polled at once
+                        wait = self.retries[0][0] - time.monotonic() if self.retries else 0
+                        await asyncio.sleep(wait if 0 < wait < self.tick_interval else self.tick_interval)
+                    continue  # Otherwise everything left was skipped for disk space
+                done, _ = await asyncio.wait(self.active, timeout=self.tick_interval,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    job = self.active.pop(task)
+                    if self._record(job, task):
+                        overall.update(1)
+
+                if self.controller is not None and self.controller.due():
+                    loop = asyncio.get_running_loop()
+                    self.max_concurrent = await loop.run_in_executor(
+                        None, self.controller.sample, len(self.active), len(queue) + len(self.retries))
+
+                if done and queue and self.delay_between:
+                    self.log(f"⏳ Pausing for {self.delay_between} seconds...")
+                    await asyncio.sleep(self.delay_between)
+        except asyncio.CancelledError:
+            self.log(f"🛑 Cancelling {len(self.active)} active pull(s)...")
+            for task in self.active:
+                task.cancel()
+            await asyncio.gather(*self.active, return_exceptions=True)
+            for job in self.active.values():
+                if self.history is not None:
+                    self.history.attempt_finished(job.history_id, "cancelled", {"status": "cancelled"}, final=True)
+            for job in list(self.active.values()) + [job for _, _, job in self.retries]:
+                self.metadata.setdefault(job.model_name, {"status": "cancelled", "attempts": job.attempts})
+            self.active.clear()
+            self.retries.clear()
+            raise
+        finally:
+            overall.close()
+        return self.succeeded
+
+    def _next_job(self, queue, deferred, overall):
+        """
+        Takes the next job to start off its queue, or returns None to wait.
+        Retries whose backoff has expired go first, ahead of the policy's queue.
+        Jobs the admission check or the coordinator defers stay queued for a
+        later tick; jobs the admission check skips are recorded as final.
+        """
+        while True:
+            active = list(self.active.values())
+            retry_ready = (self.retries and self.retries[0][0] <= time.monotonic()
+                           and self.retries[0][2] not in deferred)
+            if retry_ready:
+                job = self.retries[0][2]
+            else:
+                candidates = [job for job in queue if job not in deferred]
+                index = self.policy.pick(candidates, active) if candidates else None
+                if index is None:
+                    return None
+                job = candidates[index]
+            verdict = self.admission.check(job, active) if self.admission is not None else ADMIT
+            if verdict == ADMIT and self.coordinator is not None:
+                verdict = self._coordinate(job, active)
+            if verdict == DEFER:
+                deferred.append(job)
+                continue
+            if retry_ready:
+                heapq.heappop(self.retries)
+            else:
+                queue.remove(job)
+            if verdict == ADMIT:
+                return job
+            self._skip(job)
+            overall.update(1)
+
+    def _coordinate(self, job, active):
+        """
+        Asks the coordinator about a job at most once a tick: every check()
+        touches the shared directory, which may be on NFS, and the loop can
+        wake many times a tick as pulls finish.
+        """
+        now = time.monotonic()
+        if self._coordination_backoff.get(job.model_name, 0) > now:
+            return DEFER
+        verdict = self.coordinator.check(job, active)
+        if verdict == DEFER:
+            self._coordination_backoff[job.model_name] = now + self.tick_interval
+        else:
+            self._coordination_backoff.pop(job.model_name, None)
+        return verdict
+
+    def _skip(self, job):
+        """Records a job the admission check turned away for good."""
+        status = "skipped (disk space)"
+        entry = {"status": status, "reason": self.admission.skipped.get(job.model_name), "log_tail": []}
+        if job.attempts:
+            entry["attempts"] = job.attempts + [{"status": status, "download_time_sec": None}]
+        if self.history is not None:
+            job.attempt += 1
+            job.history_id = self.history.attempt_started(self.run_id, job)
+            self.history.attempt_finished(job.history_id, status, entry, final=True)
+        self.metadata[job.model_name] = entry
+
+    def record_bytes(self, job, nbytes):
+        """Accounts transferred bytes for a job; safe to call from native transfer threads."""
+        job.bytes_done += nbytes
+        if self.controller is not None:
+            self.controller.record_bytes(nbytes)
+
+    def layer_progress(self, job, digest, completed, total):
+        """
+        Records a blocking pull's progress on one layer in the RunHistory, as
+        _handle_events does for 'ollama pull' output; safe to call from its
+        threads (the history is written on the event loop).
+        """
+        if self.history is None:
+            return
+        event = LayerProgress(digest.split(':')[-1][:12], int(completed * 100 / total) if total else 0,
+                              completed, total, None, None, "", 1)
+        self._loop.call_soon_threadsafe(self.history.layer_progress, job.history_id, event)
+
+    def _record(self, job, task):
+        """Records a finished attempt, or queues a retry. Returns True once the job is final."""
+        if job.pbar is not None:
+            job.pbar.close()
+        try:
+            status, entry = task.result()
+        except Exception as exc:
+            self.log(f"❌ Exception occurred for model '{job.model_name}': {exc}")
+            status, entry = f"failed (orchestrator exception: {exc})", {}
+        entry.setdefault("status", status)
+        if self.coordinator is not None:
+            self.coordinator.finished(job.model_name, status == "success")
+        retrying = status != "success" and self.retry_policy.should_retry(job.attempt, status, entry)
+        if self.history is not None:
+            self.history.attempt_finished(job.history_id, status, entry, final=not retrying)
+        if retrying:
+            delay = self.retry_policy.delay(job.attempt)
+            job.attempts.append({"status": status, "download_time_sec": entry.get("download_time_sec")})
+            heapq.heappush(self.retries, (time.monotonic() + delay, self._retry_seq, job))
+            self._retry_seq += 1
+            self.log(f"🔁 Retrying {job.model_name} in {delay:.0f}s "
+                     f"(attempt {job.attempt + 1}/{self.retry_policy.max_attempts}, last status: {status}).")
+            return False
+        if job.attempts:
+            entry["attempts"] = job.attempts + [{"status": status, "download_time_sec": entry.get("download_time_sec")}]
+        self.metadata[job.model_name] = entry
+        if status == "success":
+            self.succeeded.add(job.model_name)
+        return True
+
+    async def _run_job(self, job):
+        job.attempt += 1
+        job.started_at = time.time()
+        job.last_progress = 0
+        job.stall_reasons = []
+        if self.history is not None:
+            job.history_id = self.history.attempt_started(self.run_id, job)
+        loop = asyncio.get_running_loop()
+        if self.blob_index is not None:
+            job.blobs_before = self.blob_index.snapshot()
+        if self.blocking_pull is not None:
+            return await self._run_blocking(job)
+
+        self.log(f"\n🚀 ({job.index}/{job.total}) Starting download: {job.model_name}")
+        job.pbar = tqdm(total=100, desc=f"{job.model_name[:30]:<30}", unit='%', leave=False)
+        for restart in range(self.max_restarts + 1):
+            status = await self._run_subprocess(job)
+            if status != "stalled" or restart == self.max_restarts:
+                break
+            # 'ollama pull' resumes its -partial blobs, so a fresh connection picks up where this one crawled
+            self.log(f"🔁 Restarting {job.model_name} ({restart + 1}/{self.max_restarts}) after stall.")
+        elapsed = time.time() - job.started_at
+
+        entry = {
+            "download_time_sec": round(elapsed, 2), "status": status,
+            "final_progress_%": 100 if status == "success" else job.last_progress,
+            "log_tail": list(job.log_tail),
+        }
+        if job.stall_reasons:
+            entry["stalls"] = list(job.stall_reasons)
+        sizes = None
+        if self.blob_index is not None and status == "success":
+            sizes = await loop.run_in_executor(
+                None, self.blob_index.account_installed_model, job.model_name, job.blobs_before)
+            entry.update(sizes or {})
+
+        if status == "success" and sizes:
+            self.log(f"✅ Finished {job.model_name} successfully. | Model size: {sizes['model_size_gb']} GB "
+                     f"({sizes['bytes_downloaded'] / 1024 ** 3:.2f} GB new, {sizes['bytes_reused'] / 1024 ** 3:.2f} GB reused)")
+        elif status == "success":
+            self.log(f"✅ Finished {job.model_name} successfully.")
+        elif status == "timed_out":
+            self.log(f"⏰ Timed out downloading {job.model_name} after {round(elapsed)}s.")
+        elif status == "stalled":
+            self.log(f"🐌 Gave up on {job.model_name} after {len(job.stall_reasons)} stall(s).")
+        else:
+            self.log(f"❌ Finished {job.model_name} with status: {status}.")
+        return status, entry
+
+    async def _run_blocking(self, job):
+        """
+        Runs blocking_pull on the executor. A thread can't be interrupted, so
+        at the deadline or on cancellation job.stop is set and the pull is
+        awaited until it notices.
+        """
+        job.stop = threading.Event()
+        future = asyncio.get_running_loop().run_in_executor(None, self.blocking_pull, job)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.job_deadline)
+        except asyncio.TimeoutError:
+            job.stop.set()
+            status, entry = await future
+            if status != "cancelled":
+                return status, entry  # Finished on its own before it saw the stop
+            entry["status"] = "timed_out"
+            self.log(f"⏰ Timed out downloading {job.model_name} after {self.job_deadline}s.")
+            return "timed_out", entry
+        except asyncio.CancelledError:
+            job.stop.set()
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+    # ─── SUBPROCESS PULLS ──────────────────────────────────────
+    async def _run_subprocess(self, job):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.ollama_bin, "pull", job.model_name,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=os.environ.copy(),
+                start_new_session=True)
+        except OSError as e:
+            self.log(f"❌ Could not start '{self.ollama_bin} pull {job.model_name}': {e}")
+            return f"failed (exception: {e})"
+
+        job.watchdog = ThroughputWatchdog(
+            self.stall_timeout, window_sec=self.throughput_window, grace_sec=self.stall_grace,
+            min_bytes_per_sec=self.min_bytes_per_sec, deadline=self.job_deadline)
+        job.watchdog.start(time.monotonic(), job.bytes_done)
+        watcher = asyncio.create_task(self._watch(job, process))
+        try:
+            await self._consume_output(job, process)
+            try:
+                await asyncio.wait_for(process.wait(), EXIT_WAIT_SEC)
+            except asyncio.TimeoutError:
+                self.log(f"⚠️ Process {job.model_name} exceeded wait timeout after stream closed. Killing.")
+                await self._stop(job, process)
+                return "failed (timeout_wait)"
+            if job.watchdog.verdict is not None:
+                status, reason = job.watchdog.verdict
+                if status == "stalled":
+                    job.stall_reasons.append(reason)
+                return status
+            if process.returncode == 0:
+                job.pbar.update(max(0, 100 - job.pbar.n))
+                return "success"
+            return f"failed (code: {process.returncode})"
+        except asyncio.CancelledError:
+            await self._stop(job, process)
+            raise
+        finally:
+            if not watcher.done():
+                watcher.cancel()
+
+    async def _watch(self, job, process):
+        """Runs beside the output reader and stops the process if the watchdog trips."""
+        while process.returncode is None:
+            await asyncio.sleep(DEFAULT_CHECK_INTERVAL_SEC)
+            layers = job.parser.layers.values() if job.parser else ()
+            downloading = any(layer.completed < layer.total for layer in layers)
+            resolution = job.parser.resolution if job.parser else 0
+            verdict = job.watchdog.check(time.monotonic(), job.bytes_done, downloading, resolution)
+            if verdict is not None:
+                self.log(f"⚠️ {verdict[1]} for {job.model_name}. Terminating process.")
+                await self._stop(job, process)
+                return
+
+    async def _consume_output(self, job, process):
+        """Reads the child's output until EOF (the watchdog stops the process when it stalls)."""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        job.parser = ProgressParser()
+        while True:
+            chunk = await process.stdout.read(READ_SIZE)
+            if not chunk:
+                break
+            self._handle_events(job, job.parser.feed(decoder.decode(chunk)))
+        self._handle_events(job, job.parser.close())
+
+    def _handle_events(self, job, events):
+        """Applies parsed progress events to the job's byte accounting, log tail and bar."""
+        if events and job.watchdog is not None:
+            job.watchdog.activity(time.monotonic())
+        for event in events:
+            job.log_tail.append(event.line)
+            if self.pull_log is not None:
+                self.pull_log.record(job.model_name, event)
+            if self.history is not None:
+                self.history.layer_progress(job.history_id, event)
+            if isinstance(event, LayerProgress):
+                delta = event.completed - job.layer_bytes.get(event.digest, 0)
+                if delta > 0:
+                    job.layer_bytes[event.digest] = event.completed
+                    self.record_bytes(job, delta)
+        progress = job.parser.percent
+        if progress > job.last_progress:
+            job.pbar.update(progress - job.last_progress)
+            job.last_progress = progress
+
+    async def _stop(self, job, process):
+        if process.returncode is not None:
+            return
+        # Each pull runs in its own session; signal the whole group so no helper keeps the pipe open
+        self._signal(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), TERMINATE_GRACE_SEC)
+        except asyncio.TimeoutError:
+            self.log(f"⚠️ Process {job.model_name} did not terminate gracefully. Killing.")
+            self._signal(process, signal.SIGKILL)
+            await process.wait()
+
+    @staticmethod
+    def _signal(process, sig):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
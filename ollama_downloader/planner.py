@@ -0,0 +1,137 @@
+"""
+Cross-model pull planning.
+
+Resolves the manifest of every pending model up front, computes the union of
+their layer digests and works out which blobs are already in <models>/blobs,
+so a run fetches each missing blob exactly once no matter how many models
+share it (qwen3 templates and licenses, granite/phi params files, ...).
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import store
+from .blobindex import BlobIndex
+from .registry import RegistryError
+
+DEFAULT_RESOLVE_WORKERS = 8
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
+    return f"{num_bytes:.2f} TB"
+
+
+class PullPlan:
+    """Manifests, layer digests and byte accounting for one run's pending models."""
+
+    def __init__(self):
+        self.manifests = {}                 # model -> (manifest, raw_bytes)
+        self.errors = {}                    # model -> error message
+        self.blobs = {}                     # digest -> layer descriptor
+        self.blob_models = defaultdict(list)  # digest -> models referencing it
+        self.present = set()                # digests already complete on disk
+
+    def add_model(self, model_name, manifest, raw):
+        self.manifests[model_name] = (manifest, raw)
+        for layer in store.manifest_layers(manifest):
+            self.blobs.setdefault(layer["digest"], layer)
+            if model_name not in self.blob_models[layer["digest"]]:
+                self.blob_models[layer["digest"]].append(model_name)
+
+    def model_layers(self, model_name):
+        return store.manifest_layers(self.manifests[model_name][0])
+
+    def model_size(self, model_name):
+        return sum(layer["size"] for layer in self.model_layers(model_name))
+
+    def remaining_bytes(self, model_name):
+        """Bytes this model still needs, counting layers shared with other pending models."""
+        return sum(layer["size"] for layer in self.model_layers(model_name) if layer["digest"] not in self.present)
+
+    def missing_digests(self):
+        return [digest for digest in self.blobs if digest not in self.present]
+
+    @property
+    def requested_bytes(self):
+        """Bytes independent per-model pulls would have to account for."""
+        return sum(self.model_size(model) for model in self.manifests)
+
+    @property
+    def unique_bytes(self):
+        return sum(layer["size"] for layer in self.blobs.values())
+
+    @property
+    def present_bytes(self):
+        return sum(self.blobs[digest]["size"] for digest in self.present)
+
+    @property
+    def fetch_bytes(self):
+        return sum(self.blobs[digest]["size"] for digest in self.missing_digests())
+
+    @property
+    def saved_bytes(self):
+        return self.requested_bytes - self.fetch_bytes
+
+    def shared_digests(self):
+        return [digest for digest, models in self.blob_models.items() if len(models) > 1]
+
+    def summary(self):
+        return {
+            "models_resolved": len(self.manifests),
+            "models_unresolved": len(self.errors),
+            "unique_blobs": len(self.blobs),
+            "shared_blobs": len(self.shared_digests()),
+            "blobs_present": len(self.present),
+            "blobs_to_fetch": len(self.missing_digests()),
+            "requested_bytes": self.requested_bytes,
+            "unique_bytes": self.unique_bytes,
+            "present_bytes": self.present_bytes,
+            "fetch_bytes": self.fetch_bytes,
+            "saved_bytes": self.saved_bytes,
+        }
+
+
+def resolve_manifests(client, models, workers=DEFAULT_RESOLVE_WORKERS):
+    """Fetches manifests concurrently. Returns ({model: (manifest, raw)}, {model: error})."""
+    manifests, errors = {}, {}
+
+    def fetch(model_name):
+        try:
+            return model_name, client.fetch_manifest(model_name), None
+        except (RegistryError, OSError) as e:
+            return model_name, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for model_name, result, error in executor.map(fetch, models):
+            if error is None:
+                manifests[model_name] = result
+            else:
+                errors[model_name] = error
+    return manifests, errors
+
+
+def build_plan(client, models, models_path, workers=DEFAULT_RESOLVE_WORKERS, log=print, blob_index=None):
+    """
+    Resolves every model's manifest and marks the digests already present on
+    disk, using the run's BlobIndex when given instead of scanning blobs/.
+    """
+    plan = PullPlan()
+    manifests, plan.errors = resolve_manifests(client, models, workers)
+    for model_name in models:
+        if model_name in manifests:
+            plan.add_model(model_name, *manifests[model_name])
+
+    if blob_index is None:
+        blob_index = BlobIndex.build(models_path)
+    plan.present = {digest for digest, layer in plan.blobs.items() if blob_index.has(digest, layer["size"])}
+
+    for model_name, error in plan.errors.items():
+        log(f"⚠️ Could not resolve manifest for {model_name}: {error}")
+    log(f"🧮 Plan: {len(plan.manifests)} manifests, {len(plan.blobs)} unique blobs "
+        f"({len(plan.shared_digests())} shared), {len(plan.present)} already present.")
+    log(f"🧮 Plan: {format_bytes(plan.fetch_bytes)} to fetch of {format_bytes(plan.requested_bytes)} requested "
+        f"— {format_bytes(plan.saved_bytes)} saved by dedup/reuse.")
+    return plan
@@ -0,0 +1,180 @@
+"""
+Streaming parser for 'ollama pull' terminal output.
+
+'ollama pull' repaints its progress display in place, even when piped:
+every frame is wrapped in synchronized-update markers (ESC[?2026h ... l),
+moves the cursor up (ESC[A), returns to column 1 (ESC[1G), rewrites each
+line and erases the rest of it (ESC[K). ProgressParser keeps a tiny model of
+that screen and turns it into typed events, emitting one only when a line's
+content actually changes, so identical spinner repaints cost almost nothing:
+
+    LayerProgress  per-layer digest, percent, bytes done/total, speed, ETA, and
+                   the step the bytes done move in (1 GB for '12 GB', refined by the
+                   percent to total/100)
+    StatusEvent    'pulling manifest', 'verifying sha256 digest', 'success', 'Error: ...'
+
+Tokenizing is a single compiled re.split per chunk, which keeps the parser
+cheap enough for thousands of frames per second across many pulls.
+"""
+import re
+import codecs
+from collections import namedtuple
+
+LayerProgress = namedtuple("LayerProgress", "digest percent completed total speed eta line step")
+StatusEvent = namedtuple("StatusEvent", "status line")
+
+# 'ollama pull' prints sizes with decimal (1000-based) units
+UNIT_BYTES = {"B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+TOKEN_RE = re.compile(r'(\x1b\[[0-9;?]*[A-Za-z]|\r|\n)')
+INCOMPLETE_ESCAPE_RE = re.compile(r'\x1b(\[[0-9;?]*)?$')
+SPINNER_RE = re.compile(r'[⠀-⣿]')
+LAYER_RE = re.compile(
+    r'^pulling ([0-9a-f]{12})\S*\s+(\d{1,3})%'      # digest prefix, percent
+    r'[^\d]*?'                                          # the ▕███  ▏ bar
+    r'(?:([\d.]+)\s*([KMGT]?B)\s*/\s*)?'                # bytes done (absent once complete)
+    r'([\d.]+)\s*([KMGT]?B)'                            # bytes total
+    r'(?:\s+([\d.]+)\s*([KMGT]?B)/s)?'                  # speed
+    r'(?:\s+((?:\d+h)?(?:\d+m)?(?:\d+s)))?')            # ETA, Go duration format
+DURATION_RE = re.compile(r'(\d+)([hms])')
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1}
+
+
+def parse_size(value, unit):
+    return int(float(value) * UNIT_BYTES[unit])
+
+
+def size_step(value, unit):
+    """Bytes one unit of the last printed digit stands for: '1.7 GB' -> 100 MB, '12 GB' -> 1 GB."""
+    decimals = len(value.partition('.')[2])
+    return max(1, UNIT_BYTES[unit] // 10 ** decimals)
+
+
+def parse_duration(text):
+    """'20m0s' -> 1200. Returns None for None/empty."""
+    if not text:
+        return None
+    return sum(int(n) * DURATION_UNITS[u] for n, u in DURATION_RE.findall(text))
+
+
+def parse_line(line):
+    """Parses one rendered line into a LayerProgress or StatusEvent (None for blank lines)."""
+    line = SPINNER_RE.sub('', line).strip()
+    if not line:
+        return None
+    match = LAYER_RE.match(line)
+    if match:
+        digest, percent, done, done_unit, total, total_unit, speed, speed_unit, eta = match.groups()
+        total_bytes = parse_size(total, total_unit)
+        if not done:
+            completed, step = total_bytes, 1
+        elif total_bytes // 100 < size_step(done, done_unit):
+            # Coarser than the percent ('12 GB' of 47 GB): count in the percent's total/100 steps
+            completed, step = total_bytes * int(percent) // 100, max(1, total_bytes // 100)
+        else:
+            completed, step = parse_size(done, done_unit), size_step(done, done_unit)
+        return LayerProgress(
+            digest, int(percent), completed, total_bytes,
+            parse_size(speed, speed_unit) if speed else None, parse_duration(eta), line, step)
+    return StatusEvent(line, line)
+
+
+class ProgressParser:
+    """
+    Incremental parser for one pull's output stream. feed() accepts raw bytes
+    (or str) in arbitrary chunks and returns the events completed by them.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''      # incomplete escape sequence carried to the next chunk
+        self._row = 0
+        self._buffer = ''       # text written to the current row since column 1
+        self._rendered = {}     # row -> last text we parsed for it
+        self.layers = {}        # digest prefix -> latest LayerProgress
+        self.status = None
+
+    def feed(self, data):
+        text = self._decoder.decode(data) if isinstance(data, bytes) else data
+        text = self._pending + text
+        self._pending = ''
+        tail = INCOMPLETE_ESCAPE_RE.search(text)
+        if tail:
+            self._pending = text[tail.start():]
+            text = text[:tail.start()]
+
+        events = []
+        for token in TOKEN_RE.split(text):
+            if not token:
+                continue
+            if token == '\n':
+                self._commit(events)
+                self._row += 1
+                self._buffer = ''
+            elif token == '\r':
+                self._buffer = ''
+            elif token[0] == '\x1b':
+                self._control(token, events)
+            else:
+                self._buffer += token
+        return events
+
+    def close(self):
+        """Flushes whatever is left on the current row at end of stream."""
+        events = []
+        self._commit(events)
+        return events
+
+    def _control(self, seq, events):
+        final = seq[-1]
+        if final == 'A':
+            # Cursor up: the current row is finished, redraw starts higher up
+            self._commit(events)
+            count = seq[2:-1]
+            self._row = max(0, self._row - (int(count) if count.isdigit() else 1))
+            self._buffer = ''
+        elif final == 'G':
+            self._buffer = ''
+        elif seq == '\x1b[?2026l':
+            # End of a synchronized frame: everything on screen is final
+            self._commit(events)
+        # ESC[K (erase to end of line), cursor visibility, etc. need no action
+
+    def _commit(self, events):
+        text = self._buffer
+        if not text.strip() or self._rendered.get(self._row) == text:
+            return
+        self._rendered[self._row] = text
+        event = parse_line(text)
+        if event is None:
+            return
+        if isinstance(event, LayerProgress):
+            previous = self.layers.get(event.digest)
+            if previous is not None and previous[:4] == event[:4]:
+                return
+            self.layers[event.digest] = event
+        else:
+            if event.status == self.status:
+                return
+            self.status = event.status
+        events.append(event)
+
+    # ─── AGGREGATES ────────────────────────────────────────────
+    @property
+    def completed_bytes(self):
+        return sum(layer.completed for layer in self.layers.values())
+
+    @property
+    def total_bytes(self):
+        return sum(layer.total for layer in self.layers.values())
+
+    @property
+    def resolution(self):
+        """The coarsest step among the layers still downloading: bytes that can arrive unseen."""
+        return max((layer.step for layer in self.layers.values() if layer.completed < layer.total), default=0)
+
+    @property
+    def percent(self):
+        """Byte-weighted progress across every layer seen so far."""
+        total = self.total_bytes
+        return int(self.completed_bytes * 100 / total) if total else 0
@@ -0,0 +1,128 @@
+"""
+Run log sink that keeps 'ollama pull' output meaningful and small.
+
+Raw pull output is almost entirely identical spinner and progress repaints
+(one 47 GB pull left ~21,500 lines in ollama_log_20250419_145312.txt).
+PullLogWriter receives the parsed events from ProgressParser instead:
+
+    - status changes ('pulling manifest', 'verifying sha256 digest', errors) are always written
+    - per-layer progress is collapsed to one sample per layer every `sample_interval`
+      seconds, plus the first and final sample of each layer
+    - the log rotates once a segment reaches `max_bytes`; closed segments are
+      compressed (gzip, or zstd when the 'zstandard' package is installed)
+      on a background thread so the event loop never waits on the compressor
+
+It is also file-like (write/flush/close), so the script's log() writes through it.
+"""
+import os
+import gzip
+import time
+import shutil
+import threading
+from datetime import datetime
+
+from .progress import LayerProgress
+
+try:
+    import zstandard
+except ImportError:  # Optional: gzip is always available
+    zstandard = None
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SAMPLE_INTERVAL_SEC = 30
+
+
+class PullLogWriter:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, compression="gzip",
+                 sample_interval=DEFAULT_SAMPLE_INTERVAL_SEC, encoding='utf-8'):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown log compression '{compression}' (choose from {', '.join(COMPRESSIONS)})")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.sample_interval = sample_interval
+        self.encoding = encoding
+        self.segments = []         # Paths of rotated (and compressed) segments
+        self.events_seen = 0
+        self.events_written = 0
+        self._segment = 0
+        self._size = 0
+        self._samples = {}         # (model, digest) -> (monotonic time, percent) of the last sample written
+        self._compressors = []
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding=encoding)
+
+    # ─── FILE-LIKE ─────────────────────────────────────────────
+    def write(self, text):
+        with self._lock:
+            self._file.write(text)
+            self._size += len(text.encode(self.encoding, errors='replace'))
+            if self.max_bytes and self._size >= self.max_bytes:
+                self._rotate()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        for thread in self._compressors:
+            thread.join()
+
+    # ─── PULL EVENTS ───────────────────────────────────────────
+    def record(self, model_name, event):
+        """Writes a parsed pull event if it carries new information."""
+        self.events_seen += 1
+        if isinstance(event, LayerProgress):
+            key = (model_name, event.digest)
+            now = time.monotonic()
+            last = self._samples.get(key)
+            final = event.completed >= event.total
+            if last is not None and not (final and last[1] < 100) and now - last[0] < self.sample_interval:
+                return
+            self._samples[key] = (now, 100 if final else event.percent)
+        self.events_written += 1
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.write(f"[{timestamp}] [{model_name}] {event.line}\n")
+
+    def stats(self):
+        return {
+            "events_seen": self.events_seen, "events_written": self.events_written,
+            "rotated_segments": len(self.segments), "compression": self.compression,
+        }
+
+    # ─── ROTATION ──────────────────────────────────────────────
+    def _rotate(self):
+        """Closes the current segment, hands it to a compressor thread and reopens `path`. Lock held."""
+        self._file.close()
+        self._segment += 1
+        base, ext = os.path.splitext(self.path)
+        closed = f"{base}.{self._segment}{ext}"
+        os.replace(self.path, closed)
+        self._file = open(self.path, "w", encoding=self.encoding)
+        self._size = 0
+        if self.compression == "none":
+            self.segments.append(closed)
+            return
+        target = closed + (".zst" if self.compression == "zstd" and zstandard else ".gz")
+        self.segments.append(target)
+        thread = threading.Thread(target=compress_file, args=(closed, target), daemon=True)
+        thread.start()
+        self._compressors = [t for t in self._compressors if t.is_alive()] + [thread]
+
+
+def compress_file(source, target):
+    """Compresses source into target (by extension: .zst or .gz) and removes source."""
+    tmp = target + ".tmp"
+    with open(source, "rb") as src:
+        if target.endswith(".zst"):
+            with open(tmp, "wb") as dst:
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+        else:
+            with gzip.open(tmp, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp, target)
+    os.remove(source)
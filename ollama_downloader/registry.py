@@ -0,0 +1,365 @@
+"""
+Native pull engine for the Ollama registry.
+
+Resolves a model's manifest, splits every layer blob into byte ranges and
+fetches them over a pool of keep-alive connections, then writes sha256-*
+blobs and the manifest into an OLLAMA_MODELS directory using the layout the
+Ollama server expects. Point base_url at any server that speaks the same
+/v2/<namespace>/<model>/{manifests,blobs} API to pull from a local stand-in.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import http.client
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from urllib.parse import urlsplit, urljoin
+
+from . import store
+
+DEFAULT_REGISTRY = "https://registry.ollama.ai"
+MANIFEST_ACCEPT = "application/vnd.docker.distribution.manifest.v2+json"
+DEFAULT_CONNECTIONS = 8
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_RETRIES = 4
+DEFAULT_TIMEOUT = 60
+READ_BLOCK_SIZE = 1024 * 1024
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+RANGES_SUFFIX = ".ranges"
+
+
+class RegistryError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status  # HTTP status, when the registry answered with an error
+
+
+class PullStopped(Exception):
+    """A pull's stop event was set; ranges already written are kept for resuming."""
+
+
+# ─── CONNECTION POOL ───────────────────────────────────────────
+class ConnectionPool:
+    """Thread-safe pool of keep-alive http.client connections, keyed by scheme and host."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _new_connection(self, key):
+        scheme, netloc = key
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return cls(netloc, timeout=self.timeout)
+
+    def _acquire(self, key):
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop(), True
+        return self._new_connection(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            self._idle[key].append(conn)
+
+    def _send(self, key, method, path, body, headers):
+        conn, reused = self._acquire(key)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection; retry once on a fresh one
+        conn = self._new_connection(key)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    @contextmanager
+    def request(self, method, url, headers=None, body=None, max_redirects=5):
+        """
+        Sends a request, following redirects, and yields the response (with a
+        .url attribute holding the final URL). HTTP errors raise RegistryError.
+        The connection goes back to the pool once the body has been fully read.
+        """
+        headers = dict(headers or {})
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+            conn, resp = self._send(key, method, path, body, headers)
+
+            if resp.status in REDIRECT_CODES and resp.getheader('Location'):
+                resp.read()
+                self._finish(key, conn, resp)
+                url = urljoin(url, resp.getheader('Location'))
+                continue
+
+            if resp.status >= 400:
+                detail = resp.read(512).decode('utf-8', errors='replace').strip()
+                conn.close()
+                raise RegistryError(f"{method} {url} failed: HTTP {resp.status} {resp.reason} {detail}".strip(), resp.status)
+
+            resp.url = url
+            try:
+                yield resp
+            finally:
+                self._finish(key, conn, resp)
+            return
+        raise RegistryError(f"{method} {url}: too many redirects")
+
+    def _finish(self, key, conn, resp):
+        if resp.isclosed() and not resp.will_close:
+            self._release(key, conn)
+        else:
+            # Unread body or server asked to close: the connection can't be reused
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+# ─── REGISTRY CLIENT ───────────────────────────────────────────
+class RegistryClient:
+    """
+    Pulls models from an OCI-style registry. Each layer is fetched as
+    chunk_size byte ranges spread over `connections` parallel requests;
+    interrupted downloads resume from the completed ranges recorded next to
+    the '-partial' file. With a DigestCache, the sha256 computed for each
+    downloaded blob is recorded so later verification doesn't re-read it.
+    With a BandwidthLimiter, every block read is charged to the run-wide
+    budget, so all connections of all pulls share one rate. `peers` returns
+    base URLs of other hosts' blob servers (see blobserver.py); a layer one
+    of them has is copied from it, outside the budget, before the registry
+    is asked.
+    """
+
+    def __init__(self, base_url=DEFAULT_REGISTRY, connections=DEFAULT_CONNECTIONS,
+                 chunk_size=DEFAULT_CHUNK_SIZE, retries=DEFAULT_RETRIES, pool=None, digest_cache=None, limiter=None,
+                 peers=None):
+        self.base_url = base_url.rstrip('/')
+        self.connections = max(1, connections)
+        self.chunk_size = max(READ_BLOCK_SIZE, chunk_size)
+        self.retries = retries
+        self.pool = pool or ConnectionPool()
+        self.digest_cache = digest_cache
+        self.limiter = limiter
+        self.peers = peers
+        self._blob_locks = defaultdict(threading.Lock)
+        self._blob_locks_guard = threading.Lock()
+
+    def _repository_url(self, model_name):
+        host, namespace, model, _ = store.parse_model_name(model_name)
+        base = self.base_url if host == store.REGISTRY_HOST else f"https://{host}"
+        return f"{base}/v2/{namespace}/{model}"
+
+    def manifest_url(self, model_name, reference=None):
+        """URL of the model's manifest at its tag, or at `reference` (a tag or digest) when given."""
+        reference = reference or store.parse_model_name(model_name)[3]
+        return f"{self._repository_url(model_name)}/manifests/{reference}"
+
+    def blob_url(self, model_name, digest):
+        return f"{self._repository_url(model_name)}/blobs/{digest}"
+
+    @staticmethod
+    def peer_blob_url(peer, model_name, digest):
+        _, namespace, model, _ = store.parse_model_name(model_name)
+        return f"{peer.rstrip('/')}/v2/{namespace}/{model}/blobs/{digest}"
+
+    def fetch_manifest(self, model_name, reference=None):
+        """Returns (manifest_dict, raw_bytes) for a model reference, or for its repository at `reference`."""
+        url = self.manifest_url(model_name, reference)
+        with self.pool.request('GET', url, headers={'Accept': MANIFEST_ACCEPT}) as resp:
+            raw = resp.read()
+        try:
+            manifest = json.loads(raw)
+        except ValueError as e:
+            raise RegistryError(f"Invalid manifest for {model_name}: {e}")
+        if "layers" not in manifest:
+            raise RegistryError(f"Manifest for {model_name} has no layers")
+        return manifest, raw
+
+    # ─── BLOBS ─────────────────────────────────────────────────
+    def _fetch_range(self, url, fd, start, end, progress, digest, from_peer=False, on_written=None, stop=None):
+        """
+        Fetches bytes [start, end] into fd at the same offset, retrying with
+        backoff (once for a peer). Raises PullStopped between blocks once
+        `stop` is set.
+        """
+        offset = start
+        retries = min(1, self.retries) if from_peer else self.retries
+        for attempt in range(retries + 1):
+            if stop is not None and stop.is_set():
+                raise PullStopped(digest)
+            try:
+                headers = {'Range': f"bytes={offset}-{end}"}
+                with self.pool.request('GET', url, headers=headers) as resp:
+                    if resp.status != 206 and offset != 0:
+                        raise RegistryError(f"Server ignored range request for {digest} (HTTP {resp.status})")
+                    while offset <= end:
+                        if stop is not None and stop.is_set():
+                            raise PullStopped(digest)
+                        block = resp.read(min(READ_BLOCK_SIZE, end - offset + 1))
+                        if not block:
+                            break
+                        if self.limiter and not from_peer:
+                            self.limiter.consume(len(block))
+                        os.pwrite(fd, block, offset)
+                        if on_written:
+                            on_written(offset, offset + len(block) - 1)
+                        offset += len(block)
+                        if progress:
+                            progress(digest, len(block))
+                if offset > end:
+                    return
+                raise RegistryError(f"Short read for {digest} at byte {offset}")
+            except (RegistryError, http.client.HTTPException, OSError):
+                if attempt >= retries:
+                    raise
+                time.sleep(min(30, 2 ** attempt))
+
+    def download_blob(self, model_name, layer, models_path, progress=None, on_written=None, stop=None):
+        """
+        Downloads one layer into <models>/blobs unless it is already present.
+        Returns (bytes fetched over the network, peer URL or None for the
+        registry). Concurrent pulls sharing a layer wait for the first one
+        instead of fetching it twice. on_written(start, end) is called as byte
+        ranges land in the '-partial' file (in order within each chunk of
+        chunk_size, starting with chunks kept from an interrupted download), so
+        readers can follow the download. Once `stop` (a threading.Event) is
+        set, raises PullStopped at the next block.
+        """
+        with self._blob_locks_guard:
+            blob_lock = self._blob_locks[(models_path, layer["digest"])]
+        with blob_lock:
+            return self._download_blob(model_name, layer, models_path, progress, on_written, stop)
+
+    def _peer_with(self, model_name, layer):
+        """Blob URLs of peers that have the complete layer."""
+        for peer in (self.peers() if self.peers else ()):
+            url = self.peer_blob_url(peer, model_name, layer["digest"])
+            try:
+                with self.pool.request('HEAD', url) as resp:
+                    resp.read()
+                    if int(resp.getheader('Content-Length', -1)) == layer["size"]:
+                        yield peer, url
+            except (RegistryError, http.client.HTTPException, OSError, ValueError):
+                continue
+
+    def _download_blob(self, model_name, layer, models_path, progress, on_written=None, stop=None):
+        dest = store.blob_path(models_path, layer["digest"])
+        if os.path.exists(dest) and os.path.getsize(dest) == layer["size"]:
+            return 0, None
+        for peer, url in self._peer_with(model_name, layer):
+            try:
+                return self._fetch_blob(url, layer, models_path, progress, on_written, from_peer=True, stop=stop), peer
+            except (RegistryError, http.client.HTTPException, OSError):
+                continue  # Next peer, then the registry; ranges already written are kept
+        return (self._fetch_blob(self.blob_url(model_name, layer["digest"]), layer, models_path, progress, on_written,
+                                 stop=stop), None)
+
+    def _fetch_blob(self, url, layer, models_path, progress, on_written=None, from_peer=False, stop=None):
+        digest, size = layer["digest"], layer["size"]
+        dest = store.blob_path(models_path, digest)
+        os.makedirs(store.blobs_dir(models_path), exist_ok=True)
+        partial = store.partial_blob_path(models_path, digest)
+        ranges_file = partial + RANGES_SUFFIX
+        done = set()
+        if os.path.exists(partial) and os.path.exists(ranges_file):
+            try:
+                with open(ranges_file, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                if saved.get("chunk_size") == self.chunk_size:
+                    done = set(saved.get("done", []))
+            except (OSError, ValueError):
+                done = set()
+
+        chunks = [(start, min(start + self.chunk_size, size) - 1)
+                  for start in range(0, size, self.chunk_size) if start not in done]
+        if on_written:
+            for start in sorted(done):
+                on_written(start, min(start + self.chunk_size, size) - 1)
+        lock = threading.Lock()
+        fetched = 0
+
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch(chunk):
+                nonlocal fetched
+                start, end = chunk
+                self._fetch_range(url, fd, start, end, progress, digest, from_peer, on_written, stop)
+                with lock:
+                    fetched += end - start + 1
+                    done.add(start)
+                    store.write_file_atomic(ranges_file, json.dumps(
+                        {"chunk_size": self.chunk_size, "done": sorted(done)}).encode('utf-8'))
+
+            if len(chunks) == 1:
+                fetch(chunks[0])
+            elif chunks:
+                with ThreadPoolExecutor(max_workers=min(self.connections, len(chunks))) as executor:
+                    # list() re-raises the first failed range
+                    list(executor.map(fetch, chunks))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        actual = store.sha256_file(partial)
+        if actual != digest:
+            os.remove(partial)
+            if os.path.exists(ranges_file):
+                os.remove(ranges_file)
+            raise RegistryError(f"Digest mismatch for {digest}: got {actual}")
+        os.replace(partial, dest)
+        if self.digest_cache is not None:
+            self.digest_cache.record(dest, actual.split(':', 1)[1], size)
+        if os.path.exists(ranges_file):
+            os.remove(ranges_file)
+        return fetched
+
+    def pull(self, model_name, models_path, progress=None, manifest=None, raw_manifest=None, stop=None):
+        """
+        Pulls every blob of a model and then writes its manifest, so the model
+        only becomes visible to the server once all layers are in place.
+        Returns a summary dict of digest, size and bytes downloaded/reused.
+        Setting `stop` (a threading.Event) makes it raise PullStopped at the
+        next block of every connection.
+        """
+        if manifest is None or raw_manifest is None:
+            manifest, raw_manifest = self.fetch_manifest(model_name)
+
+        downloaded = from_peers = 0
+        layers = store.manifest_layers(manifest)
+        for layer in layers:
+            fetched, peer = self.download_blob(model_name, layer, models_path, progress, stop=stop)
+            downloaded += fetched
+            if peer is not None:
+                from_peers += fetched
+        store.write_manifest(models_path, model_name, raw_manifest)
+
+        total = store.manifest_size(manifest)
+        return {
+            "manifest_digest": "sha256:" + hashlib.sha256(raw_manifest).hexdigest(),
+            "layers": len(layers),
+            "size_bytes": total,
+            "bytes_downloaded": downloaded,
+            "bytes_from_peers": from_peers,
+            "bytes_reused": total - downloaded,
+        }
+
+    def close(self):
+        self.pool.close()
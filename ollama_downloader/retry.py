@@ -0,0 +1,40 @@
+"""
+In-run retries for failed pulls.
+
+A pull that ends timed_out, stalled or failed goes back to the orchestrator
+with an exponential, jittered backoff instead of waiting for the next run of
+the script. Once its backoff expires it is dispatched ahead of the pending
+queue, so it resumes its -partial blobs while they are still in page cache.
+Failures that another attempt can't fix (unknown model, bad digest) are not
+retried.
+"""
+import random
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY_SEC = 30
+DEFAULT_MAX_DELAY_SEC = 600
+DEFAULT_JITTER = 0.5
+
+RETRYABLE_PREFIXES = ("timed_out", "stalled", "failed")
+PERMANENT_ERRORS = ("file does not exist", "HTTP 404", "HTTP 401", "HTTP 403", "Digest mismatch", "Invalid manifest")
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY_SEC,
+                 max_delay=DEFAULT_MAX_DELAY_SEC, jitter=DEFAULT_JITTER):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def should_retry(self, attempt, status, entry):
+        """True if a pull that ended with `status` on its `attempt`-th try deserves another one."""
+        if attempt >= self.max_attempts or not status.startswith(RETRYABLE_PREFIXES):
+            return False
+        text = " ".join([status] + list(entry.get("log_tail", ())))
+        return not any(error in text for error in PERMANENT_ERRORS)
+
+    def delay(self, attempt):
+        """Backoff before attempt `attempt + 1`: base * 2^(attempt-1), capped, minus up to `jitter` of it."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1)
@@ -0,0 +1,147 @@
+"""
+Helpers for the on-disk layout of an Ollama model store (OLLAMA_MODELS):
+
+    <models>/blobs/sha256-<hex>
+    <models>/manifests/<host>/<namespace>/<model>/<tag>
+"""
+import os
+import json
+import hashlib
+import tempfile
+
+REGISTRY_HOST = "registry.ollama.ai"
+DEFAULT_NAMESPACE = "library"
+DEFAULT_TAG = "latest"
+PARTIAL_SUFFIX = "-partial"
+CORRUPT_SUFFIX = ".corrupt"  # Blobs --verify set aside because their sha256 didn't match
+
+
+def parse_model_name(model_name):
+    """
+    Splits a model reference like 'qwen3:0.6b' or 'user/model:tag' into
+    (host, namespace, model, tag), filling in Ollama's defaults.
+    """
+    name, tag = model_name, DEFAULT_TAG
+    # The tag separator is the last ':' after the last '/', so 'host:port/...' survives
+    colon = name.rfind(':')
+    if colon > name.rfind('/'):
+        name, tag = name[:colon], name[colon + 1:]
+
+    parts = name.split('/')
+    if len(parts) == 1:
+        return REGISTRY_HOST, DEFAULT_NAMESPACE, parts[0], tag
+    if len(parts) == 2:
+        return REGISTRY_HOST, parts[0], parts[1], tag
+    return parts[0], '/'.join(parts[1:-1]), parts[-1], tag
+
+
+def display_name(host, namespace, model, tag):
+    """Inverse of parse_model_name, shortened the same way 'ollama list' prints names."""
+    if host == REGISTRY_HOST and namespace == DEFAULT_NAMESPACE:
+        return f"{model}:{tag}"
+    if host == REGISTRY_HOST:
+        return f"{namespace}/{model}:{tag}"
+    return f"{host}/{namespace}/{model}:{tag}"
+
+
+def normalize_model_name(model_name):
+    """Returns the fully tagged name ('llama2' -> 'llama2:latest') used by 'ollama list'."""
+    return display_name(*parse_model_name(model_name))
+
+
+# ─── BLOBS ─────────────────────────────────────────────────────
+def blobs_dir(models_path):
+    return os.path.join(models_path, "blobs")
+
+
+def blob_filename(digest):
+    """'sha256:abc...' -> 'sha256-abc...'"""
+    return digest.replace(':', '-', 1)
+
+
+def digest_from_filename(filename):
+    """
+    'sha256-abc...' -> 'sha256:abc...'. Returns None for anything that is not a
+    complete blob (including '-partial' download files).
+    """
+    if not filename.startswith("sha256-") or PARTIAL_SUFFIX in filename:
+        return None
+    hexdigest = filename[len("sha256-"):]
+    if len(hexdigest) != 64:
+        return None
+    return "sha256:" + hexdigest
+
+
+def blob_path(models_path, digest):
+    return os.path.join(blobs_dir(models_path), blob_filename(digest))
+
+
+def partial_blob_path(models_path, digest):
+    return blob_path(models_path, digest) + PARTIAL_SUFFIX
+
+
+def sha256_file(path, block_size=8 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return "sha256:" + h.hexdigest()
+
+
+# ─── MANIFESTS ─────────────────────────────────────────────────
+def manifests_dir(models_path):
+    return os.path.join(models_path, "manifests")
+
+
+def manifest_path(models_path, model_name):
+    host, namespace, model, tag = parse_model_name(model_name)
+    return os.path.join(manifests_dir(models_path), host, *namespace.split('/'), model, tag)
+
+
+def read_manifest(path):
+    """Returns the parsed manifest at path, or None if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_layers(manifest):
+    """All blobs a manifest references: the config blob followed by its layers."""
+    layers = []
+    if manifest.get("config", {}).get("digest"):
+        layers.append(manifest["config"])
+    layers.extend(manifest.get("layers", []))
+    return layers
+
+
+def manifest_size(manifest):
+    return sum(layer.get("size", 0) for layer in manifest_layers(manifest))
+
+
+def write_file_atomic(path, data):
+    """Writes bytes to path through a temp file + rename so readers never see a torn file."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_manifest(models_path, model_name, raw_manifest):
+    """Stores the manifest bytes exactly as served by the registry."""
+    path = manifest_path(models_path, model_name)
+    write_file_atomic(path, raw_manifest)
+    return path
@@ -0,0 +1,148 @@
+"""
+Manifest-driven integrity checks for installed models.
+
+A model is intact when its manifest parses and every layer it references
+(config included) exists in <models>/blobs with exactly the size the
+manifest records. Optionally each referenced blob is re-hashed with sha256;
+hashing reads blobs through mmap in a process pool, one blob per worker, so
+a large store is verified at disk bandwidth instead of one core's hashing
+speed. Blobs shared between models are checked and hashed once, and with a
+DigestCache only blobs that are new or changed since they were last hashed
+are read at all.
+"""
+import os
+import mmap
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import store
+
+HASH_SLICE = 64 * 1024 * 1024
+
+
+def hash_blob(path):
+    """sha256 hex digest of a file, read through mmap. Runs in pool workers."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, HASH_SLICE):
+                    digest.update(view[offset:offset + HASH_SLICE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def new_result(model_name):
+    return {"model": model_name, "ok": False, "manifest_missing": False, "layers": 0,
+            "missing": [], "size_mismatch": [], "hash_mismatch": []}
+
+
+def check_model_sizes(models_path, model_name):
+    """
+    Presence and exact-size check of every layer in the model's manifest.
+    Returns (result, layers); `layers` is empty when the manifest is missing.
+    """
+    result = new_result(model_name)
+    manifest = store.read_manifest(store.manifest_path(models_path, model_name))
+    if manifest is None:
+        result["manifest_missing"] = True
+        return result, []
+    layers = store.manifest_layers(manifest)
+    result["layers"] = len(layers)
+    for layer in layers:
+        try:
+            size = os.stat(store.blob_path(models_path, layer["digest"])).st_size
+        except (FileNotFoundError, ValueError):
+            result["missing"].append(layer["digest"])
+            continue
+        if size != layer.get("size"):
+            result["size_mismatch"].append(layer["digest"])
+    result["ok"] = not (result["missing"] or result["size_mismatch"])
+    return result, layers
+
+
+def hash_digests(models_path, digests, workers=None, cache=None):
+    """
+    {digest: True/False} for whether each blob's sha256 matches its name.
+    Blobs the cache already knows are answered from it; the rest are hashed
+    in a process pool and recorded in the cache.
+    """
+    matches, to_hash = {}, []
+    for digest in digests:
+        path = store.blob_path(models_path, digest)
+        try:
+            known = cache.lookup(path) if cache is not None else None
+        except OSError:
+            matches[digest] = False
+            continue
+        if known is None:
+            to_hash.append(digest)
+        else:
+            matches[digest] = "sha256:" + known == digest
+    if not to_hash:
+        return matches
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(to_hash)))) as pool:
+        futures = {pool.submit(hash_blob, store.blob_path(models_path, digest)): digest for digest in to_hash}
+        for future in as_completed(futures):
+            digest = futures[future]
+            path = store.blob_path(models_path, digest)
+            try:
+                hexdigest = future.result()
+                if cache is not None:
+                    cache.record(path, hexdigest, os.stat(path).st_size)
+            except OSError:
+                matches[digest] = False
+                continue
+            matches[digest] = "sha256:" + hexdigest == digest
+    return matches
+
+
+def verify_models(models_path, model_names, hash_blobs=False, workers=None, cache=None):
+    """
+    Verifies each model; with hash_blobs, re-hashes every referenced blob that
+    passed the size check (each unique digest once). Returns {model: result}.
+    """
+    results, model_layers = {}, {}
+    for model_name in model_names:
+        results[model_name], model_layers[model_name] = check_model_sizes(models_path, model_name)
+    if not hash_blobs:
+        return results
+
+    to_hash = {}
+    for model_name, layers in model_layers.items():
+        bad = set(results[model_name]["missing"]) | set(results[model_name]["size_mismatch"])
+        for layer in layers:
+            if layer["digest"] not in bad:
+                to_hash[layer["digest"]] = True
+    matches = hash_digests(models_path, list(to_hash), workers, cache)
+    for model_name, layers in model_layers.items():
+        result = results[model_name]
+        result["hash_mismatch"] = [layer["digest"] for layer in layers if matches.get(layer["digest"]) is False]
+        result["ok"] = result["ok"] and not result["hash_mismatch"]
+    return results
+
+
+def verify_model(models_path, model_name, hash_blobs=False, workers=None, cache=None):
+    return verify_models(models_path, [model_name], hash_blobs, workers, cache)[model_name]
+
+
+def describe(result):
+    """One-line summary of what is wrong with a model, for logs."""
+    if result["ok"]:
+        return f"all {result['layers']} layers intact"
+    if result["manifest_missing"]:
+        return "manifest missing or unreadable"
+    problems = []
+    for key, label in (("missing", "missing"), ("size_mismatch", "wrong size"), ("hash_mismatch", "bad sha256")):
+        if result[key]:
+            problems.append(f"{len(result[key])} {label} ({', '.join(d[7:19] for d in result[key][:3])})")
+    return f"{'; '.join(problems)} of {result['layers']} layers"
@@ -0,0 +1,98 @@
+"""
+Throughput-based liveness checks for running pulls.
+
+The orchestrator runs one watchdog task per pull next to the output reader,
+so it fires even when 'ollama pull' goes completely silent. While layers are
+downloading, liveness means bytes actually arriving: a pull is stalled when
+no byte arrives for `stall_timeout`, or when its rate over the last
+`window_sec` stays under `min_bytes_per_sec` once `grace_sec` has passed.
+Spinner and progress repaints with an unchanged byte count don't count.
+'ollama pull' prints large sizes coarsely ('12 GB/ 47 GB' moves in 1 GB
+steps, the percent in total/100), so the count can lag the real bytes by up
+to one step: given that `resolution`, the rate window is stretched to two
+steps at the floor rate (never past `stall_timeout`) and the rate is
+credited one step. `stall_timeout` itself is never stretched.
+Outside the download phase (resolving the manifest, verifying digests,
+writing the manifest) bytes are not expected, so any new progress event
+counts as activity there.
+"""
+from collections import deque
+
+DEFAULT_WINDOW_SEC = 60
+DEFAULT_GRACE_SEC = 120
+DEFAULT_MIN_BYTES_PER_SEC = 1000 ** 2   # 1 MB/s; a healthy pull runs at tens of MB/s
+DEFAULT_CHECK_INTERVAL_SEC = 1.0
+DEFAULT_MAX_RESTARTS = 2
+
+
+class ThroughputWatchdog:
+    """
+    Call activity() on every progress event and check() periodically with the
+    job's cumulative byte count. check() returns None while the pull is alive,
+    or (status, reason) with status "timed_out" (deadline) or "stalled",
+    which is also kept in `verdict`.
+    """
+
+    def __init__(self, stall_timeout, window_sec=DEFAULT_WINDOW_SEC, grace_sec=DEFAULT_GRACE_SEC,
+                 min_bytes_per_sec=DEFAULT_MIN_BYTES_PER_SEC, deadline=None):
+        self.stall_timeout = stall_timeout
+        self.window_sec = window_sec
+        self.grace_sec = grace_sec
+        self.min_bytes_per_sec = min_bytes_per_sec
+        self.deadline = deadline
+        self.samples = deque()       # (time, bytes_done) within the window
+        self.verdict = None
+        self._started = None
+        self._phase_start = None     # when the current download phase began
+        self._last_activity = None
+        self._last_bytes = None
+        self._last_increase = None
+
+    def start(self, now, bytes_done=0):
+        self._started = self._last_activity = now
+        self._last_bytes = bytes_done
+
+    def activity(self, now):
+        self._last_activity = now
+
+    def check(self, now, bytes_done, downloading, resolution=0):
+        self.verdict = self._judge(now, bytes_done, downloading, resolution)
+        return self.verdict
+
+    def _judge(self, now, bytes_done, downloading, resolution):
+        if self.deadline is not None and now - self._started >= self.deadline:
+            return "timed_out", f"Job deadline of {self.deadline}s exceeded"
+
+        if not downloading:
+            self._phase_start = None
+            self.samples.clear()
+            if now - self._last_activity >= self.stall_timeout:
+                return "stalled", f"No progress or output update in {self.stall_timeout}s"
+            return None
+
+        if self._phase_start is None:
+            # Entering (or re-entering) the download phase: judge it from here
+            self._phase_start = self._last_increase = now
+        if bytes_done > self._last_bytes:
+            self._last_bytes = bytes_done
+            self._last_increase = now
+        self.samples.append((now, bytes_done))
+        step_sec = 2 * resolution / self.min_bytes_per_sec if self.min_bytes_per_sec else 0
+        window = max(self.window_sec, min(step_sec, self.stall_timeout))
+        # Keep one sample at or before the window start so the rate spans the whole window
+        while len(self.samples) > 1 and now - self.samples[1][0] >= window:
+            self.samples.popleft()
+
+        if now - self._last_increase >= self.stall_timeout:
+            return "stalled", f"No bytes received in {self.stall_timeout}s"
+        if not self.min_bytes_per_sec or now - self._phase_start < max(self.grace_sec, window):
+            return None
+        oldest_time, oldest_bytes = self.samples[0]
+        elapsed = now - oldest_time
+        if elapsed < window * 0.9:
+            return None
+        rate = (bytes_done - oldest_bytes + resolution) / elapsed
+        if rate < self.min_bytes_per_sec:
+            return "stalled", (f"Throughput {rate / 1e6:.2f} MB/s over the last {window:.0f}s "
+                               f"is below the {self.min_bytes_per_sec / 1e6:.2f} MB/s floor")
+        return None
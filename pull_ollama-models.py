@@ -1,16 +1,28 @@
 ###CODE:
 import os
-import subprocess
 import time
-import re
 import json
 from tqdm import tqdm
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 import argparse
+import asyncio
+import socket
+import threading
 import sys # Import sys for exiting
 
+from ollama_downloader import registry, store, planner, scheduling, pulllog, retry, verify, inventory, catalog
+from ollama_downloader.admission import DiskAdmission, DEFAULT_RESERVE_GB
+from ollama_downloader.bandwidth import BandwidthSchedule, BandwidthLimiter
+from ollama_downloader.blobserver import BlobServer, DEFAULT_SHARE_PORT
+from ollama_downloader.coordination import SharedDirCoordinator, DEFAULT_LINGER_SEC
+from ollama_downloader.blobindex import BlobIndex
+from ollama_downloader.history import RunHistory
+from ollama_downloader.digestcache import DigestCache, default_cache_path
+from ollama_downloader.ollama_api import OllamaClient, OllamaAPIError
+from ollama_downloader.orchestrator import PullJob, PullOrchestrator, DEFAULT_STALL_TIMEOUT_SEC
+from ollama_downloader.concurrency import AdaptiveConcurrency
+
 # ─── CONFIGURATION ─────────────────────────────────────────────
 # NOTE: Ensure this path is correct for your system AND that your Ollama server is configured to use it.
 OLLAMA_MODELS_PATH = '/data/wdblue8tb/ollama'
@@ -26,59 +38,81 @@ os.environ['OLLAMA_MODELS'] = OLLAMA_MODELS_PATH
 LOG_FILE = f"ollama_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
 METADATA_JSON = "model_metadata.json"
 METADATA_TXT = "model_report.txt"
+RUN_METADATA_KEY = "__run__" # Run-level entry in the metadata dict (not a model)
+HISTORY_DB = "model_history.sqlite" # Every run and attempt is kept here; the JSON/TXT reports are views of it
+# Pull output is logged as parsed events: repaints collapse into one sample per layer
+# every LOG_SAMPLE_SEC, and the log rotates at LOG_MAX_MB with closed segments compressed
+LOG_MAX_MB = pulllog.DEFAULT_MAX_BYTES // (1024 * 1024)
+LOG_COMPRESSION = "gzip" # gzip, zstd (needs the 'zstandard' package) or none
+LOG_SAMPLE_SEC = pulllog.DEFAULT_SAMPLE_INTERVAL_SEC
 # SUSPICIOUS_LOG is no longer needed as is_model_download_complete is removed
 
 FLAG_CONCURRENT = False # Set to True to enable concurrent downloads
 CONCURRENT_MAX_DOWN = 2 # Max concurrent downloads if FLAG_CONCURRENT is True
 DELAY_BETWEEN_DOWNLOADS_SEC = 5 # Delay only used when FLAG_CONCURRENT is False
-
-# ─── MODEL LIST BY VENDOR ─────────────────────────────────────
-# (Keep your existing model_groups dictionary here)
-model_groups = {
-    "llama": ["llama2", "llama3.1:8b-instruct-q4_K_M", "llama3.2:3b-instruct-q8_0", "llama3.2:3b-text-fp16", "llama3.3"],
-    "gemma": ["gemma2", "gemma3:4b-it-q8_0"],
-    "phi": [
-        "phi3.5",
-        "phi4",
-        "phi4-mini:3.8b-q4_K_M",
-        "phi4-mini:3.8b-q8_0",
-        "phi4-reasoning:14b-plus-q4_K_M",
-        "phi4-mini-reasoning:3.8b-q8_0"
-    ],
-    "deepseek": ["deepseek-r1:7b-qwen-distill-q4_K_M", "deepseek-r1:8b-llama-distill-q4_K_M"],
-    "mistral": ["mistral:7b-instruct-q4_K_M", "mistral-small3.1"],
-    "granite": [
-        "granite3-dense:8b-instruct-q4_K_M",
-        "granite3.1-dense:8b-instruct-q4_K_M",
-        "granite3.1-moe:3b-instruct-q8_0",
-        "granite3.2-vision:2b-fp16",
-        "granite3.2-vision:2b-q8_0",
-        "granite3.3",
-        "granite3.3:2b",
-        "granite3.3:8b"
-     ],
-    "qwen": [
-        "qwen3:0.6b",
-        "qwen3:1.7b",
-        "qwen3:4b",
-        "qwen3:8b-q4_K_M",
-        "qwen3:14b-q4_K_M",
-        "qwen3:32b-q4_K_M",
-        "qwen3:30b-a3b"
-    ],
-    "misc": ["athene-v2", "aya-expanse:8b-q4_K_S", "cogito", "command-r", "command-r7b:7b-12-2024-q4_K_M",
-              "deepcoder", "dolphin3:8b-llama3.1-q4_K_M", "exaone3.5:7.8b-instruct-q4_K_M", "falcon",
-              "falcon3:7b-instruct-q4_K_M", "glm4:9b-chat-q4_K_M", "hermes3:8b-llama3.1-q3_K_M",
-              "internlm2:7b-chat-1m-v2.5-q4_K_M", "marco-o1:7b-q4_K_M", "mixtral", "nemotron",
-              "nemotron-mini", "olmo2:7b-1124-instruct-q4_K_M", "openthinker:7b-q4_K_M", "qwen2.5:7b-instruct-q4_K_M",
-              "qwq", "reflection", "sailor2:8b-chat-q4_K_M", "smallthinker:3b-preview-q8_0", "smollm2",
-              "solar-pro", "tulu3:8b-q4_K_M", "vicuna", "wizardlm", "yi"]
-}
+HUNG_DETECTOR_TIMEOUT_SEC = DEFAULT_STALL_TIMEOUT_SEC # Kill a pull after this long with no bytes (or no output outside downloads)
+MIN_THROUGHPUT_MB_PER_SEC = 1.0 # Restart a pull whose rate over THROUGHPUT_WINDOW_SEC falls below this (0 = off)
+THROUGHPUT_WINDOW_SEC = 60
+STALL_GRACE_SEC = 120 # Don't judge throughput during a layer's first two minutes
+STALL_RESTARTS = 2 # Restarts per model after a stall before it is marked stalled
+RETRY_MAX_ATTEMPTS = retry.DEFAULT_MAX_ATTEMPTS # Attempts per model within a run (timed_out/stalled/failed are retried)
+RETRY_BASE_DELAY_SEC = retry.DEFAULT_BASE_DELAY_SEC # Backoff doubles per attempt, with jitter, up to RETRY_MAX_DELAY_SEC
+RETRY_MAX_DELAY_SEC = retry.DEFAULT_MAX_DELAY_SEC
+JOB_DEADLINE_SEC = None # Optional wall-clock limit per model pull (None = no limit)
+FLAG_ADAPTIVE = False # Let the AIMD controller pick concurrency, with CONCURRENT_MAX_DOWN as the ceiling
+ADAPTIVE_MIN_WORKERS = 1
+ADAPTIVE_START_WORKERS = 2
+
+# Queue order: fifo (catalog order), sjf, largest or binpack (see ollama_downloader/scheduling.py).
+# Anything but fifo resolves manifests up front to learn each model's size.
+SCHEDULE_POLICY = scheduling.DEFAULT_POLICY
+INFLIGHT_CAP_GB = 300 # binpack: max bytes still to fetch across running pulls
+ASSUMED_MB_PER_SEC = scheduling.DEFAULT_ASSUMED_MB_PER_SEC # Per-pull speed used for makespan estimates
+LINK_MB_PER_SEC = None # Optional aggregate link limit for makespan estimates (None = workers x per-pull)
+PLAN_HISTORY_DAYS = 90 # --plan: per-model speeds are medians of successful pulls in this window
+
+# Check free space on OLLAMA_MODELS_PATH before each pull: a model's missing layers must fit
+# above DISK_RESERVE_GB after what running pulls have reserved (needs manifests up front, like sjf)
+FLAG_DISK_CHECK = True
+DISK_RESERVE_GB = DEFAULT_RESERVE_GB
+
+# Run-wide bandwidth budget in MB/s, shared by all concurrent pulls; the rate follows the clock
+# (see ollama_downloader/bandwidth.py), e.g. ["mon-fri@08:00-19:00=20"] = 20 MB/s on weekday daytimes.
+# Needs PULL_ENGINE = "native"
+BANDWIDTH_RULES = []
+
+# Before skipping an installed model, optionally check its manifest layers on disk:
+# "size" (presence + exact size) or "sha256" (also re-hash every blob across all cores)
+VERIFY_MODE = "off"
+DIGEST_CACHE_FILE = default_cache_path(OLLAMA_MODELS_PATH) # sha256 per (dev, inode, size, mtime); unchanged blobs aren't re-read
+
+# Pull engine: "ollama" shells out to 'ollama pull'; "api" streams /api/pull from the
+# server over a pooled connection; "native" uses the built-in registry client with
+# parallel ranged blob downloads (ollama_downloader/registry.py)
+PULL_ENGINE = "ollama"
+PULL_ENGINES = ("ollama", "api", "native")
+OLLAMA_HOST = None # Server for --engine api (None = $OLLAMA_HOST or 127.0.0.1:11434)
+REGISTRY_URL = registry.DEFAULT_REGISTRY # Point at a mirror or local stand-in registry
+NATIVE_CONNECTIONS = registry.DEFAULT_CONNECTIONS # Parallel range requests per blob
+NATIVE_CHUNK_MB = registry.DEFAULT_CHUNK_SIZE // (1024 * 1024)
+
+# Several hosts pulling the same catalog: each claims models in a shared directory and serves its
+# blobs on SHARE_PORT, and layers another host already has are copied over the LAN (native engine only)
+COORDINATION_DIR = None # e.g. an NFS mount every host sees
+HOST_ID = socket.gethostname()
+SHARE_PORT = DEFAULT_SHARE_PORT
+SHARE_URL = None # How peers reach this host's blob server (None = http://<fqdn>:SHARE_PORT)
+SHARE_LINGER_MIN = DEFAULT_LINGER_SEC // 60 # After its own queue, keep serving this long at most while peers still pull
+
+# ─── MODEL CATALOG ─────────────────────────────────────────────
+# Vendors, models, priorities and tags live in model_catalog.toml (see ollama_downloader/catalog.py).
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_catalog.toml")
 
 # ─── LOGGING SETUP ─────────────────────────────────────────────
 log_file = None
 try:
-    log_file = open(LOG_FILE, "w", encoding='utf-8')
+    log_file = pulllog.PullLogWriter(LOG_FILE, max_bytes=LOG_MAX_MB * 1024 * 1024, compression=LOG_COMPRESSION,
+                                     sample_interval=LOG_SAMPLE_SEC)
 except IOError as e:
     print(f"🛑 ERROR: Cannot open log file: {e}")
     sys.exit(1) # Exit if logging isn't possible
@@ -93,161 +127,234 @@ def log(msg):
 
 # ─── OLLAMA INTERACTION ───────────────────────────────────────
 
-def get_ollama_list_models():
+def get_installed_models(model_names=None):
     """
-    Runs 'ollama list' and returns a set of installed model names.
-    Exits script if 'ollama list' command fails.
+    Returns the set of installed model names ('llama2:latest' style), read from
+    the manifests under OLLAMA_MODELS_PATH, or from the server API when the
+    store isn't readable here. Given model_names, only those models are looked
+    up. Exits the script if neither works.
     """
-    installed_models = set()
     try:
-        log("ℹ️ Querying Ollama server for installed models via 'ollama list'...")
-        # Use subprocess.run for simpler execution and error handling
-        result = subprocess.run(
-            ['ollama', 'list'],
-            capture_output=True,
-            text=True,
-            check=True, # Raises CalledProcessError if command returns non-zero exit code
-            encoding='utf-8',
-            errors='replace' # Handle potential encoding errors in output
-        )
-
-        lines = result.stdout.strip().split('\n')
-
-        if len(lines) <= 1:
-            log("ℹ️ 'ollama list' returned no installed models.")
-            return installed_models # Return empty set
-
-        # Skip header line (index 0)
-        for line in lines[1:]:
-            parts = line.split() # Split by whitespace
-            if parts:
-                model_name = parts[0] # First part is the model name
-                installed_models.add(model_name)
-
-        log(f"✅ Found {len(installed_models)} models installed according to 'ollama list'.")
-        return installed_models
-
-    except FileNotFoundError:
-        log("🛑 ERROR: 'ollama' command not found. Make sure Ollama is installed and in your PATH.")
-        sys.exit(1)
-    except subprocess.CalledProcessError as e:
-        log(f"🛑 ERROR: 'ollama list' command failed with exit code {e.returncode}.")
-        log(f"   Stderr: {e.stderr}")
-        log(f"   Stdout: {e.stdout}")
+        if model_names is None:
+            models, source = inventory.list_models(OLLAMA_MODELS_PATH)
+            installed = inventory.model_names(models)
+        else:
+            installed, source = inventory.installed_names(model_names, OLLAMA_MODELS_PATH)
+    except inventory.InventoryError as e:
+        log(f"🛑 ERROR: Model store '{OLLAMA_MODELS_PATH}' is not readable and the server API failed: {e}")
         log("   Please ensure the Ollama server is running and accessible.")
         sys.exit(1)
-    except Exception as e:
-        log(f"🛑 ERROR: An unexpected error occurred while running 'ollama list': {e}")
+    where = f"manifests in {OLLAMA_MODELS_PATH}" if source == "store" else "the Ollama server API"
+    scope = "installed models" if model_names is None else f"of {len(model_names)} selected models installed"
+    log(f"✅ Found {len(installed)} {scope} ({where}).")
+    return installed
+
+
+def load_selected_models(selectors):
+    """Reads CATALOG_FILE and applies the CLI selectors. Exits the script if the catalog is invalid."""
+    try:
+        entries = catalog.load_catalog(CATALOG_FILE)
+    except catalog.CatalogError as e:
+        log(f"🛑 ERROR: Invalid model catalog: {e}")
         sys.exit(1)
+    unknown = set(selectors.get("vendors") or ()) - set(catalog.vendors(entries))
+    if unknown:
+        log(f"⚠️ Unknown vendor(s) {', '.join(sorted(unknown))}; the catalog has {', '.join(catalog.vendors(entries))}.")
+    selected = catalog.select(entries, **selectors)
+    if len(selected) < len(entries):
+        log(f"🎯 Selected {len(selected)} of {len(entries)} catalog models.")
+    return selected
 
 
-# ─── UTILS ─────────────────────────────────────────────────────
-def extract_progress(text):
-    # (Keep existing extract_progress function)
-    if "pulling" in text or "downloading" in text or "verifying" in text or "using" in text:
-         match = re.search(r'(\d{1,3})\s?%', text)
-         return int(match.group(1)) if match else None
-    return None
+def find_broken_models(model_names, mode, digest_cache=None, quarantine=True):
+    """
+    Verifies installed models against their manifests and returns {model: result}
+    for the ones that fail. Unless quarantine is False, blobs whose sha256 doesn't
+    match are renamed to *.corrupt, since 'ollama pull' skips any blob file that
+    has the right size.
+    """
+    log(f"🔎 Verifying {len(model_names)} installed models ({mode})...")
+    start = time.time()
+    results = verify.verify_models(OLLAMA_MODELS_PATH, model_names, hash_blobs=(mode == "sha256"), cache=digest_cache)
+    broken = {m: r for m, r in results.items() if not r["ok"]}
+    for model_name, result in broken.items():
+        log(f"⚠️ {model_name}: {verify.describe(result)}")
+    for digest in {d for r in broken.values() for d in r["hash_mismatch"]} if quarantine else ():
+        path = store.blob_path(OLLAMA_MODELS_PATH, digest)
+        try:
+            os.replace(path, path + store.CORRUPT_SUFFIX)
+        except OSError as e:
+            log(f"⚠️ Could not set aside corrupt blob {path}: {e}")
+    log(f"🔎 Verification done in {time.time() - start:.1f}s: {len(broken)} of {len(model_names)} models need a re-pull.")
+    if digest_cache is not None and mode == "sha256":
+        log(f"🔎 Digest cache: {digest_cache.hits} hits, {digest_cache.misses} misses "
+            f"({planner.format_bytes(digest_cache.bytes_hashed)} hashed).")
+    return broken
 
+# ─── UTILS ─────────────────────────────────────────────────────
+# Progress parsing lives in ollama_downloader/progress.py (ProgressParser)
 # clean_model_name_for_path is no longer needed by core logic
 # get_model_manifest_path is no longer needed by core logic
 # is_model_download_complete is no longer needed by core logic
 
+# Blob sizes come from ollama_downloader/blobindex.py: one scan per run, then
+# per-model updates from manifest layer lists instead of rescanning blobs/.
+
 # ─── MODEL DOWNLOAD ────────────────────────────────────────────
-def download_model(model_name, metadata_dict, current_index, total):
-    # (Keep existing download_model function - it's mostly independent)
+# 'ollama pull' subprocesses are driven by ollama_downloader/orchestrator.py;
+# the native and API engines below run on the orchestrator's executor.
+def native_download_model(model_name, current_index, total, registry_client, blob_index, plan=None, on_progress=None,
+                          on_layer=None, stop=None):
+    """
+    Pulls a model with the built-in registry client instead of 'ollama pull'.
+    Returns (status, metadata_entry) with the same fields as subprocess pulls;
+    the orchestrator records the entry.
+    Uses the manifest already resolved by the run's plan when there is one.
+    on_progress(nbytes) is called for every block received, and
+    on_layer(digest, completed, total) with the layer's bytes received so far.
+    Once `stop` is set, the pull ends at the next block with status "cancelled".
+    """
     start_time = time.time()
-    log(f"\n🚀 ({current_index}/{total}) Starting download: {model_name}")
-    pbar = tqdm(total=100, desc=f"{model_name[:30]:<30}", unit='%', leave=False)
-    process = subprocess.Popen([
-        "ollama", "pull", model_name
-    ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace', bufsize=8192)
-
-    last_progress = 0
-    last_activity = time.time()
-    lines_captured = []
-    hung_detector_timeout = 600
-
+    log(f"\n🚀 ({current_index}/{total}) Starting native download: {model_name}")
+    pbar = None
+    status = "failed (unknown)"
+    result = {}
     try:
-        for line in iter(process.stdout.readline, ''):
-            if not line: break
-            log_file.write(line)
-            lines_captured.append(line.strip())
-            progress = extract_progress(line)
-
-            if progress is not None:
-                update_amount = max(0, progress - last_progress)
-                if update_amount > 0: pbar.update(update_amount)
-                last_progress = progress
-                last_activity = time.time()
-            elif line.strip():
-                 last_activity = time.time()
-
-            if time.time() - last_activity > hung_detector_timeout:
-                log(f"⚠️ No progress or output update in {hung_detector_timeout // 60} min for {model_name}. Terminating process.")
-                process.terminate()
-                time.sleep(5)
-                if process.poll() is None:
-                    log(f"⚠️ Process {model_name} did not terminate gracefully. Killing.")
-                    process.kill()
-                status = "timed_out"
-                pbar.close()
-                metadata_dict[model_name] = {
-                    "download_time_sec": round(time.time() - start_time, 2), "status": status,
-                    "progress": last_progress, "size_gb_estimate": "N/A",
-                    "log_tail": lines_captured[-5:]
-                }
-                return model_name, status
-
-        process.wait(timeout=60)
-        pbar.n = 100
-        pbar.refresh()
-        status = "success" if process.returncode == 0 else f"failed (code: {process.returncode})"
-
-    except subprocess.TimeoutExpired:
-        log(f"⚠️ Process {model_name} exceeded wait timeout after stream closed. Killing.")
-        process.kill()
-        status = "failed (timeout_wait)"
+        if plan is not None and model_name in plan.manifests:
+            manifest, raw_manifest = plan.manifests[model_name]
+        else:
+            manifest, raw_manifest = registry_client.fetch_manifest(model_name)
+        layer_sizes = {layer["digest"]: layer.get("size", 0) for layer in store.manifest_layers(manifest)}
+        pbar = tqdm(total=sum(layer_sizes.values()), desc=f"{model_name[:30]:<30}", unit='B', unit_scale=True, leave=False)
+        pbar_lock = threading.Lock()
+        layer_done = {}
+
+        def on_bytes(digest, nbytes):
+            with pbar_lock:
+                pbar.update(nbytes)
+                layer_done[digest] = layer_done.get(digest, 0) + nbytes
+                if on_progress is not None:
+                    on_progress(nbytes)
+                if on_layer is not None:
+                    on_layer(digest, layer_done[digest], layer_sizes.get(digest, 0))
+
+        result = registry_client.pull(model_name, OLLAMA_MODELS_PATH, progress=on_bytes,
+                                      manifest=manifest, raw_manifest=raw_manifest, stop=stop)
+        blob_index.refresh_layers(store.manifest_layers(manifest))
+        status = "success"
+    except registry.PullStopped:
+        status = "cancelled"
+    except registry.RegistryError as e:
+        log(f"❌ Registry error for {model_name}: {e}")
+        status = f"failed (registry: {e})"
     except Exception as e:
-         log(f"❌ Unexpected error processing {model_name}: {e}")
-         status = f"failed (exception: {e})"
-         if process.poll() is None: process.kill()
+        log(f"❌ Unexpected error processing {model_name}: {e}")
+        status = f"failed (exception: {e})"
     finally:
-         if process.stdout: process.stdout.close()
-         if not pbar.disable:
-            if "success" in status and pbar.n < 100: pbar.update(100 - pbar.n)
+        if pbar is not None:
             pbar.close()
 
     end_time = time.time()
-    size_gb = "N/A"
+    entry = {
+        "download_time_sec": round(end_time - start_time, 2), "status": status,
+        "final_progress_%": 100 if status == "success" else 0,
+        "engine": "native", "log_tail": [],
+    }
+    if status == "success":
+        entry.update({
+            "model_size_bytes": result["size_bytes"],
+            "model_size_gb": round(result["size_bytes"] / (1024 ** 3), 2),
+            "bytes_downloaded": result["bytes_downloaded"],
+            "bytes_from_peers": result["bytes_from_peers"],
+            "bytes_reused": result["bytes_reused"],
+        })
+        mb_per_sec = result["bytes_downloaded"] / scheduling.MB / max(end_time - start_time, 0.001)
+        from_peers = f", {result['bytes_from_peers'] / 1024 ** 3:.2f} GB of it from peers" if result["bytes_from_peers"] else ""
+        log(f"✅ Finished {model_name} successfully ({mb_per_sec:.1f} MB/s). | Model size: {entry['model_size_gb']} GB "
+            f"({result['bytes_downloaded'] / 1024 ** 3:.2f} GB new{from_peers}, {result['bytes_reused'] / 1024 ** 3:.2f} GB reused)")
+    elif status == "cancelled":
+        log(f"🛑 Stopped {model_name}; its completed ranges are kept for the next attempt.")
+    else:
+        log(f"❌ Finished {model_name} with status: {status}.")
+    return status, entry
+
+def api_download_model(model_name, current_index, total, api_client, blob_index, blobs_before, on_progress=None,
+                       on_layer=None, stop=None):
+    """
+    Pulls a model through the server's streaming /api/pull instead of forking
+    'ollama pull', reading its JSON progress directly.
+    Returns (status, metadata_entry) like the other engines.
+    on_progress(nbytes) is called with every increase in completed bytes, and
+    on_layer(digest, completed, total) with the layer's new count. Once `stop` is set, the stream is dropped at its next line (the server
+    abandons the pull) and the status is "cancelled".
+    """
+    start_time = time.time()
+    log(f"\n🚀 ({current_index}/{total}) Starting API download: {model_name}")
+    pbar = tqdm(total=0, desc=f"{model_name[:30]:<30}", unit='B', unit_scale=True, leave=False)
+    layer_done, layer_total, log_tail = {}, {}, []
+    status = "failed (unknown)"
     try:
-        blobs_dir = os.path.join(OLLAMA_MODELS_PATH, "blobs")
-        if os.path.exists(blobs_dir):
-            total_size_bytes = sum(f.stat().st_size for f in os.scandir(blobs_dir) if f.is_file())
-            size_gb = round(total_size_bytes / (1024 ** 3), 2)
-        else: size_gb = 0
-    except Exception as e:
-        log(f"⚠️ Could not estimate blob directory size: {e}")
-        size_gb = "Error"
-
-    if status == "success": final_message = f"✅ Finished {model_name} successfully."
-    elif status == "timed_out": final_message = f"⏰ Timed out downloading {model_name} after {round(end_time - start_time)}s."
-    else: final_message = f"❌ Finished {model_name} with status: {status}."
-
-    log(f"{final_message} | Total blob size: ~{size_gb} GB")
+        for event in api_client.pull(model_name, stop=stop):
+            if event.get("status") and (not log_tail or log_tail[-1] != event["status"]):
+                log_tail.append(event["status"])
+            digest = event.get("digest")
+            if digest and event.get("total"):
+                if digest not in layer_total:
+                    layer_total[digest] = event["total"]
+                    pbar.total = sum(layer_total.values())
+                    pbar.refresh()
+                delta = event.get("completed", 0) - layer_done.get(digest, 0)
+                if delta > 0:
+                    layer_done[digest] = event["completed"]
+                    pbar.update(delta)
+                    if on_progress is not None:
+                        on_progress(delta)
+                    if on_layer is not None:
+                        on_layer(digest, event["completed"], event["total"])
+            if event.get("status") == "success":
+                status = "success"
+        if status != "success":
+            stopped = stop is not None and stop.is_set()
+            status = "cancelled" if stopped else "failed (pull stream ended without success)"
+    except OllamaAPIError as e:
+        log(f"❌ API error for {model_name}: {e}")
+        log_tail.append(str(e))
+        status = f"failed (api: {e})"
+    finally:
+        pbar.close()
 
-    metadata_dict[model_name] = {
+    end_time = time.time()
+    completed = sum(layer_done.values())
+    entry = {
         "download_time_sec": round(end_time - start_time, 2), "status": status,
-        "final_progress_%": last_progress if status != 'success' else 100,
-        "total_blob_size_gb": size_gb, "log_tail": lines_captured[-5:]
+        "final_progress_%": 100 if status == "success" else
+            (round(completed * 100 / sum(layer_total.values())) if layer_total else 0),
+        "engine": "api", "log_tail": log_tail[-5:],
     }
-    time.sleep(1)
-    return model_name, status
+    sizes = blob_index.account_installed_model(model_name, blobs_before) if status == "success" else None
+    if sizes:
+        entry.update(sizes)
+        log(f"✅ Finished {model_name} successfully. | Model size: {sizes['model_size_gb']} GB "
+            f"({sizes['bytes_downloaded'] / 1024 ** 3:.2f} GB new, {sizes['bytes_reused'] / 1024 ** 3:.2f} GB reused)")
+    elif status == "success":
+        log(f"✅ Finished {model_name} successfully.")
+    elif status == "cancelled":
+        log(f"🛑 Stopped {model_name}.")
+    else:
+        log(f"❌ Finished {model_name} with status: {status}.")
+    return status, entry
 
 # ─── REPORTING ─────────────────────────────────────────────────
-def write_metadata(metadata_dict):
-    # (Keep existing write_metadata function)
+def write_metadata(history, run_id, metadata_dict):
+    """
+    Stores this run's summary in the history database, then regenerates the
+    JSON and TXT reports from it: the latest result of every model ever
+    attempted, with this run's models counted in the summary.
+    """
     log("\n📊 Generating reports...")
+    history.finish_run(run_id, metadata_dict.get(RUN_METADATA_KEY, {}))
+    metadata_dict = history.report(run_id, RUN_METADATA_KEY)
+    throughput = history.throughput()
     try:
         with open(METADATA_JSON, 'w', encoding='utf-8') as f:
             json.dump(metadata_dict, f, indent=2, sort_keys=True)
@@ -258,109 +365,337 @@ def write_metadata(metadata_dict):
         with open(METADATA_TXT, 'w', encoding='utf-8') as f:
             f.write(f"Ollama Model Download Report - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write("=====================================================\n\n")
-            success_count, failed_count, timed_out_count = 0, 0, 0
-            for model, data in sorted(metadata_dict.items()):
+            success_count, failed_count, timed_out_count, stalled_count, skipped_count = 0, 0, 0, 0, 0
+            model_entries = {m: d for m, d in metadata_dict.items() if m != RUN_METADATA_KEY}
+            for model, data in sorted(model_entries.items()):
                 f.write(f"Model: {model}\n")
                 status = data.get('status', 'unknown')
                 f.write(f"  Status: {status}\n")
+                f.write(f"  Last Attempt: run {data.get('run_id')} at {data.get('finished_at')}"
+                        f"{' (this run)' if data.get('this_run') else ''}\n")
+                if model in throughput:
+                    f.write(f"  Median Speed, 30 days (MB/s): {throughput[model]['median_mb_per_sec']} "
+                            f"over {throughput[model]['attempts']} pull(s)\n")
                 f.write(f"  Download Time (sec): {data.get('download_time_sec', 'N/A')}\n")
                 f.write(f"  Final Progress (%): {data.get('final_progress_%', 'N/A')}\n")
-                f.write(f"  Estimated Total Blob Size (GB): {data.get('total_blob_size_gb', 'N/A')}\n")
+                if data.get('reason'):
+                    f.write(f"  Reason: {data['reason']}\n")
+                f.write(f"  Model Size (GB): {data.get('model_size_gb', 'N/A')}\n")
+                if 'bytes_downloaded' in data:
+                    f.write(f"  Downloaded / Reused (GB): {data['bytes_downloaded'] / 1024 ** 3:.2f} / {data['bytes_reused'] / 1024 ** 3:.2f}\n")
+                if data.get('attempts'):
+                    f.write(f"  Attempts: {' → '.join(a['status'] for a in data['attempts'])}\n")
                 f.write("  Log Tail:\n")
                 for line in data.get('log_tail', []): f.write(f"    {line}\n")
                 f.write("-" * 50 + "\n\n")
+                if not data.get('this_run'): continue
                 if status == "success": success_count += 1
                 elif status == "timed_out": timed_out_count += 1
+                elif status == "stalled": stalled_count += 1
+                elif status.startswith("skipped"): skipped_count += 1
                 else: failed_count += 1
-            f.write("=====================================================\nSummary:\n")
-            f.write(f"  Successful: {success_count}\n  Failed:     {failed_count}\n  Timed Out:  {timed_out_count}\n")
-            f.write(f"  Total Attempts This Run: {len(metadata_dict)}\n=====================================================\n")
+            this_run = sum(1 for d in model_entries.values() if d.get('this_run'))
+            f.write(f"=====================================================\nSummary (run {run_id}):\n")
+            f.write(f"  Successful: {success_count}\n  Failed:     {failed_count}\n  Timed Out:  {timed_out_count}\n  Stalled:    {stalled_count}\n")
+            f.write(f"  Skipped:    {skipped_count}\n")
+            f.write(f"  Total Attempts This Run: {this_run}\n")
+            f.write(f"  Models In History: {len(model_entries)}\n")
+            store_size = metadata_dict.get(RUN_METADATA_KEY, {}).get("blob_store_size_gb")
+            if store_size is not None:
+                f.write(f"  Blob Store Size (GB): {store_size}\n")
+            dedup = metadata_dict.get(RUN_METADATA_KEY, {}).get("dedup")
+            if dedup:
+                f.write(f"  Unique Blobs Planned: {dedup['unique_blobs']} ({dedup['shared_blobs']} shared, {dedup['blobs_present']} already present)\n")
+                f.write(f"  Bytes To Fetch: {planner.format_bytes(dedup['fetch_bytes'])} of {planner.format_bytes(dedup['requested_bytes'])} requested\n")
+                f.write(f"  Bytes Saved (dedup + reuse): {planner.format_bytes(dedup['saved_bytes'])}\n")
+            schedule = metadata_dict.get(RUN_METADATA_KEY, {}).get("schedule")
+            if schedule:
+                f.write(f"  Schedule: {schedule['policy']}, expected makespan {scheduling.format_duration(schedule['expected_makespan_sec'])} "
+                        f"(fifo {scheduling.format_duration(schedule['fifo_makespan_sec'])})\n")
+            concurrency = metadata_dict.get(RUN_METADATA_KEY, {}).get("concurrency")
+            if concurrency:
+                f.write(f"  Concurrency: {concurrency['mode']} ({concurrency['min_workers']}-{concurrency['max_workers']}), "
+                        f"finished at {concurrency['final_workers']} after {len(concurrency['decisions'])} adjustments\n")
+            bandwidth = metadata_dict.get(RUN_METADATA_KEY, {}).get("bandwidth")
+            if bandwidth:
+                f.write(f"  Bandwidth: {planner.format_bytes(bandwidth['bytes'])} through the budget, "
+                        f"{scheduling.format_duration(bandwidth['throttled_sec'])} throttled, "
+                        f"{len(bandwidth['rate_changes'])} rate change(s), now {bandwidth['current']}\n")
+            coordination = metadata_dict.get(RUN_METADATA_KEY, {}).get("coordination")
+            if coordination:
+                f.write(f"  Coordination: host {coordination['host']}, {len(coordination['peers'])} peer(s) at the end, "
+                        f"{coordination['claims_won']} claim(s) won, {len(coordination['waited_for'])} model(s) left to other hosts, "
+                        f"{planner.format_bytes(coordination['bytes_from_peers'])} copied from peers, "
+                        f"{planner.format_bytes(coordination['bytes_served'])} served\n")
+            disk = metadata_dict.get(RUN_METADATA_KEY, {}).get("disk")
+            if disk:
+                f.write(f"  Disk: {planner.format_bytes(disk['free_bytes'])} free after the run, "
+                        f"{planner.format_bytes(disk['reserve_bytes'])} reserve, {disk['deferrals']} pull(s) deferred, "
+                        f"{len(disk['skipped'])} skipped\n")
+            digest_stats = metadata_dict.get(RUN_METADATA_KEY, {}).get("digest_cache")
+            if digest_stats and (digest_stats["hits"] or digest_stats["misses"]):
+                f.write(f"  Digest Cache: {digest_stats['hits']} hits, {digest_stats['misses']} misses, "
+                        f"{planner.format_bytes(digest_stats['bytes_hashed'])} hashed\n")
+            pull_log = metadata_dict.get(RUN_METADATA_KEY, {}).get("pull_log")
+            if pull_log:
+                f.write(f"  Pull log: {pull_log['events_written']} of {pull_log['events_seen']} progress events written, "
+                        f"{pull_log['rotated_segments']} rotated segment(s) ({pull_log['compression']})\n")
+            f.write("=====================================================\n")
         log(f"📄 Text report saved to {METADATA_TXT}")
     except IOError as e: log(f"⚠️ Error writing text report: {e}")
 
+def report_schedule(jobs, policy, workers):
+    """Logs the expected makespan of the chosen policy (and of fifo, for comparison) before the run."""
+    rate = ASSUMED_MB_PER_SEC * scheduling.MB
+    link = LINK_MB_PER_SEC * scheduling.MB if LINK_MB_PER_SEC else None
+    estimate = scheduling.estimate_schedule(jobs, policy, workers, rate, link)
+    baseline = scheduling.estimate_schedule(jobs, scheduling.make_policy("fifo"), workers, rate, link)
+    link_note = f", link {LINK_MB_PER_SEC} MB/s" if LINK_MB_PER_SEC else ""
+    log(f"📐 Schedule '{policy.name}': {len(jobs)} jobs, {planner.format_bytes(estimate['total_bytes'])} to fetch, "
+        f"{workers} worker(s) at ~{ASSUMED_MB_PER_SEC} MB/s each{link_note}")
+    log(f"📐 Expected makespan {scheduling.format_duration(estimate['makespan_sec'])}, "
+        f"mean completion {scheduling.format_duration(estimate['mean_completion_sec'])} "
+        f"(fifo: {scheduling.format_duration(baseline['makespan_sec'])} / "
+        f"{scheduling.format_duration(baseline['mean_completion_sec'])})")
+    return {
+        "policy": policy.name, "workers": workers, "assumed_mb_per_sec": ASSUMED_MB_PER_SEC,
+        "link_mb_per_sec": LINK_MB_PER_SEC,
+        "expected_makespan_sec": estimate["makespan_sec"],
+        "expected_mean_completion_sec": estimate["mean_completion_sec"],
+        "fifo_makespan_sec": baseline["makespan_sec"],
+        "fifo_mean_completion_sec": baseline["mean_completion_sec"],
+    }
+
+def print_plan(jobs, plan, policy, workers, history):
+    """
+    Logs what a run would do (--plan): each model's size and bytes still to fetch,
+    with times estimated from its median speed in the run history (or the median
+    over all models, or ASSUMED_MB_PER_SEC), then totals for the chosen concurrency.
+    """
+    model_rates, overall_rate = history.median_rates(PLAN_HISTORY_DAYS)
+    assumed_rate = ASSUMED_MB_PER_SEC * scheduling.MB
+    link = LINK_MB_PER_SEC * scheduling.MB if LINK_MB_PER_SEC else None
+    rates, sources = {}, {}
+    for job in jobs:
+        if job.model_name in model_rates:
+            rates[job.model_name], sources[job.model_name] = model_rates[job.model_name], "history"
+        elif overall_rate:
+            rates[job.model_name], sources[job.model_name] = overall_rate, "all models"
+        else:
+            rates[job.model_name], sources[job.model_name] = assumed_rate, "assumed"
+    estimate = scheduling.estimate_schedule(jobs, policy, workers, assumed_rate, link, job_rates=rates)
+
+    log(f"\n📋 Plan: {len(jobs)} model(s), schedule '{policy.name}', {workers} worker(s)"
+        f"{f', link {LINK_MB_PER_SEC} MB/s' if LINK_MB_PER_SEC else ''}")
+    log(f"   {'Model':<40} {'Vendor':<9} {'Size':>10} {'To fetch':>10} {'MB/s':>7} {'Source':<10} {'Alone':>9} {'Done at':>9}")
+    for job in sorted(jobs, key=lambda j: (j.model_name not in plan.manifests, estimate["finish_sec"].get(j.model_name, 0))):
+        if job.model_name not in plan.manifests:
+            log(f"   {job.model_name[:40]:<40} {job.vendor or '':<9} {'?':>10} {'?':>10}  (manifest unresolved)")
+            continue
+        rate = rates[job.model_name]
+        log(f"   {job.model_name[:40]:<40} {job.vendor or '':<9} "
+            f"{planner.format_bytes(plan.model_size(job.model_name)):>10} {planner.format_bytes(job.size_bytes or 0):>10} "
+            f"{rate / scheduling.MB:>7.1f} {sources[job.model_name]:<10} "
+            f"{scheduling.format_duration((job.size_bytes or 0) / rate):>9} "
+            f"{scheduling.format_duration(estimate['finish_sec'].get(job.model_name, 0)):>9}")
+    log(f"📋 Requested {planner.format_bytes(plan.requested_bytes)}, already present or shared "
+        f"{planner.format_bytes(plan.saved_bytes)}, to fetch {planner.format_bytes(plan.fetch_bytes)}.")
+    log(f"📋 Estimated wall time {scheduling.format_duration(estimate['makespan_sec'])} "
+        f"(speeds from {sum(1 for v in sources.values() if v == 'history')} model histories over {PLAN_HISTORY_DAYS} days).")
+    if plan.errors:
+        log(f"⚠️ {len(plan.errors)} manifest(s) could not be resolved and are not counted.")
+    log("📋 Nothing was downloaded.")
+
 # ─── MAIN EXECUTION ────────────────────────────────────────────
-def main(force_all=False, run_concurrent=FLAG_CONCURRENT):
+def main(force_all=False, run_concurrent=FLAG_CONCURRENT, engine=PULL_ENGINE, adaptive=FLAG_ADAPTIVE,
+         schedule=SCHEDULE_POLICY, verify_mode=VERIFY_MODE, disk_check=FLAG_DISK_CHECK, selectors=None,
+         plan_only=False):
     global log_file # Allow modification if closed early
 
     attempted_this_run = set()
     metadata = {} # Stores metadata for models attempted in *this* run
-
+    history = RunHistory(HISTORY_DB)
+    run_id = None if plan_only else history.start_run(engine=engine, argv=sys.argv[1:])
+    digest_cache = DigestCache.load(DIGEST_CACHE_FILE)
+    policy = scheduling.make_policy(schedule, inflight_cap_bytes=INFLIGHT_CAP_GB * 1024 ** 3)
+    # The registry client pulls for the native engine and resolves manifests for size-aware
+    # scheduling, the disk-space check and --plan
+    bandwidth = None
+    if BANDWIDTH_RULES and not plan_only:
+        bandwidth = BandwidthLimiter(BandwidthSchedule.parse(BANDWIDTH_RULES), log=log)
+        log(f"🚦 Bandwidth budget: {', '.join(BANDWIDTH_RULES)}; now {bandwidth.schedule.describe(datetime.now())}.")
+    blob_server = coordinator = None
+    if COORDINATION_DIR and not plan_only:
+        blob_server = BlobServer(OLLAMA_MODELS_PATH, port=SHARE_PORT).start()
+        coordinator = SharedDirCoordinator(COORDINATION_DIR, HOST_ID, SHARE_URL or f"http://{socket.getfqdn()}:{blob_server.port}",
+                                           log=log).start()
+        peers = coordinator.peers()
+        log(f"🤝 Coordinating as {HOST_ID} through {COORDINATION_DIR}; serving blobs at {coordinator.share_url}; "
+            f"{len(peers)} peer(s) online{': ' + ', '.join(peers) if peers else ''}.")
+    registry_client = None
+    if engine == "native" or schedule != "fifo" or disk_check or plan_only:
+        registry_client = registry.RegistryClient(
+            REGISTRY_URL, connections=NATIVE_CONNECTIONS, chunk_size=NATIVE_CHUNK_MB * 1024 * 1024,
+            digest_cache=digest_cache, limiter=bandwidth,
+            peers=coordinator.peer_urls if coordinator is not None else None)
+    if engine == "native":
+        log(f"ℹ️ Using native pull engine against {REGISTRY_URL} ({NATIVE_CONNECTIONS} connections per blob).")
+    api_client = OllamaClient(OLLAMA_HOST) if engine == "api" else None
+    if api_client is not None:
+        log(f"ℹ️ Pulling through the server API at {api_client.base_url}.")
+
+    selected_names = None # Set for partial runs, so the final check only reads their manifests too
     try:
-        # Get the list of currently installed models directly from Ollama
-        installed_models = get_ollama_list_models()
-
-        all_models_flat = [(vendor, model) for vendor, models in model_groups.items() for model in models]
+        # Selectors narrow the catalog before anything touches the store or the registry
+        all_models_flat = [(entry.vendor, entry.name) for entry in load_selected_models(selectors or {})]
+        if any((selectors or {}).values()):
+            selected_names = [m for _, m in all_models_flat]
+        installed_models = get_installed_models([m for _, m in all_models_flat])
+        # Catalog names may omit ':latest'; installed names never do
+        installed_catalog = {m for _, m in all_models_flat if store.normalize_model_name(m) in installed_models}
         pending = []
+        broken = find_broken_models([m for _, m in all_models_flat if m in installed_catalog], verify_mode, digest_cache,
+                                    quarantine=not plan_only) \
+            if verify_mode != "off" and not force_all else {}
 
-        log("🔍 Checking required models against 'ollama list' output...")
+        log("🔍 Checking required models against installed models...")
         for v, m in tqdm(all_models_flat, desc="Checking models"):
             attempted_this_run.add(m) # Track all models we intend to process
 
-            # Core logic change: Check against 'ollama list' output
-            if m in installed_models and not force_all:
-                log(f"⏩ '{m}' found via 'ollama list' — skipping.")
+            if m in installed_catalog and not force_all and m not in broken:
+                log(f"⏩ '{m}' is already installed — skipping.")
                 continue # Skip adding to pending list
             else:
                 # Determine reason for queuing
                 if force_all:
                    log(f"➕ Queuing '{m}' for download (forced).")
-                elif m not in installed_models:
-                    log(f"➕ Queuing '{m}' for download ('ollama list' did not find it).")
+                elif m not in installed_catalog:
+                    log(f"➕ Queuing '{m}' for download (not installed).")
+                else:
+                    log(f"➕ Queuing '{m}' for download (verification failed: {verify.describe(broken[m])}).")
                 # Add to pending list
                 pending.append((v, m))
 
         total_to_download = len(pending)
-        log(f"\n✅ Models already present according to 'ollama list': {len(installed_models)}")
+        log(f"\n✅ Catalog models already installed: {len(installed_catalog)} of {len(all_models_flat)}")
         log(f"📦 Models queued for download in this run: {total_to_download}\n")
 
+        # One scan of blobs/ per run; updated per model from manifest layer lists afterwards
+        blob_index = BlobIndex.build(OLLAMA_MODELS_PATH)
+        metadata[RUN_METADATA_KEY] = {"digest_cache": digest_cache.stats()}
+
         if not pending:
             log("🏁 No models need downloading.")
             # Still generate reports for consistency, even if empty
-            write_metadata(metadata)
+            if not plan_only:
+                write_metadata(history, run_id, metadata)
             return # Exit early if nothing to do
 
+        # --- Dedup Planning (native engine / size-aware scheduling / disk check) ---
+        # Resolve every pending manifest once so shared blobs are fetched exactly once
+        plan = None
+        if registry_client is not None:
+            log("🧮 Resolving manifests and planning blob downloads...")
+            plan = planner.build_plan(registry_client, [m for _, m in pending], OLLAMA_MODELS_PATH, log=log,
+                                      blob_index=blob_index)
+            metadata[RUN_METADATA_KEY]["dedup"] = plan.summary()
+
         # --- Download Execution ---
         # Note: Checkpointing is removed. If the script is interrupted,
-        # it will rely on 'ollama list' on the next run to see what finished.
-        downloaded_this_run = set() # Track successes within this run for reporting
-
-        def _wrapped_download(vendor_model, index, total):
-            _, model = vendor_model
-            model_name_result, status = download_model(model, metadata, index, total)
-            if status == "success":
-                downloaded_this_run.add(model_name_result)
-            # Return model name regardless of status for tracking
-            return model_name_result
-
-        # (Concurrent/Sequential download execution logic remains the same)
-        if run_concurrent:
+        # it will rely on the installed-model inventory on the next run to see what finished.
+        # The orchestrator owns `metadata` and the success set for the whole run.
+        jobs = [PullJob(m, idx + 1, total_to_download, vendor=v) for idx, (v, m) in enumerate(pending)]
+        if plan is not None:
+            for job in jobs:
+                if job.model_name in plan.manifests:
+                    job.size_bytes = plan.remaining_bytes(job.model_name)
+            workers = (CONCURRENT_MAX_DOWN if run_concurrent or adaptive else 1)
+            if plan_only:
+                print_plan(jobs, plan, policy, workers, history)
+                return
+            metadata[RUN_METADATA_KEY]["schedule"] = report_schedule(jobs, policy, workers)
+
+        admission = None
+        if disk_check:
+            admission = DiskAdmission(OLLAMA_MODELS_PATH, reserve_bytes=DISK_RESERVE_GB * 1024 ** 3, plan=plan,
+                                      blob_index=blob_index, log=log)
+            log(f"💾 {planner.format_bytes(admission.summary()['free_bytes'])} free on {OLLAMA_MODELS_PATH}; "
+                f"keeping {DISK_RESERVE_GB} GB in reserve.")
+
+        controller = None
+        if adaptive:
+            controller = AdaptiveConcurrency(
+                OLLAMA_MODELS_PATH, min_limit=ADAPTIVE_MIN_WORKERS, max_limit=CONCURRENT_MAX_DOWN,
+                initial=ADAPTIVE_START_WORKERS, log=log)
+            run_concurrent = True
+
+        blocking_pull = None
+        if engine == "api":
+            def blocking_pull(job):
+                return api_download_model(job.model_name, job.index, job.total, api_client, blob_index, job.blobs_before,
+                                          on_progress=lambda nbytes: orchestrator.record_bytes(job, nbytes),
+                                          on_layer=lambda *layer: orchestrator.layer_progress(job, *layer), stop=job.stop)
+        elif engine == "native":
+            def blocking_pull(job):
+                return native_download_model(job.model_name, job.index, job.total, registry_client, blob_index, plan,
+                                             on_progress=lambda nbytes: orchestrator.record_bytes(job, nbytes),
+                                             on_layer=lambda *layer: orchestrator.layer_progress(job, *layer), stop=job.stop)
+
+        if controller is not None:
+            log(f"🚀 Starting adaptive downloads ({controller.limit} to start, {controller.min_limit}-{controller.max_limit} workers)...")
+        elif run_concurrent:
             log(f"🚀 Starting concurrent downloads (max workers: {CONCURRENT_MAX_DOWN})...")
-            with ThreadPoolExecutor(max_workers=CONCURRENT_MAX_DOWN) as executor:
-                futures = {executor.submit(_wrapped_download, vm, idx + 1, total_to_download): vm for idx, vm in enumerate(pending)}
-                for future in tqdm(as_completed(futures), total=total_to_download, desc="Overall Progress"):
-                    vm = futures[future]
-                    model_name = vm[1]
-                    try:
-                        future.result()
-                    except Exception as exc:
-                        log(f"❌ Exception occurred for model '{model_name}': {exc}")
-                        if model_name not in metadata:
-                             metadata[model_name] = {"status": f"failed (executor exception: {exc})"}
         else:
             log(f"🚀 Starting sequential downloads (delay: {DELAY_BETWEEN_DOWNLOADS_SEC}s)...")
-            for idx, vm in enumerate(pending):
-                model_name = vm[1]
-                try:
-                    _wrapped_download(vm, idx + 1, total_to_download)
-                except Exception as exc:
-                     log(f"❌ Exception occurred for model '{model_name}': {exc}")
-                     if model_name not in metadata:
-                         metadata[model_name] = {"status": f"failed (loop exception: {exc})"}
-                if idx < total_to_download - 1:
-                    log(f"⏳ Pausing for {DELAY_BETWEEN_DOWNLOADS_SEC} seconds...")
-                    time.sleep(DELAY_BETWEEN_DOWNLOADS_SEC)
+        orchestrator = PullOrchestrator(
+            metadata,
+            max_concurrent=CONCURRENT_MAX_DOWN if run_concurrent else 1,
+            delay_between=0 if run_concurrent else DELAY_BETWEEN_DOWNLOADS_SEC,
+            job_deadline=JOB_DEADLINE_SEC,
+            stall_timeout=HUNG_DETECTOR_TIMEOUT_SEC,
+            min_bytes_per_sec=MIN_THROUGHPUT_MB_PER_SEC * 1000 ** 2,
+            throughput_window=THROUGHPUT_WINDOW_SEC,
+            stall_grace=STALL_GRACE_SEC,
+            max_restarts=STALL_RESTARTS,
+            retry_policy=retry.RetryPolicy(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_SEC, RETRY_MAX_DELAY_SEC),
+            history=history,
+            run_id=run_id,
+            log=log,
+            pull_log=log_file,
+            blocking_pull=blocking_pull,
+            blob_index=blob_index,
+            controller=controller,
+            policy=policy,
+            admission=admission,
+            coordinator=coordinator,
+        )
+        try:
+            downloaded_this_run = asyncio.run(orchestrator.run(jobs))
+        finally:
+            if bandwidth is not None:
+                metadata.setdefault(RUN_METADATA_KEY, {})["bandwidth"] = bandwidth.stats()
+            if coordinator is not None:
+                metadata.setdefault(RUN_METADATA_KEY, {})["coordination"] = dict(
+                    coordinator.summary(), bytes_served=blob_server.bytes_served,
+                    bytes_from_peers=sum(d.get("bytes_from_peers", 0) for m, d in metadata.items() if m != RUN_METADATA_KEY))
+            if admission is not None:
+                metadata.setdefault(RUN_METADATA_KEY, {})["disk"] = admission.summary()
+            if controller is not None:
+                metadata.setdefault(RUN_METADATA_KEY, {})["concurrency"] = {
+                    "mode": "adaptive", "min_workers": controller.min_limit, "max_workers": controller.max_limit,
+                    "final_workers": controller.limit, "decisions": controller.decisions,
+                }
+        log(f"✅ Successful downloads this run: {len(downloaded_this_run)}/{total_to_download}")
 
         log("\n🎉 All download tasks processed.")
+        if coordinator is not None:
+            coordinator.linger(SHARE_LINGER_MIN * 60)
+        metadata[RUN_METADATA_KEY]["blob_store_size_gb"] = round(blob_index.total_bytes / (1024 ** 3), 2)
+        metadata[RUN_METADATA_KEY]["pull_log"] = log_file.stats()
+        if engine == "native":
+            fetched = sum(d.get("bytes_downloaded", 0) for m, d in metadata.items() if m != RUN_METADATA_KEY)
+            metadata[RUN_METADATA_KEY]["dedup"]["bytes_downloaded"] = fetched
+            log(f"🧮 Downloaded {planner.format_bytes(fetched)}; dedup/reuse saved {planner.format_bytes(plan.saved_bytes)}.")
 
     except Exception as e:
         log(f" CRITICAL ERROR in main execution loop: {e}")
@@ -368,18 +703,34 @@ def main(force_all=False, run_concurrent=FLAG_CONCURRENT):
         log(traceback.format_exc())
     finally:
         # --- Reporting and Cleanup ---
-        # Write reports based on attempts during this run
-        write_metadata(metadata)
-
-        # No final checkpoint save needed
-        # Optionally, run ollama list again to show final state
-        log("\n🏁 Script finished. Running final 'ollama list' check:")
+        # Record the run and regenerate the reports from the history database
+        if not plan_only:
+            write_metadata(history, run_id, metadata)
+
+            # No final checkpoint save needed
+            # Read the inventory again to show the final state
+            log("\n🏁 Script finished. Final inventory check:")
+            try:
+                final_installed_models = get_installed_models(selected_names)
+                log(f"Final count of installed models: {len(final_installed_models)}")
+            except Exception:
+                 log("⚠️ Could not read the final inventory.")
+
+
+        if coordinator is not None:
+            coordinator.close()
+        if blob_server is not None:
+            blob_server.close()
+        if registry_client is not None:
+            registry_client.close()
+        if api_client is not None:
+            api_client.close()
+        history.close()
+        digest_cache.prune(OLLAMA_MODELS_PATH)
         try:
-            final_installed_models = get_ollama_list_models()
-            log(f"Final count from 'ollama list': {len(final_installed_models)}")
-        except Exception:
-             log("⚠️ Could not run final 'ollama list'.")
-
+            digest_cache.save()
+        except OSError as e:
+            log(f"⚠️ Could not save digest cache {DIGEST_CACHE_FILE}: {e}")
 
         # Close log file
         if log_file:
@@ -391,15 +742,113 @@ def main(force_all=False, run_concurrent=FLAG_CONCURRENT):
 
 if __name__ == "__main__":
     # Update description to reflect new logic
-    parser = argparse.ArgumentParser(description="Pull Ollama models, checking status via 'ollama list' and generating metadata.")
-    parser.add_argument("--force", action="store_true", help="Force download attempt of all models, ignoring 'ollama list' results.")
+    parser = argparse.ArgumentParser(description="Pull Ollama models, checking which are installed from the model store and generating metadata.")
+    parser.add_argument("--force", action="store_true", help="Force download attempt of all models, ignoring which are already installed.")
+    parser.add_argument("--models-path", default=OLLAMA_MODELS_PATH, help="Ollama model store (OLLAMA_MODELS).")
+    parser.add_argument("--catalog", default=CATALOG_FILE, help="TOML model catalog (vendors, models, priorities, tags).")
+    parser.add_argument("--vendor", action="append", help="Only pull models of this vendor (repeatable).")
+    parser.add_argument("--match", action="append", metavar="GLOB", help="Only pull models whose name matches GLOB, e.g. '*q4_K_M' (repeatable).")
+    parser.add_argument("--exclude", action="append", metavar="GLOB", help="Skip models whose name matches GLOB (repeatable).")
+    parser.add_argument("--tag", action="append", help="Only pull models carrying this catalog tag (repeatable).")
+    parser.add_argument("--plan", action="store_true", help="Resolve manifests and print per-model bytes and estimated times for this run (from past speeds), without downloading.")
     parser.add_argument("--concurrent", action="store_true", default=FLAG_CONCURRENT, help=f"Enable concurrent downloads (up to {CONCURRENT_MAX_DOWN}). Overrides FLAG_CONCURRENT setting.")
     parser.add_argument("--workers", type=int, default=CONCURRENT_MAX_DOWN, help="Set the number of concurrent download workers if --concurrent is used.")
+    parser.add_argument("--adaptive", action="store_true", default=FLAG_ADAPTIVE, help="Adjust concurrency automatically from throughput and disk latency; --workers becomes the ceiling.")
+    parser.add_argument("--min-workers", type=int, default=ADAPTIVE_MIN_WORKERS, help="Lower bound on concurrent pulls for --adaptive.")
+    parser.add_argument("--schedule", choices=scheduling.POLICIES, default=SCHEDULE_POLICY, help="Queue order; sjf/largest/binpack use manifest sizes fetched up front and report the expected makespan.")
+    parser.add_argument("--inflight-cap-gb", type=float, default=INFLIGHT_CAP_GB, help="binpack: cap on remaining GB across running pulls.")
+    parser.add_argument("--assumed-mbps", type=float, default=ASSUMED_MB_PER_SEC, help="Per-pull MB/s assumed when estimating the makespan.")
+    parser.add_argument("--link-mbps", type=float, default=LINK_MB_PER_SEC, help="Aggregate link MB/s shared by all pulls, for the makespan estimate.")
+    parser.add_argument("--disk-reserve-gb", type=float, default=DISK_RESERVE_GB, help="Free space to keep on the model store; pulls that would eat into it are deferred or skipped.")
+    parser.add_argument("--bandwidth", action="append", metavar="RULE", help="Bandwidth budget in MB/s across all pulls: 'MBPS' for the default, '[DAYS@]HH:MM-HH:MM=MBPS' for a window (e.g. 'mon-fri@08:00-19:00=20'), 'unlimited' instead of a rate. Repeatable; the first matching window wins.")
+    parser.add_argument("--no-disk-check", dest="disk_check", action="store_false", default=FLAG_DISK_CHECK, help="Start pulls without checking free space on the model store.")
+    parser.add_argument("--deadline", type=int, default=JOB_DEADLINE_SEC, help="Per-model wall-clock deadline in seconds; the pull is stopped and marked timed_out when exceeded.")
+    parser.add_argument("--min-mbps", type=float, default=MIN_THROUGHPUT_MB_PER_SEC, help="Restart pulls whose throughput over the last minute stays below this many MB/s (0 disables; --engine ollama only).")
+    parser.add_argument("--stall-grace", type=int, default=STALL_GRACE_SEC, help="Seconds into a download before the throughput floor applies (--engine ollama only).")
+    parser.add_argument("--stall-restarts", type=int, default=STALL_RESTARTS, help="Times a stalled pull is restarted before giving up on it (--engine ollama only).")
+    parser.add_argument("--attempts", type=int, default=RETRY_MAX_ATTEMPTS, help="Attempts per model within this run; failed pulls are retried with exponential backoff (1 disables retries).")
+    parser.add_argument("--retry-delay", type=int, default=RETRY_BASE_DELAY_SEC, help="Base backoff in seconds before the first retry.")
+    parser.add_argument("--history-db", default=HISTORY_DB, help="SQLite database holding every run, attempt and sampled layer progress.")
+    parser.add_argument("--stats", metavar="GLOB", help="Print median download speed per model matching GLOB (e.g. 'qwen3:*') from the history database and exit.")
+    parser.add_argument("--stats-days", type=int, default=30, help="Look-back window in days for --stats.")
+    parser.add_argument("--verify", choices=["off", "size", "sha256"], default=VERIFY_MODE, help="Check installed models' layers against their manifests (size, or size + sha256) and re-pull broken ones.")
+    parser.add_argument("--engine", choices=PULL_ENGINES, default=PULL_ENGINE, help="Pull via 'ollama pull' subprocesses, the server's streaming /api/pull, or the built-in registry client with parallel ranged downloads.")
+    parser.add_argument("--ollama-host", default=OLLAMA_HOST, help="Ollama server for --engine api (default: $OLLAMA_HOST or 127.0.0.1:11434).")
+    parser.add_argument("--registry", default=REGISTRY_URL, help="Registry base URL for --engine native (e.g. a local mirror or stand-in registry).")
+    parser.add_argument("--log-compression", choices=pulllog.COMPRESSIONS, default=LOG_COMPRESSION, help="Compression for rotated log segments.")
+    parser.add_argument("--log-max-mb", type=int, default=LOG_MAX_MB, help="Rotate the run log when it reaches this size (0 = never).")
+    parser.add_argument("--connections", type=int, default=NATIVE_CONNECTIONS, help="Parallel range connections per blob for --engine native.")
+    parser.add_argument("--coordinate", metavar="DIR", default=COORDINATION_DIR, help="Shared directory through which hosts pulling the same catalog claim models; layers a peer already has are copied over the LAN (needs --engine native).")
+    parser.add_argument("--host-id", default=HOST_ID, help="This host's name in the --coordinate directory.")
+    parser.add_argument("--share-port", type=int, default=SHARE_PORT, help="Port this host serves its blobs to peers on with --coordinate (0 = any free port).")
+    parser.add_argument("--share-url", default=SHARE_URL, help="URL peers use to reach this host's blob server (default http://<fqdn>:<share-port>).")
+    parser.add_argument("--share-linger-min", type=float, default=SHARE_LINGER_MIN, help="With --coordinate, keep serving blobs for up to this many minutes after this host is done while peers are still pulling.")
 
     args = parser.parse_args()
 
-    run_concurrent_flag = args.concurrent
+    run_concurrent_flag = args.concurrent or args.adaptive
     if run_concurrent_flag:
        CONCURRENT_MAX_DOWN = args.workers
-
-    main(force_all=args.force, run_concurrent=run_concurrent_flag)
\ No newline at end of file
+    ADAPTIVE_MIN_WORKERS = args.min_workers
+    INFLIGHT_CAP_GB = args.inflight_cap_gb
+    ASSUMED_MB_PER_SEC = args.assumed_mbps
+    LINK_MB_PER_SEC = args.link_mbps
+    CATALOG_FILE = args.catalog
+    DISK_RESERVE_GB = args.disk_reserve_gb
+    if args.bandwidth:
+        BANDWIDTH_RULES = args.bandwidth
+    try:
+        BandwidthSchedule.parse(BANDWIDTH_RULES)
+    except ValueError as e:
+        parser.error(str(e))
+    if BANDWIDTH_RULES and args.engine != "native":
+        parser.error("--bandwidth needs --engine native: the other engines download inside the Ollama server, "
+                     "where running transfers can't be slowed down")
+    REGISTRY_URL = args.registry
+    if args.models_path != OLLAMA_MODELS_PATH:
+        OLLAMA_MODELS_PATH = args.models_path
+        os.environ['OLLAMA_MODELS'] = OLLAMA_MODELS_PATH
+        DIGEST_CACHE_FILE = default_cache_path(OLLAMA_MODELS_PATH)
+    watchdog_flags = [flag for flag, value, default in (
+        ("--min-mbps", args.min_mbps, MIN_THROUGHPUT_MB_PER_SEC), ("--stall-grace", args.stall_grace, STALL_GRACE_SEC),
+        ("--stall-restarts", args.stall_restarts, STALL_RESTARTS)) if value != default]
+    if watchdog_flags and args.engine != "ollama":
+        parser.error(f"{', '.join(watchdog_flags)} tune the watchdog of 'ollama pull' output and need --engine ollama; "
+                     "the native and api engines rely on their connections' timeouts")
+    if args.coordinate and args.engine != "native":
+        parser.error("--coordinate copies blobs between stores itself and needs --engine native")
+    COORDINATION_DIR = args.coordinate
+    HOST_ID = args.host_id
+    SHARE_PORT = args.share_port
+    SHARE_URL = args.share_url
+    SHARE_LINGER_MIN = args.share_linger_min
+    OLLAMA_HOST = args.ollama_host
+    NATIVE_CONNECTIONS = args.connections
+    JOB_DEADLINE_SEC = args.deadline
+    MIN_THROUGHPUT_MB_PER_SEC = args.min_mbps
+    STALL_GRACE_SEC = args.stall_grace
+    STALL_RESTARTS = args.stall_restarts
+    RETRY_MAX_ATTEMPTS = args.attempts
+    RETRY_BASE_DELAY_SEC = args.retry_delay
+    HISTORY_DB = args.history_db
+
+    if args.stats:
+        history = RunHistory(HISTORY_DB)
+        stats = history.throughput(args.stats, args.stats_days)
+        history.close()
+        print(f"Median download speed over the last {args.stats_days} days ({args.stats}):")
+        for model, row in stats.items():
+            print(f"  {model:<45} {row['median_mb_per_sec']:>8} MB/s  ({row['attempts']} pulls)")
+        if not stats:
+            print("  No successful downloads recorded.")
+        sys.exit(0)
+    # The log is opened at import time so early messages are captured; apply log options to it now
+    log_file.compression = args.log_compression
+    log_file.max_bytes = args.log_max_mb * 1024 * 1024
+    if args.log_compression == "zstd" and not pulllog.zstandard:
+        log("⚠️ 'zstandard' is not installed; rotated logs will be gzip-compressed instead.")
+
+    main(force_all=args.force, run_concurrent=run_concurrent_flag, engine=args.engine, adaptive=args.adaptive,
+         schedule=args.schedule, verify_mode=args.verify, disk_check=args.disk_check,
+         selectors={"vendors": args.vendor, "match": args.match, "exclude": args.exclude, "tags": args.tag},
+         plan_only=args.plan)
\ No newline at end of file
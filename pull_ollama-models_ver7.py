@@ -10,6 +10,9 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 import argparse
 
+from ollama_downloader import verify
+from ollama_downloader.digestcache import DigestCache, default_cache_path
+
 # ─── CONFIGURATION ─────────────────────────────────────────────
 # NOTE: Ensure this path is correct for your system
 OLLAMA_MODELS_PATH = '/data/wdblue8tb/ollama'
@@ -43,6 +46,8 @@ SUSPICIOUS_LOG = "skipped_but_suspicious.log" # Changed extension to .log
 FLAG_CONCURRENT = False # Set to True to enable concurrent downloads
 CONCURRENT_MAX_DOWN = 2 # Max concurrent downloads if FLAG_CONCURRENT is True
 DELAY_BETWEEN_DOWNLOADS_SEC = 5 # Delay only used when FLAG_CONCURRENT is False
+FLAG_VERIFY_SHA256 = False # Re-hash every layer when checking existing models (slow; uses all cores)
+digest_cache = None # Loaded on first use; blobs unchanged since their last hash are not re-read
 
 # ─── MODEL LIST BY VENDOR ─────────────────────────────────────
 model_groups = {
@@ -159,82 +164,32 @@ def clean_model_name_for_path(name):
     name = re.sub(r'[-]+', '-', name)
     return name.strip('-_')
 
-def get_model_manifest_path(model_name):
-    """Constructs the expected manifest directory path for a given model."""
-    # Ollama typically stores manifests under library/<model_base_name>/<tag>
-    # Example: llama3:8b -> library/llama3/8b
-    # Example: phi4-mini:3.8b-q8_0 -> library/phi4-mini/3.8b-q8_0
-    parts = model_name.split(':', 1)
-    base_name = parts[0]
-    tag = parts[1] if len(parts) > 1 else 'latest' # Default tag is 'latest'
-
-    # Clean the base name and tag for path construction if necessary,
-    # but Ollama might use the raw names directly in the path.
-    # Let's assume Ollama handles potentially problematic characters.
-    # We only need this for checking existence.
-    manifest_dir = os.path.join(
-        OLLAMA_MODELS_PATH,
-        "manifests",
-        "registry.ollama.ai",
-        "library",
-        base_name,
-        tag # Check for the specific tag directory
-    )
-    return manifest_dir
-
+# Manifest paths (incl. non-library namespaces and tag files) come from ollama_downloader/store.py
 
 def is_model_download_complete(model_name):
-    """Checks if a model's manifest exists and associated blobs seem present."""
-    manifest_dir = get_model_manifest_path(model_name)
-
-    if not os.path.isdir(manifest_dir):
-        # log(f"Debug: Manifest dir not found for {model_name} at {manifest_dir}")
-        return False
-
-    # Check if the main manifest file exists within the tag directory
-    # Ollama manifest files often don't have an extension or might be named like the tag
-    # Let's just check if the directory is non-empty for simplicity,
-    # A more robust check would involve parsing the manifest content.
-    if not os.listdir(manifest_dir):
-         # log(f"Debug: Manifest dir is empty for {model_name} at {manifest_dir}")
-        return False
-
-    # Simple blob check: Look for *any* large file in the main blobs directory.
-    # This is a heuristic and not foolproof. A better check would involve
-    # reading the manifest, finding the required blob shas, and checking
-    # if those specific blobs exist.
-    blobs_dir = os.path.join(OLLAMA_MODELS_PATH, "blobs")
-    if not os.path.isdir(blobs_dir):
-        # This would be unusual if manifests exist, but check anyway
-        log_suspicious(f"⚠️ Suspicious: Manifest dir exists for {model_name} but blobs directory '{blobs_dir}' is missing.")
-        return False
-
+    """
+    Checks that the model's manifest exists and every layer it references is
+    in blobs/ with the exact size recorded in the manifest (and, with
+    FLAG_VERIFY_SHA256, that each blob hashes to its digest).
+    """
+    global digest_cache
+    if FLAG_VERIFY_SHA256 and digest_cache is None:
+        digest_cache = DigestCache.load(default_cache_path(OLLAMA_MODELS_PATH))
+    result = verify.verify_model(OLLAMA_MODELS_PATH, model_name, hash_blobs=FLAG_VERIFY_SHA256, cache=digest_cache)
+    if result["ok"]:
+        return True
+    if not result["manifest_missing"]:
+        log_suspicious(f"⚠️ Suspicious: Manifest exists for {model_name}, but {verify.describe(result)}.")
+    return False
+
+def save_digest_cache():
+    """Writes the digest cache once the status checks are done, rather than after every model."""
+    if digest_cache is None:
+        return
     try:
-        # Check if there's at least one reasonably sized blob file
-        # Adjust the size threshold as needed (e.g., 10MB)
-        min_blob_size = 10 * 1024 * 1024
-        found_large_blob = False
-        for entry in os.scandir(blobs_dir):
-             # Blobs are typically named like 'sha256-...'
-             if entry.is_file() and entry.name.startswith('sha256-'):
-                try:
-                    if entry.stat().st_size >= min_blob_size:
-                        found_large_blob = True
-                        break
-                except OSError:
-                    # File might be temporarily unavailable or removed
-                    continue
-        if not found_large_blob:
-             log_suspicious(f"⚠️ Suspicious: Manifest exists for {model_name}, but no large blobs found in {blobs_dir}.")
-             return False # Treat as incomplete if no significant blobs are found
-
+        digest_cache.save()
     except OSError as e:
-        log_suspicious(f"⚠️ Error accessing blobs directory {blobs_dir} for {model_name}: {e}")
-        return False # Cannot verify blobs, assume incomplete
-
-    # If manifest dir exists, is not empty, and at least one large blob exists,
-    # assume it's likely complete enough to skip.
-    return True
+        log(f"⚠️ Could not save digest cache: {e}")
 
 # ─── MODEL DOWNLOAD ────────────────────────────────────────────
 def download_model(model_name, metadata_dict, current_index, total):
@@ -420,29 +375,35 @@ def main(force_all=False, run_concurrent=FLAG_CONCURRENT):
         pending = []
 
         log("🔍 Checking model status...")
-        for v, m in tqdm(all_models_flat, desc="Checking models"):
-            attempted_this_run.add(m) # Track all models we intend to process
-            if m in done_previously and not force_all:
-                log(f"⏩ '{m}' found in checkpoint — skipping.")
-                continue # Skip adding to pending list
-            elif is_model_download_complete(m) and not force_all:
-                log(f"⏩ '{m}' appears complete (manifest/blobs found) — skipping.")
-                done_previously.add(m) # Add to checkpoint if found complete but not in checkpoint yet
-                continue
-            else:
-                if force_all:
-                   log(f"➕ Queuing '{m}' for download (forced).")
-                elif m not in done_previously:
-                    log(f"➕ Queuing '{m}' for download (not in checkpoint).")
-                else: # This case should ideally not be hit if is_model_download_complete was True
-                    log(f"➕ Queuing '{m}' for download (in checkpoint but check failed or forced).")
-                pending.append((v, m))
+        try:
+            for v, m in tqdm(all_models_flat, desc="Checking models"):
+                attempted_this_run.add(m) # Track all models we intend to process
+                if m in done_previously and not force_all:
+                    log(f"⏩ '{m}' found in checkpoint — skipping.")
+                    continue # Skip adding to pending list
+                elif is_model_download_complete(m) and not force_all:
+                    log(f"⏩ '{m}' appears complete (manifest/blobs found) — skipping.")
+                    done_previously.add(m) # Add to checkpoint if found complete but not in checkpoint yet
+                    continue
+                else:
+                    if force_all:
+                       log(f"➕ Queuing '{m}' for download (forced).")
+                    elif m not in done_previously:
+                        log(f"➕ Queuing '{m}' for download (not in checkpoint).")
+                    else: # This case should ideally not be hit if is_model_download_complete was True
+                        log(f"➕ Queuing '{m}' for download (in checkpoint but check failed or forced).")
+                    pending.append((v, m))
+        finally:
+            save_digest_cache()
 
         # Save checkpoint immediately after checks, in case is_model_download_complete added models
         save_checkpoint(done_previously)
 
         total_to_download = len(pending)
         log(f"\n✅ Models previously completed: {len(done_previously)}")
+        if digest_cache is not None:
+            log(f"🔎 Digest cache: {digest_cache.hits} hits, {digest_cache.misses} misses "
+                f"({digest_cache.bytes_hashed / 1024 ** 3:.2f} GB hashed).")
         log(f"📦 Models queued for download in this run: {total_to_download}\n")
 
         if not pending:
@@ -528,11 +489,13 @@ if __name__ == "__main__":
     parser.add_argument("--force", action="store_true", help="Force redownload attempt of all models, ignoring checkpoints and existing manifests/blobs.")
     parser.add_argument("--concurrent", action="store_true", default=FLAG_CONCURRENT, help=f"Enable concurrent downloads (up to {CONCURRENT_MAX_DOWN}). Overrides FLAG_CONCURRENT setting.")
     parser.add_argument("--workers", type=int, default=CONCURRENT_MAX_DOWN, help="Set the number of concurrent download workers if --concurrent is used.")
+    parser.add_argument("--verify-sha256", action="store_true", default=FLAG_VERIFY_SHA256, help="Re-hash every layer of existing models before skipping them.")
 
     args = parser.parse_args()
 
     # Update config based on args
     run_concurrent_flag = args.concurrent
+    FLAG_VERIFY_SHA256 = args.verify_sha256
     if run_concurrent_flag:
        CONCURRENT_MAX_DOWN = args.workers # Allow overriding max workers via CLI
 
@@ -1,15 +1,16 @@
-import subprocess
 import re
-import os
+import sys
+
+from ollama_downloader import inventory, store
+from ollama_downloader.ollama_api import OllamaClient, OllamaAPIError
 
 def get_ollama_models():
-    """Retrieve the list of models from Ollama."""
-    result = subprocess.run(['ollama', 'list'], capture_output=True, text=True)
-    models = []
-    for line in result.stdout.splitlines():
-        if line.strip() and not line.startswith('NAME'):
-            models.append(line.split()[0])
-    return models
+    """
+    Retrieve the installed model names from the server (GET /api/tags). The
+    aliases are created through it, so its store is the one that counts,
+    whatever OLLAMA_MODELS says in this shell.
+    """
+    return [m.name for m in inventory.api_models()]
 
 def generate_os_friendly_name(model_name):
     """Generate an OS-friendly name from the original model name."""
@@ -22,28 +23,34 @@ def generate_os_friendly_name(model_name):
     # Convert to lowercase
     return name.lower()
 
-def create_model_alias(original_name, alias_name):
-    """Create a new model alias in Ollama."""
-    modelfile_content = f"FROM {original_name}\n"
-    modelfile_path = f"/tmp/{alias_name}.modelfile"
-    with open(modelfile_path, 'w') as f:
-        f.write(modelfile_content)
-    subprocess.run(['ollama', 'create', alias_name, '--file', modelfile_path])
-    os.remove(modelfile_path)
+def create_model_alias(client, original_name, alias_name):
+    """Create a new model alias in Ollama (POST /api/copy; no Modelfile or blob rewrite)."""
+    try:
+        client.copy(original_name, alias_name)
+    except OllamaAPIError as e:
+        print(f"Failed to create alias '{alias_name}': {e}")
 
 def main():
-    models = get_ollama_models()
+    try:
+        models = get_ollama_models()
+    except inventory.InventoryError as e:
+        print(f"Cannot list models from the Ollama server: {e}")
+        return 1
+    existing_models = set(models)
+    client = OllamaClient()
     for model in models:
         alias_name = generate_os_friendly_name(model)
         if alias_name != model:
-            existing_models = get_ollama_models()
-            if alias_name not in existing_models:
+            if store.normalize_model_name(alias_name) not in existing_models:
                 print(f"Creating alias '{alias_name}' for model '{model}'")
-                create_model_alias(model, alias_name)
+                create_model_alias(client, model, alias_name)
+                existing_models.add(store.normalize_model_name(alias_name))
             else:
                 print(f"Alias '{alias_name}' already exists for model '{model}'")
         else:
             print(f"Model '{model}' already has an OS-friendly name")
+    client.close()
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())